@@ -142,6 +142,21 @@ def create_app():
     except Exception as e:
         print("WARN hooks:", e)
 
+    # ----- Schéma : migrations en attente (une fois, au démarrage) -----
+    try:
+        from .schema import migrate_on_startup
+        migrate_on_startup(app)
+    except Exception as e:
+        print("WARN schema:", e)
+
+    # ----- Services de fond des exports (partage, spool, moteurs) -----
+    try:
+        from app_legacy import init_exports, start_rapport_indexer
+        init_exports(app)
+        start_rapport_indexer()  # rapports sans index de recherche (migration, restauration)
+    except Exception as e:
+        print("WARN exports:", e)
+
     # ----- Blueprints (imports ICI, pas en top-level) -----
     try:
         from .routes.health import bp as health_bp
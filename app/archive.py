@@ -0,0 +1,281 @@
+# app/archive.py — archivage / restauration d'une année scolaire
+# =============================================================================
+# Un bundle = une archive .tar.gz contenant :
+#   manifest.json              -> année, date, tables (colonnes, nb lignes), photos
+#   data/<table>.jsonl         -> une ligne JSON (row_to_json) par enregistrement
+#   photos/<fichier>           -> photos d'élèves référencées (eleves.photo_filename)
+#
+# Usage :
+#   python -m app.archive archive 2023-2024 [-o bundle.tar.gz] [--purge]
+#   python -m app.archive restore bundle.tar.gz
+#
+# - archive : lecture via curseurs serveur (mémoire constante), écriture en flux
+#   dans l'archive ; --purge supprime ensuite l'année des tables vives (même
+#   transaction que la lecture, donc rien n'est perdu si l'écriture échoue).
+# - restore : relit l'archive en flux et réinjecte chaque table avec COPY.
+# =============================================================================
+import os
+import io
+import sys
+import json
+import tarfile
+import argparse
+import tempfile
+from datetime import datetime
+
+BUNDLE_VERSION = 1
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHOTO_DIRS = [
+    os.path.join(BASE_DIR, "static", "photos"),
+    os.path.join(BASE_DIR, "app", "static", "photos"),
+]
+
+# Sous-requêtes réutilisées (paramètre %(c)s = liste des classe_id de l'année)
+_EVALS   = "SELECT id FROM evaluations WHERE classe_id = ANY(%(c)s)"
+_ELEVES  = "SELECT id FROM eleves WHERE classe_id = ANY(%(c)s)"
+_NIVEAUX = "SELECT id FROM classes_niveaux WHERE classe_id = ANY(%(c)s)"
+_DICTEES = f"SELECT id FROM dictees WHERE niveau_id IN ({_NIVEAUX})"
+_PLANS   = "SELECT id FROM seating_plans WHERE classe_id = ANY(%(c)s)"
+
+# Ordre parent -> enfant (restauration dans cet ordre, purge en sens inverse)
+ARCHIVE_TABLES = [
+    ("classes",             "id = ANY(%(c)s)"),
+    ("classes_niveaux",     "classe_id = ANY(%(c)s)"),
+    ("eleves",              "classe_id = ANY(%(c)s)"),
+    ("groupes_eleves",      f"eleve_id IN ({_ELEVES})"),
+    ("evaluations",         "classe_id = ANY(%(c)s)"),
+    ("evaluations_niveaux", f"evaluation_id IN ({_EVALS})"),
+    ("objectifs",           f"evaluation_id IN ({_EVALS})"),
+    ("resultats",           f"evaluation_id IN ({_EVALS})"),
+    ("absences",            f"evaluation_id IN ({_EVALS})"),
+    ("dictees",             f"niveau_id IN ({_NIVEAUX})"),
+    ("dictee_resultats",    f"dictee_id IN ({_DICTEES})"),
+    ("rapports",            "classe_id = ANY(%(c)s)"),
+    ("rapport_revisions",   "rapport_id IN (SELECT id FROM rapports WHERE classe_id = ANY(%(c)s))"),
+    ("seating_plans",       "classe_id = ANY(%(c)s)"),
+    ("seats",               f"plan_id IN ({_PLANS})"),
+    ("furniture_items",     f"plan_id IN ({_PLANS})"),
+    ("seating_positions",   f"plan_id IN ({_PLANS})"),
+    ("seating_plan_walls",  f"plan_id IN ({_PLANS})"),
+    ("seating_plan_history", f"plan_id IN ({_PLANS})"),
+    ("seating_tombstones",  f"plan_id IN ({_PLANS})"),
+]
+
+
+def _table_exists(cur, table: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{table}",))
+    return bool(cur.fetchone()[0])
+
+
+def _find_photo(filename: str):
+    for d in PHOTO_DIRS:
+        p = os.path.join(d, filename)
+        if os.path.isfile(p):
+            return p
+    return None
+
+
+# ===== Archive =====
+def archive_year(conn, annee: str, out_path: str, purge: bool = False) -> dict:
+    """
+    Écrit l'année `annee` dans `out_path` (.tar.gz). Retourne le manifest.
+    Avec purge=True, supprime l'année des tables vives après écriture complète.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM classes WHERE annee = %s ORDER BY id", (annee,))
+        classe_ids = [r[0] for r in cur.fetchall()]
+    if not classe_ids:
+        raise ValueError(f"Aucune classe pour l'année {annee}")
+    params = {"c": classe_ids}
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "annee": annee,
+        "classe_ids": classe_ids,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": [],
+        "photos": [],
+    }
+    present = []
+
+    with tarfile.open(out_path, mode="w:gz") as tar:
+        for table, where in ARCHIVE_TABLES:
+            with conn.cursor() as cur:
+                if not _table_exists(cur, table):
+                    continue
+            present.append((table, where))
+
+            columns, count = None, 0
+            with tempfile.TemporaryFile(mode="w+b") as tmp:
+                with conn.cursor(name=f"archive_{table}") as cur:
+                    cur.itersize = 2000
+                    cur.execute(f"SELECT row_to_json(t)::text FROM (SELECT * FROM {table} WHERE {where}) t", params)
+                    for (line,) in cur:
+                        if columns is None:
+                            columns = list(json.loads(line).keys())
+                        tmp.write(line.encode("utf-8") + b"\n")
+                        count += 1
+                info = tarfile.TarInfo(f"data/{table}.jsonl")
+                info.size = tmp.tell()
+                info.mtime = int(datetime.now().timestamp())
+                tmp.seek(0)
+                tar.addfile(info, tmp)
+            manifest["tables"].append({"name": table, "columns": columns or [], "rows": count})
+
+        # Photos référencées
+        with conn.cursor(name="archive_photos") as cur:
+            cur.execute(
+                "SELECT DISTINCT photo_filename FROM eleves "
+                "WHERE classe_id = ANY(%(c)s) AND COALESCE(photo_filename, '') <> ''",
+                params
+            )
+            for (fname,) in cur:
+                src = _find_photo(fname)
+                if src:
+                    tar.add(src, arcname=f"photos/{fname}")
+                    manifest["photos"].append(fname)
+
+        raw = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+        info = tarfile.TarInfo("manifest.json")
+        info.size = len(raw)
+        info.mtime = int(datetime.now().timestamp())
+        tar.addfile(info, io.BytesIO(raw))
+
+    if purge:
+        with conn.cursor() as cur:
+            for table, where in reversed(present):
+                cur.execute(f"DELETE FROM {table} WHERE {where}", params)
+        manifest["purged"] = True
+    conn.commit()
+    return manifest
+
+
+# ===== Restore =====
+def _copy_text(v) -> str:
+    """Valeur JSON -> champ COPY (format texte)."""
+    if v is None:
+        return r"\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v, ensure_ascii=False)
+    s = str(v)
+    return (s.replace("\\", "\\\\").replace("\t", "\\t")
+             .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class _JsonlCopyReader:
+    """Adapte un flux JSONL en flux COPY (texte) lu à la demande par psycopg2."""
+
+    def __init__(self, fileobj, columns):
+        self._lines = io.TextIOWrapper(fileobj, encoding="utf-8")
+        self._columns = columns
+        self._buf = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            line = self._lines.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            self._buf += "\t".join(_copy_text(row.get(c)) for c in self._columns) + "\n"
+        if size < 0:
+            out, self._buf = self._buf, ""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    readline = read
+
+
+def restore_bundle(conn, path: str, photos_dir: str | None = None) -> dict:
+    """
+    Réinjecte un bundle (COPY table par table, une seule transaction),
+    puis recale les séquences et restaure les photos manquantes.
+    """
+    photos_dir = photos_dir or PHOTO_DIRS[0]
+    with tarfile.open(path, mode="r:gz") as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))
+        if manifest.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"Version de bundle non supportée : {manifest.get('version')}")
+
+        try:
+            with conn.cursor() as cur:
+                for t in manifest["tables"]:
+                    if not t["rows"]:
+                        continue
+                    cols = t["columns"]
+                    reader = _JsonlCopyReader(tar.extractfile(f"data/{t['name']}.jsonl"), cols)
+                    cur.copy_expert(
+                        f"COPY {t['name']} ({', '.join(cols)}) FROM STDIN",
+                        reader
+                    )
+                    if "id" in cols:
+                        cur.execute(
+                            "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                            f"(SELECT COALESCE(MAX(id), 1) FROM {t['name']})) "
+                            "WHERE pg_get_serial_sequence(%s, 'id') IS NOT NULL",
+                            (t["name"], t["name"])
+                        )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        os.makedirs(photos_dir, exist_ok=True)
+        for fname in manifest.get("photos", []):
+            dst = os.path.join(photos_dir, os.path.basename(fname))
+            if os.path.exists(dst):
+                continue
+            src = tar.extractfile(f"photos/{fname}")
+            if src is None:
+                continue
+            with open(dst, "wb") as f:
+                while True:
+                    chunk = src.read(64 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+    return manifest
+
+
+# ===== CLI =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.archive", description=__doc__)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    pa = sub.add_parser("archive", help="archiver une année scolaire")
+    pa.add_argument("annee", help="valeur de classes.annee, ex. 2023-2024")
+    pa.add_argument("-o", "--output", help="fichier .tar.gz (défaut: archive_<annee>.tar.gz)")
+    pa.add_argument("--purge", action="store_true", help="supprimer l'année des tables vives")
+
+    pr = sub.add_parser("restore", help="restaurer un bundle")
+    pr.add_argument("bundle")
+
+    args = parser.parse_args(argv)
+
+    from app.utils import get_db_connection
+    conn = get_db_connection()
+    try:
+        if args.cmd == "archive":
+            out = args.output or f"archive_{args.annee}.tar.gz"
+            m = archive_year(conn, args.annee, out, purge=args.purge)
+            total = sum(t["rows"] for t in m["tables"])
+            print(f"✅ {args.annee} -> {out} ({total} lignes, {len(m['photos'])} photos"
+                  f"{', purgé' if args.purge else ''})")
+        else:
+            m = restore_bundle(conn, args.bundle)
+            total = sum(t["rows"] for t in m["tables"])
+            print(f"✅ {m['annee']} restaurée depuis {args.bundle} ({total} lignes)")
+    except Exception as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
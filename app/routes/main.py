@@ -18,6 +18,7 @@ from app.utils import (
     get_ui_settings_from_db,
     set_ui_settings_in_db,
 )
+from app.seating.mview import notify_moyennes_dirty
 # --- Notes & helpers pour la fiche élève ---
 SCORE_MAP = {'NA': 0, 'PA': 2, 'A': 4}   # '---' est ignoré
 
@@ -1070,6 +1071,7 @@ def supprimer_evaluation(evaluation_id):
         cur.execute("DELETE FROM objectifs WHERE evaluation_id = %s", (evaluation_id,))
         cur.execute("DELETE FROM evaluations_niveaux WHERE evaluation_id = %s", (evaluation_id,))
         cur.execute("DELETE FROM evaluations WHERE id = %s", (evaluation_id,))
+        notify_moyennes_dirty(cur)
         conn.commit()
         flash("Évaluation et résultats supprimés avec succès.")
     except Exception as e:
@@ -1084,70 +1086,158 @@ def supprimer_evaluation(evaluation_id):
     return redirect(url_for('main.index'))
 
 # ---------- Import CSV élèves ----------
+# mapping CSV -> DB (l'ordre fixe aussi celui du hash de contenu)
+CSV_ELEVES_MAPPING = {
+    "Nom élève": "nom",
+    "Prénom élève": "prenom",
+    "Niveau": "niveau",
+    "Cycle": "cycle",
+    "Regroupement": "regroupement",
+    "Classe": "classe",
+    "Date inscription": "date_inscription",
+    "Nom d'usage": "nom_usage",
+    "Deuxième prénom": "deuxieme_prenom",
+    "Troisième prénom": "troisieme_prenom",
+    "Date naissance": "date_naissance",
+    "Commune naissance": "commune_naissance",
+    "Dépt naissance": "dept_naissance",
+    "Pays naissance": "pays_naissance",
+    "Sexe": "sexe",
+    "Adresse": "adresse",
+    "CP": "cp",
+    "Commune": "commune",
+    "Pays": "pays",
+    "Etat": "etat"
+}
+CSV_ELEVES_DATE_COLS = {"date_inscription", "date_naissance"}
+
+
+def _csv_eleve_values(row) -> dict:
+    """Ligne CSV -> {colonne_db: valeur normalisée | None} (dates en ISO)."""
+    values = {}
+    for csv_col, db_col in CSV_ELEVES_MAPPING.items():
+        val = (row.get(csv_col) or "").strip()
+        if val and db_col in CSV_ELEVES_DATE_COLS:
+            d = _to_date(val)
+            val = d.isoformat() if d else val
+        values[db_col] = val if val != "" else None
+    return values
+
+
+def _eleve_import_hash(values: dict) -> str:
+    """Hash stable des colonnes mappées (détecte les lignes inchangées)."""
+    import hashlib
+    payload = "\x1f".join(values.get(c) or "" for c in CSV_ELEVES_MAPPING.values())
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _eleve_import_key(nom, prenom, date_naissance) -> tuple:
+    """Clé d'appariement fichier <-> base : NOM, prénom, date de naissance."""
+    return ((nom or "").strip().upper(), (prenom or "").strip().upper(), (date_naissance or "").strip())
+
+
 @bp.route("/importer_eleve_csv/<int:classe_id>", methods=["POST"])
 def importer_eleve_csv(classe_id):
-    """Import CSV élèves (Windows-1252 ; séparateur ';'). Initialise groupe G3."""
+    """
+    Import CSV élèves (Windows-1252 ; séparateur ';'). Incrémental :
+      - élève inconnu        -> INSERT + groupe G3
+      - hash identique       -> ignoré (aucune écriture)
+      - hash différent       -> UPDATE des seuls champs modifiés
+      - absent du fichier    -> marqué import_absent (jamais supprimé)
+    """
     if "csv_file" not in request.files or request.files["csv_file"].filename == "":
         flash("Aucun fichier sélectionné.")
         return redirect(url_for("main.page_classe", classe_id=classe_id))
 
+    conn = cur = None
     try:
         stream = io.StringIO(request.files["csv_file"].stream.read().decode("windows-1252"), newline=None)
         reader = csv.DictReader(stream, delimiter=";")
 
-        conn = get_db_connection(); cur = conn.cursor()
+        # colonnes import_hash / import_absent : migration app.schema
+        conn = get_db_connection(); cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        # mapping CSV -> DB
-        mapping = {
-            "Nom élève": "nom",
-            "Prénom élève": "prenom",
-            "Niveau": "niveau",
-            "Cycle": "cycle",
-            "Regroupement": "regroupement",
-            "Classe": "classe",
-            "Date inscription": "date_inscription",
-            "Nom d'usage": "nom_usage",
-            "Deuxième prénom": "deuxieme_prenom",
-            "Troisième prénom": "troisieme_prenom",
-            "Date naissance": "date_naissance",
-            "Commune naissance": "commune_naissance",
-            "Dépt naissance": "dept_naissance",
-            "Pays naissance": "pays_naissance",
-            "Sexe": "sexe",
-            "Adresse": "adresse",
-            "CP": "cp",
-            "Commune": "commune",
-            "Pays": "pays",
-            "Etat": "etat"
-        }
+        db_cols = list(CSV_ELEVES_MAPPING.values())
+
+        # Élèves déjà en base pour cette classe (valeurs texte pour comparer au CSV)
+        cur.execute(
+            "SELECT id, import_hash, import_absent, "
+            + ", ".join(f"{c}::text AS {c}" for c in db_cols)
+            + " FROM eleves WHERE classe_id = %s",
+            (classe_id,)
+        )
+        existants = {}
+        for r in cur.fetchall():
+            existants.setdefault(_eleve_import_key(r["nom"], r["prenom"], r["date_naissance"]), r)
+
+        vus = set()
+        nb_ajoutes = nb_maj = nb_inchanges = 0
 
         for row in reader:
-            colonnes = []; valeurs = []
-            for csv_col, db_col in mapping.items():
-                val = (row.get(csv_col) or "").strip()
-                colonnes.append(db_col)
-                valeurs.append(val if val != "" else None)
-
-            # Ajout classe_id
-            colonnes.append("classe_id"); valeurs.append(classe_id)
-
-            sql = f"""
-                INSERT INTO eleves ({', '.join(colonnes)})
-                VALUES ({', '.join(['%s'] * len(valeurs))})
-                RETURNING id
-            """
-            cur.execute(sql, valeurs)
-            eleve_id = cur.fetchone()[0]
+            values = _csv_eleve_values(row)
+            h = _eleve_import_hash(values)
+            key = _eleve_import_key(values["nom"], values["prenom"], values["date_naissance"])
+            ex = existants.get(key)
+
+            if ex is None:
+                colonnes = db_cols + ["classe_id", "import_hash"]
+                valeurs = [values[c] for c in db_cols] + [classe_id, h]
+                cur.execute(f"""
+                    INSERT INTO eleves ({', '.join(colonnes)})
+                    VALUES ({', '.join(['%s'] * len(valeurs))})
+                    RETURNING id
+                """, valeurs)
+                eleve_id = cur.fetchone()["id"]
+
+                # Groupe G3 par défaut
+                cur.execute("""
+                    INSERT INTO groupes_eleves (eleve_id, groupe, date_changement)
+                    VALUES (%s, %s, %s)
+                """, (eleve_id, 'G3', datetime.now().date()))
+                existants[key] = {"id": eleve_id}
+                vus.add(eleve_id)
+                nb_ajoutes += 1
+                continue
 
-            # Groupe G3 par défaut
-            cur.execute("""
-                INSERT INTO groupes_eleves (eleve_id, groupe, date_changement)
-                VALUES (%s, %s, %s)
-            """, (eleve_id, 'G3', datetime.now().date()))
+            if ex["id"] in vus:
+                continue  # doublon dans le fichier
+            vus.add(ex["id"])
+
+            if ex.get("import_hash") == h:
+                nb_inchanges += 1
+                continue
+
+            # Seuls les champs réellement différents sont réécrits
+            changes = {c: values[c] for c in db_cols if (ex.get(c) or None) != values[c]}
+            sets = [f"{c} = %s" for c in changes] + ["import_hash = %s"]
+            cur.execute(
+                f"UPDATE eleves SET {', '.join(sets)} WHERE id = %s",
+                list(changes.values()) + [h, ex["id"]]
+            )
+            if changes:
+                nb_maj += 1
+            else:
+                nb_inchanges += 1  # import antérieur sans hash : on l'enregistre seulement
+
+        # Présents dans le fichier : lever le drapeau s'il était posé
+        revenus = [e["id"] for e in existants.values() if e["id"] in vus and e.get("import_absent")]
+        if revenus:
+            cur.execute("UPDATE eleves SET import_absent = FALSE WHERE id = ANY(%s)", (revenus,))
+
+        # Absents du fichier : signalés, jamais supprimés
+        absents = [e for e in existants.values() if e["id"] not in vus]
+        a_marquer = [e["id"] for e in absents if not e.get("import_absent")]
+        if a_marquer:
+            cur.execute("UPDATE eleves SET import_absent = TRUE WHERE id = ANY(%s)", (a_marquer,))
 
         conn.commit()
-        flash("✅ Importation réussie.")
+        flash(f"✅ Importation réussie : {nb_ajoutes} ajouté(s), {nb_maj} mis à jour, {nb_inchanges} inchangé(s).")
+        if absents:
+            noms = ", ".join(f"{(e.get('prenom') or '').strip()} {(e.get('nom') or '').strip()}".strip() for e in absents)
+            flash(f"⚠️ {len(absents)} élève(s) absent(s) du fichier : {noms}")
     except Exception as e:
+        if conn:
+            conn.rollback()
         flash(f"❌ Erreur lors de l'import : {e}")
         raise e
     finally:
@@ -1820,6 +1910,7 @@ def update_resultat(evaluation_id):
         ON CONFLICT (evaluation_id, eleve_id, objectif_id)
         DO UPDATE SET valeur = EXCLUDED.valeur
     """, (evaluation_id, eleve_id, objectif_id, valeur))
+    notify_moyennes_dirty(cur)
     conn.commit()
     cur.close()
     conn.close()
@@ -1847,6 +1938,7 @@ def update_absence(evaluation_id):
             DELETE FROM absences WHERE evaluation_id=%s AND eleve_id=%s
         """, (evaluation_id, eleve_id))
 
+    notify_moyennes_dirty(cur)
     conn.commit()
     cur.close()
     conn.close()
@@ -1914,6 +2006,7 @@ def saisir_resultats(classe_id: int, evaluation_id: int, niveau: str):
                     ON CONFLICT (evaluation_id, eleve_id) DO NOTHING
                 """, (evaluation_id, el))
 
+        notify_moyennes_dirty(cur)
         conn.commit()
         cur.close(); conn.close()
         return ("", 204)
@@ -2025,6 +2118,7 @@ def api_save_resultat(evaluation_id: int):
             INSERT INTO resultats (evaluation_id, eleve_id, objectif_id, niveau)
             VALUES (%s,%s,%s,%s)
         """, (evaluation_id, eleve_id, objectif_id, valeur))
+        notify_moyennes_dirty(cur)
         conn.commit()
         return jsonify(ok=True)
     except Exception as e:
@@ -2070,6 +2164,7 @@ def api_save_absence(evaluation_id: int):
                 SET niveau = NULL
                 WHERE evaluation_id=%s AND eleve_id=%s AND niveau='---'
             """, (evaluation_id, eleve_id))
+        notify_moyennes_dirty(cur)
         conn.commit()
         return jsonify(ok=True)
     except Exception as e:
@@ -2083,3 +2178,283 @@ def api_save_absence(evaluation_id: int):
     
 
 
+
+
+# ---------- Import d'une grille de résultats (CSV/XLSX) ----------
+VALEURS_RESULTAT = {"NA", "PA", "A", "---"}
+
+
+@bp.post("/api/evaluations/<int:evaluation_id>/import-resultats")
+def api_import_resultats(evaluation_id: int):
+    """
+    Import d'une grille élèves × objectifs (CSV ou XLSX) pour une évaluation.
+
+    Fichier (multipart 'fichier') :
+      - 1re ligne = en-têtes ; colonne élève = 'NOM Prénom', 'Prénom NOM' ou id
+        (ou deux colonnes 'Nom' / 'Prénom', ou une colonne 'id')
+      - autres colonnes = objectifs (texte exact, sans tenir compte des accents,
+        ou '#<id>') ; cellules NA / PA / A / --- (vide = on ne touche pas)
+
+    Form :
+      - commit=1 : applique (sinon simple rapport de validation)
+      - force=1  : applique les cellules valides malgré des erreurs
+
+    Réponse : { ok, applied, upserted, report: {...} }
+    """
+    fichier = request.files.get("fichier")
+    if not fichier or fichier.filename == "":
+        return jsonify(ok=False, error="Aucun fichier fourni"), 400
+    commit = request.form.get("commit") in ("1", "true", "on")
+    force = request.form.get("force") in ("1", "true", "on")
+
+    from app.tabular import iter_rows, norm_cell
+
+    conn = get_db_connection(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT classe_id FROM evaluations WHERE id = %s", (evaluation_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify(ok=False, error="Évaluation introuvable"), 404
+        classe_id = row[0]
+
+        # Référentiels : élèves de la classe, objectifs de l'évaluation
+        cur.execute("SELECT id, nom, prenom FROM eleves WHERE classe_id = %s", (classe_id,))
+        eleves_par_cle = {}
+        for eid, nom, prenom in cur.fetchall():
+            for k in (str(eid), f"{nom} {prenom}", f"{prenom} {nom}"):
+                eleves_par_cle.setdefault(norm_cell(k), eid)
+
+        cur.execute("SELECT id, texte FROM objectifs WHERE evaluation_id = %s", (evaluation_id,))
+        objectifs_par_cle = {}
+        for oid, texte in cur.fetchall():
+            for k in (f"#{oid}", str(oid), texte):
+                objectifs_par_cle.setdefault(norm_cell(k), oid)
+
+        report = {
+            "lignes": 0,
+            "cellules_valides": 0,
+            "eleves_inconnus": [],      # [{ligne, valeur}]
+            "colonnes_inconnues": [],   # [en-tête]
+            "valeurs_invalides": [],    # [{ligne, colonne, valeur}]
+            "doublons": [],             # [{ligne, valeur}]
+        }
+        cells = {}  # (eleve_id, objectif_id) -> niveau
+        vus = {}    # eleve_id -> n° de ligne
+
+        rows = iter_rows(fichier)
+        headers = next(rows, None)
+        if not headers:
+            return jsonify(ok=False, error="Fichier vide"), 400
+        hnorm = [norm_cell(h) for h in headers]
+
+        # Colonnes d'identification de l'élève
+        if "NOM" in hnorm and "PRENOM" in hnorm:
+            id_cols = [hnorm.index("NOM"), hnorm.index("PRENOM")]
+        elif "ID" in hnorm:
+            id_cols = [hnorm.index("ID")]
+        else:
+            id_cols = [0]
+
+        obj_cols = {}
+        for i, h in enumerate(hnorm):
+            if i in id_cols or not h:
+                continue
+            oid = objectifs_par_cle.get(h)
+            if oid is None:
+                report["colonnes_inconnues"].append(headers[i])
+            else:
+                obj_cols[i] = oid
+
+        for n, cols in enumerate(rows, start=2):
+            if not any(cols):
+                continue
+            report["lignes"] += 1
+            ident = " ".join(cols[i] for i in id_cols if i < len(cols)).strip()
+            eleve_id = eleves_par_cle.get(norm_cell(ident))
+            if eleve_id is None:
+                report["eleves_inconnus"].append({"ligne": n, "valeur": ident})
+                continue
+            if eleve_id in vus:
+                report["doublons"].append({"ligne": n, "valeur": ident})
+                continue
+            vus[eleve_id] = n
+
+            for i, oid in obj_cols.items():
+                v = (cols[i] if i < len(cols) else "").strip().upper()
+                if not v:
+                    continue
+                if v not in VALEURS_RESULTAT:
+                    report["valeurs_invalides"].append({"ligne": n, "colonne": headers[i], "valeur": cols[i]})
+                    continue
+                cells[(eleve_id, oid)] = v
+        report["cellules_valides"] = len(cells)
+
+        has_errors = any(report[k] for k in ("eleves_inconnus", "colonnes_inconnues", "valeurs_invalides", "doublons"))
+        if not commit or (has_errors and not force):
+            status = 422 if (commit and has_errors) else 200
+            return jsonify(ok=not has_errors, applied=False, upserted=0, report=report), status
+
+        upserted = 0
+        if cells:
+            # delete + insert ensemblistes (même transaction) : comme les autres
+            # enregistrements de résultats, sans dépendre d'un index unique
+            keys = list(cells)
+            eleve_ids, objectif_ids = [k[0] for k in keys], [k[1] for k in keys]
+            cur.execute("""
+                DELETE FROM resultats r
+                USING unnest(%s::int[], %s::int[]) AS v(eleve_id, objectif_id)
+                WHERE r.evaluation_id = %s AND r.eleve_id = v.eleve_id AND r.objectif_id = v.objectif_id
+            """, (eleve_ids, objectif_ids, evaluation_id))
+            cur.execute("""
+                INSERT INTO resultats (evaluation_id, eleve_id, objectif_id, niveau)
+                SELECT %s, v.eleve_id, v.objectif_id, v.niveau
+                FROM unnest(%s::int[], %s::int[], %s::text[]) AS v(eleve_id, objectif_id, niveau)
+            """, (evaluation_id, eleve_ids, objectif_ids, [cells[k] for k in keys]))
+            upserted = cur.rowcount or 0
+        notify_moyennes_dirty(cur)
+        conn.commit()
+        return jsonify(ok=True, applied=True, upserted=upserted, report=report)
+    except ValueError as e:
+        conn.rollback()
+        return jsonify(ok=False, error=str(e)), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify(ok=False, error=str(e)), 500
+    finally:
+        try: cur.close(); conn.close()
+        except Exception: pass
+
+
+# ---------- Exports en flux (CSV / XLSX) ----------
+# kind -> (titre, en-têtes, SQL) ; le SQL reçoit la liste des classe_id (%s)
+EXPORTS_CLASSE = {
+    "eleves": ("Élèves", [
+        "annee", "eleve_id", "nom", "prenom", "niveau", "sexe", "date_naissance",
+        "cycle", "regroupement", "date_inscription",
+    ], """
+        SELECT c.annee, e.id, e.nom, e.prenom, e.niveau, e.sexe, e.date_naissance,
+               e.cycle, e.regroupement, e.date_inscription
+        FROM eleves e
+        JOIN classes c ON c.id = e.classe_id
+        WHERE e.classe_id = ANY(%s)
+        ORDER BY c.annee, e.nom, e.prenom
+    """),
+    "resultats": ("Résultats", [
+        "annee", "evaluation_id", "evaluation", "date", "matiere", "sous_matiere",
+        "objectif_id", "objectif", "eleve_id", "nom", "prenom", "niveau_eleve", "resultat",
+    ], """
+        SELECT c.annee, ev.id, ev.titre, ev.date, m.nom, sm.nom,
+               o.id, o.texte, e.id, e.nom, e.prenom, e.niveau, r.niveau
+        FROM resultats r
+        JOIN evaluations ev ON ev.id = r.evaluation_id
+        JOIN objectifs   o  ON o.id  = r.objectif_id
+        JOIN eleves      e  ON e.id  = r.eleve_id
+        JOIN classes     c  ON c.id  = ev.classe_id
+        LEFT JOIN matieres      m  ON m.id  = ev.matiere_id
+        LEFT JOIN sous_matieres sm ON sm.id = ev.sous_matiere_id
+        WHERE ev.classe_id = ANY(%s)
+        ORDER BY c.annee, ev.date, ev.id, o.id, e.nom, e.prenom
+    """),
+    "dictees": ("Dictées", [
+        "annee", "dictee_id", "date", "type", "niveau", "eleve_id", "nom", "prenom",
+        "groupe", "erreurs", "nb_mots", "nb_mots_simple", "nb_mots_g1", "nb_mots_g2", "nb_mots_g3",
+    ], """
+        SELECT c.annee, d.id, d.date, d.type, cn.niveau, e.id, e.nom, e.prenom,
+               dr.groupe, dr.erreurs, dr.nb_mots,
+               d.nb_mots_simple, d.nb_mots_g1, d.nb_mots_g2, d.nb_mots_g3
+        FROM dictee_resultats dr
+        JOIN dictees d          ON d.id  = dr.dictee_id
+        JOIN classes_niveaux cn ON cn.id = d.niveau_id
+        JOIN classes c          ON c.id  = cn.classe_id
+        JOIN eleves e           ON e.id  = dr.eleve_id
+        WHERE cn.classe_id = ANY(%s)
+        ORDER BY c.annee, d.date, d.id, e.nom, e.prenom
+    """),
+    "groupes": ("Groupes", [
+        "annee", "eleve_id", "nom", "prenom", "groupe", "date_changement",
+    ], """
+        SELECT c.annee, e.id, e.nom, e.prenom, ge.groupe, ge.date_changement
+        FROM groupes_eleves ge
+        JOIN eleves  e ON e.id = ge.eleve_id
+        JOIN classes c ON c.id = e.classe_id
+        WHERE e.classe_id = ANY(%s)
+        ORDER BY c.annee, e.nom, e.prenom, ge.date_changement
+    """),
+}
+EXPORT_ITERSIZE = 2000
+
+
+def _iter_export_rows(sql, classe_ids, cursor_name):
+    """
+    Itère les lignes via un curseur serveur (nommé) : PostgreSQL les envoie
+    par paquets de EXPORT_ITERSIZE, rien n'est matérialisé côté Python.
+    La connexion vit le temps du générateur.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(name=cursor_name) as cur:
+            cur.itersize = EXPORT_ITERSIZE
+            cur.execute(sql, (classe_ids,))
+            for row in cur:
+                yield row
+        conn.rollback()  # lecture seule : ferme la transaction du curseur
+    finally:
+        conn.close()
+
+
+@bp.get("/export/<string:kind>.<string:fmt>")
+def export_donnees(kind: str, fmt: str):
+    """
+    Export en flux d'un jeu de données (eleves | resultats | dictees | groupes)
+    au format csv ou xlsx.
+    Filtres (répétables) : ?classe_id=…&annee=… ; sans filtre = toutes les classes.
+    """
+    if kind not in EXPORTS_CLASSE:
+        abort(404)
+    if fmt not in ("csv", "xlsx"):
+        abort(404)
+
+    classe_ids = request.args.getlist("classe_id", type=int)
+    annees = request.args.getlist("annee")
+
+    conn = get_db_connection(); cur = conn.cursor()
+    try:
+        if classe_ids or annees:
+            cur.execute(
+                "SELECT id FROM classes WHERE id = ANY(%s) OR annee = ANY(%s) ORDER BY annee",
+                (classe_ids or [0], annees or [""])
+            )
+        else:
+            cur.execute("SELECT id FROM classes ORDER BY annee")
+        classe_ids = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT DISTINCT annee FROM classes WHERE id = ANY(%s) ORDER BY annee", (classe_ids,))
+        suffixe = "_".join(str(r[0]) for r in cur.fetchall()) or "vide"
+    finally:
+        cur.close(); conn.close()
+
+    titre, headers, sql = EXPORTS_CLASSE[kind]
+    rows = _iter_export_rows(sql, classe_ids, f"export_{kind}")
+    filename = f"{kind}_{suffixe}.{fmt}"
+
+    from app.tabular import csv_chunks, xlsx_chunks
+    if fmt == "csv":
+        body, mimetype = csv_chunks(headers, rows), "text/csv; charset=utf-8"
+    else:
+        try:
+            body = xlsx_chunks(headers, rows, title=titre)
+        except ValueError as e:
+            rows.close()
+            return jsonify(ok=False, error=str(e)), 501
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    return current_app.response_class(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@bp.get("/classe/<int:classe_id>/export/<string:kind>.<string:fmt>")
+def export_classe(classe_id: int, kind: str, fmt: str):
+    """Raccourci : export d'une seule classe."""
+    return redirect(url_for("main.export_donnees", kind=kind, fmt=fmt, classe_id=classe_id))
@@ -0,0 +1,229 @@
+# app/schema.py — migrations de schéma
+# =============================================================================
+# Colonnes / tables ajoutées par les évolutions de l'application. Chaque
+# migration est appliquée une seule fois et notée dans schema_migrations :
+# sur une base à jour, aucune instruction DDL n'est exécutée (pas de verrou
+# ACCESS EXCLUSIVE pris par les requêtes, ni même au démarrage).
+#
+# Une migration qui retourne False (objet pas encore créé) n'est pas notée :
+# elle est retentée au passage suivant.
+#
+# Application :
+#   - au démarrage du serveur (create_app(), désactivable avec SCHEMA_MIGRATE=0)
+#   - ou ponctuellement :  python -m app.schema [--list]
+# =============================================================================
+import os
+import sys
+import argparse
+
+
+def _eleves_import_columns(cur):
+    """Suivi des ré-imports CSV d'élèves (hash par ligne, élèves absents du fichier)."""
+    cur.execute("""
+        ALTER TABLE eleves
+            ADD COLUMN IF NOT EXISTS import_hash   TEXT,
+            ADD COLUMN IF NOT EXISTS import_absent BOOLEAN NOT NULL DEFAULT FALSE
+    """)
+
+
+def _seating_sync(cur):
+    """Révisions par plan / ligne et suppressions (app/seating/sync.py)."""
+    cur.execute("ALTER TABLE seating_plans ADD COLUMN IF NOT EXISTS revision BIGINT NOT NULL DEFAULT 0")
+    for table in ("furniture_items", "seating_positions"):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS rev BIGINT NOT NULL DEFAULT 0")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_plan_rev_idx ON {table} (plan_id, rev)")
+    cur.execute("ALTER TABLE seating_positions ADD COLUMN IF NOT EXISTS rotation INTEGER NOT NULL DEFAULT 0")
+    # Attributs de meuble envoyés par l'éditeur (couleur, coins arrondis, rotation au 1/10°)
+    cur.execute("ALTER TABLE furniture_items ADD COLUMN IF NOT EXISTS color TEXT")
+    cur.execute("ALTER TABLE furniture_items ADD COLUMN IF NOT EXISTS radius BOOLEAN NOT NULL DEFAULT FALSE")
+    cur.execute("""
+      SELECT data_type FROM information_schema.columns
+      WHERE table_name='furniture_items' AND column_name='rotation'
+    """)
+    r = cur.fetchone()
+    if r and r[0] in ("smallint", "integer", "bigint"):
+        cur.execute("ALTER TABLE furniture_items ALTER COLUMN rotation TYPE NUMERIC(5,1)")
+    cur.execute("SELECT to_regclass('public.seating_plan_walls') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("ALTER TABLE seating_plan_walls ADD COLUMN IF NOT EXISTS rev BIGINT NOT NULL DEFAULT 0")
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS seating_tombstones (
+        plan_id   INTEGER NOT NULL REFERENCES seating_plans(id) ON DELETE CASCADE,
+        kind      TEXT    NOT NULL,
+        entity_id INTEGER NOT NULL,
+        rev       BIGINT  NOT NULL,
+        PRIMARY KEY (plan_id, kind, entity_id)
+      )
+    """)
+
+
+def _seating_history(cur):
+    """Historique des révisions et copies « copy-on-write » (app/seating/history.py)."""
+    cur.execute("ALTER TABLE seating_plans ADD COLUMN IF NOT EXISTS materialized BOOLEAN NOT NULL DEFAULT TRUE")
+    cur.execute("ALTER TABLE seating_plans ADD COLUMN IF NOT EXISTS branch_of INTEGER")
+    cur.execute("ALTER TABLE seating_plans ADD COLUMN IF NOT EXISTS branch_rev BIGINT")
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS seating_plan_history (
+        plan_id    INTEGER     NOT NULL REFERENCES seating_plans(id) ON DELETE CASCADE,
+        rev        BIGINT      NOT NULL,
+        kind       TEXT        NOT NULL,
+        data       JSONB       NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (plan_id, rev)
+      )
+    """)
+
+
+def _rapport_revisions(cur):
+    """Révision du contenu + historique compressé (autosave différentiel des rapports)."""
+    cur.execute("ALTER TABLE rapports ADD COLUMN IF NOT EXISTS content_rev INTEGER NOT NULL DEFAULT 0")
+    # place libre dans les pages : mises à jour HOT (pas de réécriture des index à chaque autosave)
+    cur.execute("ALTER TABLE rapports SET (fillfactor = 85)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rapport_revisions (
+            rapport_id INTEGER     NOT NULL REFERENCES rapports(id) ON DELETE CASCADE,
+            rev        INTEGER     NOT NULL,
+            kind       TEXT        NOT NULL,
+            data       BYTEA       NOT NULL,
+            size       INTEGER     NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (rapport_id, rev)
+        )
+    """)
+    # déjà compressé par zlib : pas de seconde compression TOAST
+    cur.execute("ALTER TABLE rapport_revisions ALTER COLUMN data SET STORAGE EXTERNAL")
+
+
+def _ts_config(cur) -> str:
+    """fr_unaccent (french + unaccent) si l'extension peut être installée, sinon french."""
+    cur.execute("SAVEPOINT ts_config")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        cur.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = 'fr_unaccent'")
+        if not cur.fetchone():
+            cur.execute("CREATE TEXT SEARCH CONFIGURATION fr_unaccent (COPY = french)")
+            cur.execute("""
+                ALTER TEXT SEARCH CONFIGURATION fr_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem
+            """)
+        cur.execute("RELEASE SAVEPOINT ts_config")
+        return "fr_unaccent"
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT ts_config")
+        print(f"[SCHEMA] unaccent indisponible, recherche sans désaccentuation : {e}")
+        return "french"
+
+
+def _rapport_search(cur):
+    """
+    Recherche plein texte des rapports : texte sans HTML + tsvector (index GIN).
+    La configuration retenue est notée en commentaire de search_tsv (lue par
+    app_legacy) ; les lignes sont indexées ensuite, en tâche de fond.
+    """
+    config = _ts_config(cur)
+    cur.execute("ALTER TABLE rapports ADD COLUMN IF NOT EXISTS contenu_text TEXT")
+    cur.execute("ALTER TABLE rapports ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR")
+    cur.execute(f"COMMENT ON COLUMN rapports.search_tsv IS '{config}'")
+    cur.execute("CREATE INDEX IF NOT EXISTS rapports_search_idx ON rapports USING GIN (search_tsv)")
+    # repère instantanément les lignes restant à indexer (restauration d'archive...)
+    cur.execute("CREATE INDEX IF NOT EXISTS rapports_search_todo_idx ON rapports (id) WHERE search_tsv IS NULL")
+
+
+def _eleve_moyennes_unique(cur):
+    """Index unique exigé par REFRESH MATERIALIZED VIEW CONCURRENTLY (app/seating/mview.py)."""
+    cur.execute("SELECT to_regclass('public.eleve_moyennes_mv') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return False  # vue pas encore créée : reportée au prochain passage
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS eleve_moyennes_mv_eleve_uidx
+        ON eleve_moyennes_mv (eleve_id)
+    """)
+
+
+# Ordre d'application ; ne jamais renommer une entrée déjà livrée
+MIGRATIONS = [
+    ("eleves_import_columns", _eleves_import_columns),
+    ("seating_sync",          _seating_sync),
+    ("seating_history",       _seating_history),
+    ("rapport_revisions",     _rapport_revisions),
+    ("rapport_search",        _rapport_search),
+    ("eleve_moyennes_unique", _eleve_moyennes_unique),
+]
+
+
+def _applied(cur) -> set:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name       TEXT        PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("SELECT name FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def migrate(conn) -> list:
+    """Applique les migrations en attente (une transaction chacune) ; retourne leurs noms."""
+    with conn.cursor() as cur:
+        done = _applied(cur)
+    conn.commit()
+    applied = []
+    for name, fn in MIGRATIONS:
+        if name in done:
+            continue
+        try:
+            with conn.cursor() as cur:
+                if fn(cur) is False:
+                    conn.rollback()
+                    print(f"[SCHEMA] migration reportée : {name}")
+                    continue
+                cur.execute("INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT DO NOTHING", (name,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(name)
+        print(f"[SCHEMA] migration appliquée : {name}")
+    return applied
+
+
+def migrate_on_startup(app):
+    """Migrations en attente, une fois au démarrage (SCHEMA_MIGRATE=0 pour désactiver)."""
+    enabled = app.config.get("SCHEMA_MIGRATE", os.getenv("SCHEMA_MIGRATE", "1"))
+    if str(enabled).lower() in ("0", "false", "no", "off"):
+        return []
+    from app.utils import get_db_connection
+    conn = get_db_connection()
+    try:
+        return migrate(conn)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.schema", description="Migrations de schéma")
+    parser.add_argument("--list", action="store_true", help="afficher l'état sans rien appliquer")
+    args = parser.parse_args(argv)
+
+    from app.utils import get_db_connection
+    conn = get_db_connection()
+    try:
+        if args.list:
+            with conn.cursor() as cur:
+                done = _applied(cur)
+            conn.commit()
+            for name, _fn in MIGRATIONS:
+                print(f"{'✅' if name in done else '⏳'} {name}")
+        else:
+            applied = migrate(conn)
+            print(f"✅ schéma à jour ({len(applied)} migration(s) appliquée(s))")
+    except Exception as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
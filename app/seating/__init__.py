@@ -9,3 +9,24 @@ seating_bp = Blueprint(
 
 # Attache les routes
 from . import routes  # noqa: E402,F401
+
+
+@seating_bp.record_once
+def _start_moyennes_refresher(state):
+    """
+    Lance le rafraîchissement de eleve_moyennes_mv en tâche de fond
+    (désactivable avec MOYENNES_REFRESHER=0, ex. pour les scripts/CLI).
+    """
+    import os
+    app = state.app
+    enabled = app.config.get("MOYENNES_REFRESHER", os.getenv("MOYENNES_REFRESHER", "1"))
+    if str(enabled).lower() in ("0", "false", "no", "off"):
+        return
+
+    from .mview import start_moyennes_refresher
+
+    def factory():
+        with app.app_context():
+            return routes.db_conn()
+
+    start_moyennes_refresher(factory)
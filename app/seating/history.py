@@ -0,0 +1,332 @@
+# history.py
+# =============================================================================
+# Historique des versions d'un plan de classe (snapshots + deltas)
+# - seating_plan_history(plan_id, rev, kind, data) : une ligne par révision
+#     kind = 'snapshot' : état complet (places, meubles, positions, murs)
+#     kind = 'delta'    : uniquement ce que la révision a écrit (lignes rev = R,
+#                         suppressions de seating_tombstones, murs si modifiés)
+#   Un snapshot toutes les SNAPSHOT_EVERY révisions borne la reconstruction :
+#   état(R) = dernier snapshot <= R + deltas suivants jusqu'à R.
+# - Restauration : l'état d'une révision passée redevient l'état courant,
+#   dans une NOUVELLE révision (l'historique n'est jamais réécrit).
+# - Duplication « copy-on-write » : le plan copié ne reçoit qu'un snapshot
+#   (rev 0) ; ses lignes ne sont créées qu'à la première ouverture / écriture
+#   (voir materialize / ensure_materialized).
+#
+# Les places (seats) ne figurent que dans les snapshots : elles ne sont pas
+# éditées révision par révision et une restauration ne les modifie pas.
+# =============================================================================
+from psycopg2.extras import Json
+
+from .payload import FURNITURE_JSON, POSITION_JSON, _optional_relations
+from . import sync
+
+SNAPSHOT_EVERY = 25
+
+
+# ===== SQL : état complet / delta d'une révision =====
+def _state_sql(walls: bool, delta: bool) -> str:
+    """
+    Objet JSON décrivant le plan %(plan_id)s : état complet, ou (delta=True)
+    seulement ce qui porte la révision %(rev)s.
+    """
+    only = " AND {a}.rev = %(rev)s" if delta else ""
+    if walls:
+        walls_sql = f"""
+          (SELECT CASE WHEN jsonb_typeof(w.walls_json::jsonb) = 'array'
+                       THEN w.walls_json::json ELSE '[]'::json END
+           FROM seating_plan_walls w WHERE w.plan_id = %(plan_id)s{only.format(a='w')})"""
+    else:
+        walls_sql = "NULL::json"
+    if not delta:
+        walls_sql = f"COALESCE({walls_sql}, '[]'::json)"
+
+    parts = [
+        f"""'furniture', COALESCE((
+          SELECT json_agg({FURNITURE_JSON} ORDER BY f.z, f.id)
+          FROM furniture_items f WHERE f.plan_id = %(plan_id)s{only.format(a='f')}), '[]'::json)""",
+        f"""'positions', COALESCE((
+          SELECT json_agg({POSITION_JSON} ORDER BY sp.eleve_id)
+          FROM seating_positions sp WHERE sp.plan_id = %(plan_id)s{only.format(a='sp')}), '[]'::json)""",
+        f"'walls', {walls_sql}",
+    ]
+    if delta:
+        parts.append("""'deleted', json_build_object(
+          'furniture', COALESCE((
+            SELECT json_agg(t.entity_id) FROM seating_tombstones t
+            WHERE t.plan_id = %(plan_id)s AND t.kind = 'furniture' AND t.rev = %(rev)s), '[]'::json),
+          'positions', COALESCE((
+            SELECT json_agg(t.entity_id) FROM seating_tombstones t
+            WHERE t.plan_id = %(plan_id)s AND t.kind = 'position' AND t.rev = %(rev)s), '[]'::json))""")
+    else:
+        parts.append("""'seats', COALESCE((
+          SELECT json_agg(json_build_object(
+                   'label', t.label, 'x', t.x, 'y', t.y, 'w', t.w, 'h', t.h,
+                   'rotation', t.rotation, 'z', t.z) ORDER BY t.z, t.id)
+          FROM seats t WHERE t.plan_id = %(plan_id)s), '[]'::json)""")
+    return "json_build_object(" + ",\n".join(parts) + ")"
+
+
+def record_revision(cur, plan_id: int, rev: int, force_snapshot: bool = False):
+    """
+    Enregistre la révision `rev` du plan (à appeler après ses écritures, dans
+    la même transaction). Snapshot si aucun n'existe encore, si le dernier date
+    de SNAPSHOT_EVERY révisions ou plus, ou si force_snapshot ; delta sinon.
+    """
+    walls = _optional_relations(cur.connection)["walls"]
+    cur.execute(f"""
+      WITH last AS (
+        SELECT max(rev) AS rev FROM seating_plan_history
+        WHERE plan_id = %(plan_id)s AND kind = 'snapshot'
+      ),
+      k AS (
+        SELECT CASE WHEN %(force)s OR last.rev IS NULL OR %(rev)s - last.rev >= %(every)s
+                    THEN 'snapshot' ELSE 'delta' END AS kind
+        FROM last
+      )
+      INSERT INTO seating_plan_history (plan_id, rev, kind, data)
+      SELECT %(plan_id)s, %(rev)s, k.kind,
+             CASE WHEN k.kind = 'snapshot' THEN {_state_sql(walls, delta=False)}
+                  ELSE {_state_sql(walls, delta=True)} END::jsonb
+      FROM k
+      ON CONFLICT (plan_id, rev) DO UPDATE SET kind = EXCLUDED.kind, data = EXCLUDED.data,
+                                               created_at = NOW()
+    """, {"plan_id": plan_id, "rev": rev, "force": bool(force_snapshot), "every": SNAPSHOT_EVERY})
+
+
+# ===== Lecture =====
+def list_revisions(cur, plan_id: int) -> list:
+    """[{rev, kind, created_at, size}] du plus récent au plus ancien."""
+    cur.execute("""
+      SELECT rev, kind, created_at, pg_column_size(data) AS size
+      FROM seating_plan_history WHERE plan_id=%s ORDER BY rev DESC
+    """, (plan_id,))
+    return [{"rev": r[0], "kind": r[1], "created_at": r[2].isoformat() if r[2] else None,
+             "size": r[3]} for r in cur.fetchall()]
+
+
+def state_at(cur, plan_id: int, rev: int):
+    """
+    État du plan à la révision `rev` : {rev, seats, furniture, positions, walls}
+    (valeurs encodées × PLAN_SUBDIV, comme le payload de l'éditeur).
+    None si l'historique ne couvre pas cette révision.
+    """
+    cur.execute("""
+      SELECT rev, kind, data FROM seating_plan_history
+      WHERE plan_id = %(p)s AND rev <= %(r)s
+        AND rev >= (SELECT max(rev) FROM seating_plan_history
+                    WHERE plan_id = %(p)s AND kind = 'snapshot' AND rev <= %(r)s)
+      ORDER BY rev
+    """, {"p": plan_id, "r": rev})
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    _, _, snap = rows[0]
+    seats = snap.get("seats") or []
+    furniture = {f["id"]: f for f in snap.get("furniture") or []}
+    positions = {p["eleve_id"]: p for p in snap.get("positions") or []}
+    walls = snap.get("walls") or []
+    for _, _, d in rows[1:]:
+        deleted = d.get("deleted") or {}
+        for fid in deleted.get("furniture") or []:
+            furniture.pop(fid, None)
+        for eid in deleted.get("positions") or []:
+            positions.pop(eid, None)
+        furniture.update((f["id"], f) for f in d.get("furniture") or [])
+        positions.update((p["eleve_id"], p) for p in d.get("positions") or [])
+        if d.get("walls") is not None:
+            walls = d["walls"]
+
+    return {
+        "rev": rows[-1][0],
+        "seats": seats,
+        "furniture": sorted(furniture.values(), key=lambda f: (f.get("z") or 0, f["id"])),
+        "positions": list(positions.values()),
+        "walls": walls,
+    }
+
+
+# ===== Restauration =====
+def _write_furniture_exact(cur, plan_id: int, items, rev: int):
+    """
+    Remet les meubles `items` (avec leurs ids d'origine) : mise à jour des
+    présents, recréation des supprimés depuis ; les autres meubles du plan sont
+    supprimés. Un id appartenant à un autre plan n'est jamais touché.
+    """
+    cur.execute(f"""
+      WITH v AS (
+        SELECT * FROM jsonb_to_recordset(%(rows)s::jsonb) AS v({sync._FURNITURE_FIELDS})
+      ),
+      del AS (
+        DELETE FROM furniture_items f
+        WHERE f.plan_id = %(plan_id)s AND NOT EXISTS (SELECT 1 FROM v WHERE v.id = f.id)
+        RETURNING f.id
+      ),
+      tomb AS (
+        INSERT INTO seating_tombstones (plan_id, kind, entity_id, rev)
+        SELECT %(plan_id)s, %(kind)s, id, %(rev)s FROM del
+        ON CONFLICT (plan_id, kind, entity_id) DO UPDATE SET rev = EXCLUDED.rev
+      ),
+      up AS (
+        INSERT INTO furniture_items (id, plan_id, type, label, color, x, y, w, h, rotation, z, radius, rev)
+        SELECT id, %(plan_id)s, type, label, color, x, y, w, h,
+               COALESCE(rotation, 0), COALESCE(z, 0), COALESCE(radius, FALSE), %(rev)s
+        FROM v
+        ON CONFLICT (id) DO UPDATE
+          SET type=EXCLUDED.type, label=EXCLUDED.label, color=EXCLUDED.color,
+              x=EXCLUDED.x, y=EXCLUDED.y, w=EXCLUDED.w, h=EXCLUDED.h,
+              rotation=EXCLUDED.rotation, z=EXCLUDED.z, radius=EXCLUDED.radius, rev=EXCLUDED.rev
+          WHERE furniture_items.plan_id = EXCLUDED.plan_id
+      ),
+      revived AS (
+        DELETE FROM seating_tombstones t
+        WHERE t.plan_id = %(plan_id)s AND t.kind = %(kind)s AND t.entity_id IN (SELECT id FROM v)
+      )
+      SELECT 1
+    """, {"rows": Json(list(items)), "plan_id": plan_id, "rev": rev, "kind": sync.FURNITURE})
+
+
+def restore_revision(conn, plan_id: int, rev: int) -> dict:
+    """
+    Rend courant l'état de la révision `rev` (nouvelle révision, historisée).
+    Retourne {rev, prev_rev, restored_from}. LookupError si plan ou révision inconnus.
+    """
+    with conn.cursor() as cur:
+        new_rev = sync.bump_revision(cur, plan_id)
+        if new_rev is None or rev >= new_rev:
+            raise LookupError(plan_id)
+        state = state_at(cur, plan_id, rev)
+        if state is None:
+            raise LookupError(rev)
+
+        # élèves supprimés / places retirées depuis : on ne les réintroduit pas
+        cur.execute("SELECT id FROM eleves WHERE id = ANY(%s)",
+                    ([p["eleve_id"] for p in state["positions"]],))
+        eleves = {r[0] for r in cur.fetchall()}
+        cur.execute("SELECT id FROM seats WHERE plan_id=%s", (plan_id,))
+        seats = {r[0] for r in cur.fetchall()}
+        positions = [{**p, "seat_id": p.get("seat_id") if p.get("seat_id") in seats else None}
+                     for p in state["positions"] if p["eleve_id"] in eleves]
+
+        sync.upsert_positions(cur, plan_id, positions, new_rev, full_sync=True)
+        _write_furniture_exact(cur, plan_id, state["furniture"], new_rev)
+        if _optional_relations(conn)["walls"]:
+            cur.execute("""
+              INSERT INTO seating_plan_walls (plan_id, walls_json, updated_at, rev)
+              VALUES (%s, %s, NOW(), %s)
+              ON CONFLICT (plan_id)
+              DO UPDATE SET walls_json = EXCLUDED.walls_json, updated_at = NOW(), rev = EXCLUDED.rev
+            """, (plan_id, Json(state["walls"]), new_rev))
+        record_revision(cur, plan_id, new_rev)
+    return {"rev": new_rev, "prev_rev": new_rev - 1, "restored_from": rev}
+
+
+# ===== Duplication copy-on-write =====
+def create_branch(conn, plan_id: int, rev=None):
+    """
+    Crée une copie inactive du plan (état courant, ou de la révision `rev`)
+    sans copier ses lignes : un seul snapshot rev 0, matérialisé à la
+    première ouverture. Retourne l'id du nouveau plan, None si source absente.
+    Lève LookupError si `rev` n'est pas couverte par l'historique.
+    """
+    walls = _optional_relations(conn)["walls"]
+    with conn.cursor() as cur:
+        cur.execute("""
+          SELECT classe_id, name, width, height, grid_size, revision
+          FROM seating_plans WHERE id=%s
+        """, (plan_id,))
+        src = cur.fetchone()
+        if not src:
+            return None
+        classe_id, name, width, height, grid_size, current = src
+
+        data = None
+        if rev is not None and int(rev) != current:
+            data = state_at(cur, plan_id, int(rev))
+            if data is None:
+                raise LookupError(rev)
+            data.pop("rev", None)
+
+        cur.execute("""
+          INSERT INTO seating_plans (classe_id, name, width, height, grid_size, is_active,
+                                     materialized, branch_of, branch_rev)
+          VALUES (%s, %s || ' (copie)', %s, %s, %s, FALSE, FALSE, %s, %s) RETURNING id
+        """, (classe_id, name, width, height, grid_size, plan_id,
+              int(rev) if rev is not None else current))
+        new_id = cur.fetchone()[0]
+
+        if data is not None:
+            cur.execute("""
+              INSERT INTO seating_plan_history (plan_id, rev, kind, data)
+              VALUES (%s, 0, 'snapshot', %s)
+            """, (new_id, Json(data)))
+        else:
+            # état courant de la source, lu par Postgres (pas d'aller-retour Python)
+            cur.execute(f"""
+              INSERT INTO seating_plan_history (plan_id, rev, kind, data)
+              SELECT %(new_id)s, 0, 'snapshot', {_state_sql(walls, delta=False)}::jsonb
+            """, {"new_id": new_id, "plan_id": plan_id})
+    return new_id
+
+
+def materialize(cur, plan_id: int):
+    """
+    Crée les lignes d'une copie à partir de son snapshot initial (ligne
+    seating_plans déjà verrouillée par l'appelant). Les meubles reçoivent de
+    nouveaux ids ; le snapshot est réécrit avec ces ids pour que les
+    restaurations ne visent jamais les meubles du plan source.
+    """
+    cur.execute("""
+      SELECT rev, data FROM seating_plan_history
+      WHERE plan_id=%s AND kind='snapshot' ORDER BY rev LIMIT 1
+    """, (plan_id,))
+    r = cur.fetchone()
+    if r:
+        base_rev, data = r
+        cur.execute("""
+          INSERT INTO seats (plan_id, label, x, y, w, h, rotation, z)
+          SELECT %s, label, x, y, w, h, rotation, z
+          FROM jsonb_to_recordset(%s::jsonb)
+            AS v(label text, x int, y int, w int, h int, rotation numeric, z int)
+        """, (plan_id, Json(data.get("seats") or [])))
+        cur.execute(f"""
+          INSERT INTO furniture_items (plan_id, type, label, color, x, y, w, h, rotation, z, radius, rev)
+          SELECT %s, type, label, color, x, y, w, h,
+                 COALESCE(rotation, 0), COALESCE(z, 0), COALESCE(radius, FALSE), %s
+          FROM jsonb_to_recordset(%s::jsonb) AS v({sync._FURNITURE_FIELDS})
+        """, (plan_id, base_rev, Json(data.get("furniture") or [])))
+        # places recréées avec de nouveaux ids -> pas de seat_id (comme l'ancienne copie)
+        cur.execute("""
+          INSERT INTO seating_positions (plan_id, eleve_id, x, y, seat_id, rotation, rev)
+          SELECT %s, v.eleve_id, v.x, v.y, NULL, COALESCE(v.rotation, 0), %s
+          FROM jsonb_to_recordset(%s::jsonb) AS v(eleve_id int, x int, y int, rotation int)
+          WHERE EXISTS (SELECT 1 FROM eleves e WHERE e.id = v.eleve_id)
+        """, (plan_id, base_rev, Json(data.get("positions") or [])))
+        if _optional_relations(cur.connection)["walls"]:
+            cur.execute("""
+              INSERT INTO seating_plan_walls (plan_id, walls_json, updated_at, rev)
+              VALUES (%s, %s, NOW(), %s)
+              ON CONFLICT (plan_id) DO NOTHING
+            """, (plan_id, Json(data.get("walls") or []), base_rev))
+        record_revision(cur, plan_id, base_rev, force_snapshot=True)
+    cur.execute("UPDATE seating_plans SET materialized=TRUE WHERE id=%s", (plan_id,))
+
+
+def ensure_materialized(conn, plan_id: int) -> bool:
+    """
+    Matérialise une copie pas encore ouverte (à appeler avant toute écriture de
+    la transaction : commit si matérialisé). Retourne True si des lignes ont été créées.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT materialized FROM seating_plans WHERE id=%s", (plan_id,))
+        r = cur.fetchone()
+        if not r or r[0]:
+            return False
+        cur.execute("SELECT materialized FROM seating_plans WHERE id=%s FOR UPDATE", (plan_id,))
+        if cur.fetchone()[0]:
+            conn.commit()
+            return False
+        materialize(cur, plan_id)
+    conn.commit()
+    return True
@@ -1,72 +1,287 @@
-﻿def refresh_moyennes_if_needed(db_conn_factory, max_age_minutes=5):
+﻿import time
+import select
+import threading
+from datetime import datetime, timezone
+
+
+# ===== Rafraîchissement de eleve_moyennes_mv en tâche de fond =====
+# Les écritures de résultats font NOTIFY sur MOYENNES_CHANNEL (et/ou posent
+# mview_flags.needs_refresh) ; un thread unique regroupe ces signaux et lance
+# un REFRESH ... CONCURRENTLY après un délai de calme (debounce). Aucune
+# requête HTTP n'attend jamais un refresh.
+MOYENNES_MVIEW = "eleve_moyennes_mv"
+MOYENNES_CHANNEL = "eleve_moyennes_dirty"
+
+
+def notify_moyennes_dirty(cur):
+    """À appeler dans la transaction qui écrit des résultats (livré au COMMIT)."""
+    cur.execute("SELECT pg_notify(%s, '')", (MOYENNES_CHANNEL,))
+
+
+class MoyennesRefresher:
     """
-    Rafraîchit eleve_moyennes_mv si marquée 'dirty' ou trop ancienne.
-    Ne fait jamais planter l'API : ignore si mview/flags absents, et
-    bascule en refresh non-concurrent si nécessaire.
+    Thread de fond :
+      - écoute MOYENNES_CHANNEL (LISTEN) et relit mview_flags toutes les poll_s
+      - refresh concurrent quand c'est sale depuis debounce_s sans nouveau signal,
+        ou quand la dernière mise à jour dépasse max_age_minutes
+      - n'utilise le refresh bloquant que si la vue n'a jamais été peuplée
     """
-    # Lire le flag
-    try:
-        conn = db_conn_factory(); cur = conn.cursor()
+
+    def __init__(self, db_conn_factory, debounce_s=5.0, poll_s=30.0, max_age_minutes=5):
+        self._factory = db_conn_factory
+        self.debounce_s = debounce_s
+        self.poll_s = poll_s
+        self.max_age_s = max_age_minutes * 60
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._dirty_since = None     # time.monotonic() du 1er signal non traité
+        self._last_signal = None     # time.monotonic() du dernier signal
+        self._last_poll = 0.0
+        self.last_refresh = None     # datetime (UTC) du dernier refresh réussi
+        self.last_duration_ms = None
+        self.last_error = None
+        self.refresh_count = 0
+
+    # --- API ---
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="moyennes-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def mark_dirty(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_signal = now
+
+    def status(self):
+        with self._lock:
+            last = self.last_refresh
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "pending": self._dirty_since is not None,
+                "last_refresh": last.isoformat() if last else None,
+                "age_s": round((datetime.now(timezone.utc) - last).total_seconds(), 1) if last else None,
+                "last_duration_ms": self.last_duration_ms,
+                "refresh_count": self.refresh_count,
+                "last_error": self.last_error,
+            }
+
+    # --- boucle ---
+    def _run(self):
+        listen_conn = None
+        while not self._stop.is_set():
+            try:
+                if listen_conn is None or listen_conn.closed:
+                    listen_conn = self._open_listener()
+                self._wait_for_notifies(listen_conn)
+                if time.monotonic() - self._last_poll >= self.poll_s:
+                    self._poll_flags()
+                if self._due():
+                    self._refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                try:
+                    listen_conn and listen_conn.close()
+                except Exception:
+                    pass
+                listen_conn = None
+                self._stop.wait(self.poll_s)
         try:
-            cur.execute("""
-              SELECT needs_refresh,
-                     COALESCE(EXTRACT(EPOCH FROM (now() - last_refresh))/60.0, 1e9) AS age_min
-              FROM mview_flags
-              WHERE flag='eleve_moyennes_mv'
-            """)
-            row = cur.fetchone()
-            if not row:
+            listen_conn and listen_conn.close()
+        except Exception:
+            pass
+
+    def _open_listener(self):
+        conn = self._factory()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {MOYENNES_CHANNEL}")
+        return conn
+
+    def _wait_for_notifies(self, conn):
+        timeout = min(self.poll_s, self.debounce_s / 2 if self._dirty_since is not None else self.poll_s)
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return
+        conn.poll()
+        if conn.notifies:
+            conn.notifies.clear()
+            self.mark_dirty()
+
+    def _poll_flags(self):
+        self._last_poll = time.monotonic()
+        conn = self._factory()
+        try:
+            with conn.cursor() as cur:
                 try:
                     cur.execute("""
-                      INSERT INTO mview_flags(flag, needs_refresh, last_refresh)
-                      VALUES ('eleve_moyennes_mv', TRUE, NULL)
-                      ON CONFLICT (flag) DO NOTHING
-                    """)
-                    conn.commit()
+                      SELECT needs_refresh,
+                             COALESCE(EXTRACT(EPOCH FROM (now() - last_refresh)), 1e9) AS age_s
+                      FROM mview_flags
+                      WHERE flag=%s
+                    """, (MOYENNES_MVIEW,))
+                    row = cur.fetchone()
                 except Exception:
                     conn.rollback()
-                needs_refresh, age_min = True, 1e9
-            else:
-                needs_refresh, age_min = row
-        except Exception:
-            conn.rollback()
-            return
+                    row = None
+            # pas de ligne / table absente -> considéré comme jamais rafraîchi
+            needs_refresh, age_s = row if row else (True, 1e9)
+            if needs_refresh or float(age_s) > self.max_age_s:
+                self.mark_dirty()
         finally:
-            cur.close(); conn.close()
-    except Exception:
-        return
+            conn.close()
 
-    if not (needs_refresh or age_min > max_age_minutes):
-        return
+    def _due(self):
+        with self._lock:
+            if self._dirty_since is None:
+                return False
+            now = time.monotonic()
+            quiet = now - self._last_signal >= self.debounce_s
+            # on ne repousse pas indéfiniment sous un flot continu d'écritures
+            starved = now - self._dirty_since >= 6 * self.debounce_s
+            return quiet or starved
 
-    # Try concurrently, fallback simple
-    try:
-        conn2 = db_conn_factory(); conn2.autocommit = True
-        cur2 = conn2.cursor()
+    def _refresh(self):
+        with self._lock:
+            self._dirty_since = None
+            self._last_signal = None
+        t0 = time.monotonic()
+        conn = self._factory()
         try:
-            try:
-                cur2.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY eleve_moyennes_mv;")
-            except Exception:
-                conn2.rollback()
-                cur2.execute("REFRESH MATERIALIZED VIEW eleve_moyennes_mv;")
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname=%s", (MOYENNES_MVIEW,))
+                row = cur.fetchone()
+                if not row:
+                    self.last_error = f"{MOYENNES_MVIEW} absente"
+                    return
+                if not row[0]:
+                    # jamais peuplée : CONCURRENTLY impossible, personne ne la lit encore
+                    cur.execute(f"REFRESH MATERIALIZED VIEW {MOYENNES_MVIEW}")
+                else:
+                    # index unique : migration app/schema.py « eleve_moyennes_unique »
+                    try:
+                        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {MOYENNES_MVIEW}")
+                    except Exception as e:
+                        # jamais de refresh bloquant (ACCESS EXCLUSIVE) : nouvel essai plus tard
+                        print(f"[MVIEW] refresh concurrent KO: {e}")
+                        self.last_error = str(e)
+                        self.mark_dirty()
+                        return
+                try:
+                    cur.execute("""
+                      INSERT INTO mview_flags(flag, needs_refresh, last_refresh)
+                      VALUES (%s, FALSE, now())
+                      ON CONFLICT (flag) DO UPDATE
+                         SET needs_refresh=FALSE, last_refresh=now()
+                    """, (MOYENNES_MVIEW,))
+                except Exception:
+                    pass  # flags absents : le refresh lui-même a réussi
+            with self._lock:
+                self.last_refresh = datetime.now(timezone.utc)
+                self.last_duration_ms = round((time.monotonic() - t0) * 1000, 1)
+                self.refresh_count += 1
+                self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            self.mark_dirty()  # nouvel essai au prochain tour
+            raise
         finally:
-            cur2.close(); conn2.close()
+            conn.close()
+
+
+_REFRESHER = None
+
+
+def start_moyennes_refresher(db_conn_factory, **kwargs):
+    """Démarre (une seule fois par process) le rafraîchisseur de fond."""
+    global _REFRESHER
+    if _REFRESHER is None:
+        _REFRESHER = MoyennesRefresher(db_conn_factory, **kwargs)
+    return _REFRESHER.start()
+
+
+def moyennes_refresher_status():
+    if _REFRESHER is None:
+        return {"running": False, "pending": False, "last_refresh": None, "age_s": None,
+                "last_duration_ms": None, "refresh_count": 0, "last_error": None}
+    return _REFRESHER.status()
+
+
+# ===== Moyennes par classe (cache versionné) =====
+# classe_id -> (version, {eleve_id: moyenne_20})
+_MOYENNES_CACHE = {}
+_MOYENNES_LOCK = threading.Lock()
+_MOYENNES_CACHE_MAX = 64
+
+
+def _classe_data_version(cur, classe_id):
+    """
+    Version des données d'une classe pour les moyennes :
+    dernier refresh de eleve_moyennes_mv + empreinte de l'effectif.
+    None si non déterminable (pas de mview_flags) -> pas de cache.
+    """
+    try:
+        cur.execute("""
+          SELECT (SELECT last_refresh FROM mview_flags WHERE flag='eleve_moyennes_mv'),
+                 COUNT(*), COALESCE(MAX(id), 0)
+          FROM eleves
+          WHERE classe_id=%s
+        """, (classe_id,))
+        last_refresh, nb, max_id = cur.fetchone()
     except Exception:
-        return
+        cur.connection.rollback()
+        return None
+    if last_refresh is None:
+        return None
+    return (last_refresh, nb, max_id)
+
 
-    # MAJ du flag si possible
+def moyennes_classe(conn, classe_id):
+    """
+    {eleve_id: moyenne_20} pour les seuls élèves de la classe
+    (jointure eleves.classe_id, pas de lecture de toute la vue).
+    Servi depuis le cache tant que la version de la classe ne change pas.
+    Retourne {} si la vue n'existe pas.
+    """
+    cur = conn.cursor()
     try:
-        conn3 = db_conn_factory(); cur3 = conn3.cursor()
+        version = _classe_data_version(cur, classe_id)
+        if version is not None:
+            with _MOYENNES_LOCK:
+                hit = _MOYENNES_CACHE.get(classe_id)
+            if hit and hit[0] == version:
+                return hit[1]
+
         try:
-            cur3.execute("""
-              UPDATE mview_flags
-                 SET needs_refresh=FALSE, last_refresh=now()
-               WHERE flag='eleve_moyennes_mv'
-            """)
-            conn3.commit()
+            cur.execute("""
+              SELECT m.eleve_id, m.moyenne_20
+              FROM eleve_moyennes m
+              JOIN eleves e ON e.id = m.eleve_id
+              WHERE e.classe_id=%s
+            """, (classe_id,))
+            moyennes = {
+                eid: (float(m20) if m20 is not None else None)
+                for eid, m20 in cur.fetchall()
+            }
         except Exception:
-            conn3.rollback()
-        finally:
-            cur3.close(); conn3.close()
-    except Exception:
-        pass
+            conn.rollback()
+            return {}
+
+        if version is not None:
+            with _MOYENNES_LOCK:
+                if len(_MOYENNES_CACHE) >= _MOYENNES_CACHE_MAX:
+                    _MOYENNES_CACHE.pop(next(iter(_MOYENNES_CACHE)))
+                _MOYENNES_CACHE[classe_id] = (version, moyennes)
+        return moyennes
+    finally:
+        cur.close()
@@ -0,0 +1,282 @@
+# payload.py
+# =============================================================================
+# Payload de l'éditeur de plan de classe construit en UNE requête SQL
+# (json_agg / json_build_object côté Postgres). Seules les colonnes lues par
+# static/seating/plan_classe.js sont sélectionnées ; le texte JSON produit par
+# Postgres est renvoyé tel quel au client (aucun aller-retour dict Python).
+#
+# Comparaison avec l'ancien chargement multi-requêtes :
+#   python -m app.seating.payload bench [--runs 50]
+# (crée une classe de 30 élèves et un plan de 40 places dans une transaction
+#  annulée à la fin, puis chronomètre les deux chemins).
+# =============================================================================
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+
+
+# Relations facultatives selon l'installation (détectées une fois par process)
+_OPTIONAL = {}
+_OPTIONAL_LOCK = threading.Lock()
+
+
+def _optional_relations(conn) -> dict:
+    with _OPTIONAL_LOCK:
+        if _OPTIONAL:
+            return dict(_OPTIONAL)
+    with conn.cursor() as cur:
+        cur.execute("""
+          SELECT to_regclass('public.seating_plan_walls') IS NOT NULL,
+                 to_regclass('public.eleve_moyennes')     IS NOT NULL
+        """)
+        walls, moyennes = cur.fetchone()
+    with _OPTIONAL_LOCK:
+        _OPTIONAL.update(walls=bool(walls), moyennes=bool(moyennes))
+        return dict(_OPTIONAL)
+
+
+# Fragments JSON partagés par le payload complet et le delta
+FURNITURE_JSON = """json_build_object(
+  'id', f.id, 'type', f.type, 'label', f.label, 'x', f.x, 'y', f.y, 'w', f.w, 'h', f.h,
+  'rotation', f.rotation, 'z', f.z, 'color', f.color, 'radius', f.radius)"""
+POSITION_JSON = """json_build_object(
+  'eleve_id', sp.eleve_id, 'x', sp.x, 'y', sp.y, 'seat_id', sp.seat_id, 'rotation', sp.rotation)"""
+
+
+def _payload_sql(walls: bool, moyennes: bool) -> str:
+    walls_sql = """
+      COALESCE((SELECT CASE WHEN jsonb_typeof(w.walls_json::jsonb) = 'array'
+                            THEN w.walls_json::json END
+                FROM seating_plan_walls w
+                WHERE w.plan_id = (SELECT id FROM sel)), '[]'::json)
+    """ if walls else "'[]'::json"
+    moy_join = "LEFT JOIN eleve_moyennes m ON m.eleve_id = e.id" if moyennes else ""
+    moy_col = "m.moyenne_20" if moyennes else "NULL"
+
+    return f"""
+    WITH plans AS (
+      SELECT id, classe_id, name, width, height, grid_size, is_active, created_at, revision,
+             materialized, branch_of, branch_rev
+      FROM seating_plans
+      WHERE classe_id = %(classe_id)s
+    ),
+    sel AS (
+      SELECT * FROM plans
+      WHERE %(plan_id)s::int IS NULL OR id = %(plan_id)s::int
+      ORDER BY (is_active IS TRUE) DESC, created_at DESC
+      LIMIT 1
+    ),
+    classe AS (
+      -- niveau de repli si eleves.niveau n'existe pas dans ce schéma
+      SELECT to_jsonb(c) ->> 'niveau' AS niveau FROM classes c WHERE c.id = %(classe_id)s
+    )
+    SELECT (SELECT id FROM sel) AS plan_id, (SELECT materialized FROM sel) AS materialized,
+    json_build_object(
+      'plans', COALESCE((SELECT json_agg(row_to_json(p) ORDER BY p.created_at DESC) FROM plans p), '[]'::json),
+      'active_plan', (SELECT row_to_json(s) FROM sel s),
+      'seats', COALESCE((
+        SELECT json_agg(json_build_object(
+                 'id', t.id, 'label', t.label, 'x', t.x, 'y', t.y, 'w', t.w, 'h', t.h,
+                 'rotation', t.rotation, 'z', t.z) ORDER BY t.z, t.id)
+        FROM seats t WHERE t.plan_id = (SELECT id FROM sel)), '[]'::json),
+      'furniture', COALESCE((
+        SELECT json_agg({FURNITURE_JSON} ORDER BY f.z, f.id)
+        FROM furniture_items f WHERE f.plan_id = (SELECT id FROM sel)), '[]'::json),
+      'positions', COALESCE((
+        SELECT json_agg({POSITION_JSON})
+        FROM seating_positions sp WHERE sp.plan_id = (SELECT id FROM sel)), '[]'::json),
+      'eleves', COALESCE((
+        SELECT json_agg(json_build_object(
+                 'id', e.id, 'prenom', e.prenom, 'nom', e.nom,
+                 'photo_filename', e.photo_filename, 'sexe', e.sexe,
+                 'niveau', CASE WHEN to_jsonb(e) ? 'niveau' THEN to_jsonb(e) ->> 'niveau'
+                                ELSE (SELECT niveau FROM classe) END,
+                 'moyenne_20', {moy_col}) ORDER BY e.nom, e.prenom)
+        FROM eleves e {moy_join}
+        WHERE e.classe_id = %(classe_id)s), '[]'::json),
+      'walls', {walls_sql}
+    )::text AS payload
+    """
+
+
+def fetch_plan_payload(conn, classe_id: int, plan_id=None):
+    """
+    Retourne (plan_id affiché | None, texte JSON du payload complet).
+    Avec plan_id demandé mais absent de la classe, le 1er élément vaut None.
+    Une copie jamais ouverte est matérialisée puis relue (voir history.py).
+    """
+    opt = _optional_relations(conn)
+    sql = _payload_sql(opt["walls"], opt["moyennes"])
+    params = {"classe_id": classe_id, "plan_id": plan_id}
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        shown_id, materialized, payload = cur.fetchone()
+        if shown_id is not None and materialized is False:
+            from .history import ensure_materialized
+            ensure_materialized(conn, shown_id)
+            cur.execute(sql, {**params, "plan_id": shown_id})
+            shown_id, _, payload = cur.fetchone()
+    return shown_id, payload
+
+
+def _delta_sql(walls: bool) -> str:
+    walls_sql = """
+      (SELECT CASE WHEN jsonb_typeof(w.walls_json::jsonb) = 'array' THEN w.walls_json::json
+                   ELSE '[]'::json END
+       FROM seating_plan_walls w
+       WHERE w.plan_id = p.id AND w.rev > %(since)s)
+    """ if walls else "NULL::json"
+
+    return f"""
+    SELECT p.revision, json_build_object(
+      'delta', TRUE,
+      'rev', p.revision,
+      'since', %(since)s,
+      'furniture', COALESCE((
+        SELECT json_agg({FURNITURE_JSON} ORDER BY f.z, f.id)
+        FROM furniture_items f WHERE f.plan_id = p.id AND f.rev > %(since)s), '[]'::json),
+      'positions', COALESCE((
+        SELECT json_agg({POSITION_JSON})
+        FROM seating_positions sp WHERE sp.plan_id = p.id AND sp.rev > %(since)s), '[]'::json),
+      'deleted', json_build_object(
+        'furniture', COALESCE((
+          SELECT json_agg(t.entity_id) FROM seating_tombstones t
+          WHERE t.plan_id = p.id AND t.kind = 'furniture' AND t.rev > %(since)s), '[]'::json),
+        'positions', COALESCE((
+          SELECT json_agg(t.entity_id) FROM seating_tombstones t
+          WHERE t.plan_id = p.id AND t.kind = 'position' AND t.rev > %(since)s), '[]'::json)),
+      'walls', {walls_sql}
+    )::text AS payload
+    FROM seating_plans p
+    WHERE p.id = %(plan_id)s AND p.classe_id = %(classe_id)s
+    """
+
+
+def fetch_plan_delta(conn, classe_id: int, plan_id: int, since: int):
+    """
+    Changements du plan depuis la révision `since` (texte JSON) :
+    entités dont rev > since, ids supprimés, murs s'ils ont changé (sinon null).
+    Retourne (révision courante | None si plan absent, texte JSON | None).
+    Texte None si `since` est en avance sur le serveur (rechargement complet requis).
+    """
+    opt = _optional_relations(conn)
+    with conn.cursor() as cur:
+        cur.execute(_delta_sql(opt["walls"]),
+                    {"classe_id": classe_id, "plan_id": plan_id, "since": since})
+        row = cur.fetchone()
+    if not row:
+        return None, None
+    revision, payload = row
+    if since > revision:
+        return revision, None
+    return revision, payload
+
+
+# ===== Bench =====
+def _legacy_payload(conn, classe_id: int) -> str:
+    """Ancien chemin (une requête par collection + assemblage Python), pour comparaison."""
+    from psycopg2.extras import RealDictCursor
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT * FROM seating_plans WHERE classe_id=%s ORDER BY created_at DESC", (classe_id,))
+        plans = cur.fetchall()
+        active = next((p for p in plans if p.get("is_active")), plans[0] if plans else None)
+        seats = furniture = positions = walls = []
+        if active:
+            pid = active["id"]
+            cur.execute("SELECT * FROM seats WHERE plan_id=%s ORDER BY z, id", (pid,))
+            seats = cur.fetchall()
+            cur.execute("SELECT * FROM furniture_items WHERE plan_id=%s ORDER BY z, id", (pid,))
+            furniture = cur.fetchall()
+            cur.execute("SELECT * FROM seating_positions WHERE plan_id=%s", (pid,))
+            positions = cur.fetchall()
+            if _optional_relations(conn)["walls"]:
+                cur.execute("SELECT walls_json FROM seating_plan_walls WHERE plan_id=%s", (pid,))
+                r = cur.fetchone()
+                walls = (r or {}).get("walls_json") or []
+        cur.execute("""
+            SELECT e.id, e.prenom, e.nom, e.photo_filename, e.sexe
+            FROM eleves e WHERE e.classe_id=%s ORDER BY e.nom, e.prenom
+        """, (classe_id,))
+        eleves = cur.fetchall()
+        moy = {}
+        if _optional_relations(conn)["moyennes"]:
+            cur.execute("""
+              SELECT m.eleve_id, m.moyenne_20 FROM eleve_moyennes m
+              JOIN eleves e ON e.id = m.eleve_id WHERE e.classe_id=%s
+            """, (classe_id,))
+            moy = {r["eleve_id"]: r["moyenne_20"] for r in cur.fetchall()}
+    return json.dumps({
+        "plans": plans, "active_plan": active, "seats": seats, "furniture": furniture,
+        "positions": positions, "walls": walls,
+        "eleves": [{**e, "moyenne_20": moy.get(e["id"])} for e in eleves],
+    }, default=str)
+
+
+def _bench_fixture(cur, nb_eleves=30, nb_seats=40) -> int:
+    cur.execute("INSERT INTO classes (annee) VALUES ('bench') RETURNING id")
+    classe_id = cur.fetchone()[0]
+    cur.execute("""
+      INSERT INTO eleves (nom, prenom, classe_id)
+      SELECT 'NOM' || i, 'Prenom' || i, %s FROM generate_series(1, %s) i
+    """, (classe_id, nb_eleves))
+    cur.execute("""
+      INSERT INTO seating_plans (classe_id, name, width, height, grid_size, is_active)
+      VALUES (%s, 'bench', 30, 20, 32, TRUE) RETURNING id
+    """, (classe_id,))
+    plan_id = cur.fetchone()[0]
+    cur.execute("""
+      INSERT INTO seats (plan_id, label, x, y, w, h, rotation, z)
+      SELECT %s, 'P' || i, (i %% 8) * 96, (i / 8) * 96, 64, 64, 0, 0
+      FROM generate_series(0, %s - 1) i
+    """, (plan_id, nb_seats))
+    cur.execute("""
+      INSERT INTO seating_positions (plan_id, eleve_id, x, y, seat_id)
+      SELECT %s, e.id, (row_number() OVER (ORDER BY e.id)) * 32, 64, NULL
+      FROM eleves e WHERE e.classe_id = %s
+    """, (plan_id, classe_id))
+    return classe_id
+
+
+def bench(conn, runs=50) -> dict:
+    """Chronomètre ancien vs nouveau chemin sur une fixture 40 places / 30 élèves (rollback)."""
+    def _time(fn):
+        samples = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return round(statistics.median(samples), 2)
+
+    try:
+        with conn.cursor() as cur:
+            classe_id = _bench_fixture(cur)
+        legacy = _time(lambda: _legacy_payload(conn, classe_id))
+        single = _time(lambda: fetch_plan_payload(conn, classe_id))
+    finally:
+        conn.rollback()
+    return {"runs": runs, "legacy_ms": legacy, "single_sql_ms": single}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.seating.payload")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    pb = sub.add_parser("bench", help="comparer ancien / nouveau chargement du plan")
+    pb.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    from app.utils import get_db_connection
+    conn = get_db_connection()
+    try:
+        r = bench(conn, runs=args.runs)
+        print(f"médiane sur {r['runs']} appels : multi-requêtes {r['legacy_ms']} ms"
+              f" / requête unique {r['single_sql_ms']} ms")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
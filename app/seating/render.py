@@ -0,0 +1,465 @@
+# render.py
+# =============================================================================
+# Rendu vectoriel des plans de classe (PDF ReportLab / SVG) :
+#   - scène complète : murs, places, meubles (avec rotation), élèves placés
+#   - cache disque par (plan, révision, empreinte noms/titre) -> re-téléchargement instantané
+#   - rendu dans un pool de threads dédié : les threads waitress ne font que
+#     soumettre / attendre brièvement / servir le fichier
+#   - impressions multi-classes en tâche de fond (job + suivi + téléchargement)
+#   - vignettes (SVG / PNG) pour le sélecteur de plans, cachées par révision
+# =============================================================================
+import os
+import io
+import re
+import math
+import uuid
+import time
+import zipfile
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import RealDictCursor
+
+from .history import ensure_materialized
+
+PLAN_SUBDIV = 32            # coordonnées stockées en entiers x PLAN_SUBDIV
+CM_PER_UNIT = 25
+STUDENT_W = 70 / CM_PER_UNIT  # carte élève 70 x 50 cm (cf. plan_classe.js)
+STUDENT_H = 50 / CM_PER_UNIT
+RENDER_VERSION = 2          # à incrémenter si le dessin change (invalide le cache)
+THUMB_VERSION = 2
+THUMB_W = 240               # largeur des vignettes (px)
+
+CACHE_DIR = os.getenv("SEATING_EXPORT_CACHE") or os.path.join(tempfile.gettempdir(), "classimium_plans")
+THUMB_DIR = os.path.join(CACHE_DIR, "thumbs")
+JOB_TTL_S = 3600
+
+FURN_FILL = {
+    "desk": "#f1e7db", "table_rect": "#fffef7", "table_round": "#fffef7",
+    "armoire": "#d7c5ad", "board": "#0f5132", "door": "#b87333",
+    "window": "#cfe8ff", "sink": "#e5e7eb", "trash": "#475569", "plant": "#def7ec",
+}
+
+_HEX_COLOR = re.compile(r"#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})")
+
+
+def _furniture_fill(f, default="#eeeeee") -> str:
+    """Couleur d'un meuble : furniture_items.color (texte libre) seulement si hex #rgb / #rrggbb."""
+    c = f.get("color")
+    if isinstance(c, str) and _HEX_COLOR.fullmatch(c.strip()):
+        return c.strip()
+    return FURN_FILL.get(f.get("type"), default)
+
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="seating-render")
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+
+
+# ===== Données =====
+def plan_fingerprint(conn, plan_id: int):
+    """
+    Clé de cache : révision du plan + empreinte de ce que la révision ne couvre
+    pas (nom/dimensions du plan, noms des élèves placés). None si plan absent.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+          SELECT p.revision, md5(concat_ws('|', p.name, p.width, p.height, (
+                   SELECT string_agg(e.id || ':' || e.nom || ':' || e.prenom, ',' ORDER BY e.id)
+                   FROM seating_positions sp JOIN eleves e ON e.id = sp.eleve_id
+                   WHERE sp.plan_id = p.id)))
+          FROM seating_plans p WHERE p.id=%s
+        """, (plan_id,))
+        r = cur.fetchone()
+    if not r:
+        return None
+    return f"{plan_id}-r{r[0]}-{r[1][:10]}-v{RENDER_VERSION}"
+
+
+def load_scene(conn, plan_id: int):
+    """Scène du plan en unités (dict sérialisable), None si plan absent."""
+    ensure_materialized(conn, plan_id)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+          SELECT p.id, p.name, p.width, p.height, c.annee
+          FROM seating_plans p LEFT JOIN classes c ON c.id = p.classe_id
+          WHERE p.id=%s
+        """, (plan_id,))
+        plan = cur.fetchone()
+        if not plan:
+            return None
+        cur.execute("SELECT label, x, y, w, h, rotation FROM seats WHERE plan_id=%s ORDER BY z, id", (plan_id,))
+        seats = cur.fetchall()
+        cur.execute("""
+          SELECT type, label, x, y, w, h, rotation,
+                 to_jsonb(f) ->> 'color' AS color, COALESCE((to_jsonb(f) ->> 'radius')::boolean, FALSE) AS radius
+          FROM furniture_items f WHERE plan_id=%s ORDER BY z, id
+        """, (plan_id,))
+        furniture = cur.fetchall()
+        cur.execute("""
+          SELECT sp.x, sp.y, COALESCE((to_jsonb(sp) ->> 'rotation')::numeric, 0) AS rotation,
+                 e.nom, e.prenom
+          FROM seating_positions sp JOIN eleves e ON e.id = sp.eleve_id
+          WHERE sp.plan_id=%s ORDER BY e.nom, e.prenom
+        """, (plan_id,))
+        positions = cur.fetchall()
+        walls = []
+        cur.execute("SELECT to_regclass('public.seating_plan_walls') IS NOT NULL AS ok")
+        if cur.fetchone()["ok"]:
+            cur.execute("SELECT walls_json FROM seating_plan_walls WHERE plan_id=%s", (plan_id,))
+            r = cur.fetchone()
+            walls = (r or {}).get("walls_json") or []
+    return _build_scene(plan, seats, furniture, positions, walls)
+
+
+def _build_scene(plan, seats, furniture, positions, walls):
+    """Lignes encodées (× PLAN_SUBDIV) -> scène en unités."""
+    S = PLAN_SUBDIV
+
+    def box(r, w=None, h=None):
+        return {"x": r["x"] / S, "y": r["y"] / S,
+                "w": w if w is not None else (r["w"] or S) / S,
+                "h": h if h is not None else (r["h"] or S) / S,
+                "rotation": float(r.get("rotation") or 0)}
+
+    return {
+        "title": f"{plan['name']}" + (f" — {plan['annee']}" if plan.get("annee") else ""),
+        "width": plan["width"], "height": plan["height"],
+        "seats": [{**box(s), "label": s.get("label")} for s in seats],
+        "furniture": [{**box(f), "type": f["type"], "label": f.get("label"),
+                       "color": f.get("color"), "radius": bool(f.get("radius"))} for f in furniture],
+        "students": [{**box(p, STUDENT_W, STUDENT_H),
+                      "label": f"{(p.get('nom') or '').upper()} {p.get('prenom') or ''}".strip()}
+                     for p in positions],
+        "walls": [[(pt["x"] / S, pt["y"] / S) for pt in (w.get("points") or [])]
+                  for w in walls if isinstance(w, dict)],
+    }
+
+
+# ===== SVG =====
+def render_svg(scene, unit_px=24) -> str:
+    W, H = scene["width"] * unit_px, scene["height"] * unit_px
+    u = unit_px
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{W}" height="{H + 28}" '
+        f'viewBox="0 -28 {W} {H + 28}" font-family="Helvetica, Arial, sans-serif">',
+        f'<text x="4" y="-9" font-size="16" font-weight="bold">{escape(scene["title"])}</text>',
+        f'<rect x="0" y="0" width="{W}" height="{H}" fill="#fff" stroke="#bbb"/>',
+    ]
+
+    def rect(o, fill, stroke, rx=0, text_size=None):
+        x, y, w, h = o["x"] * u, o["y"] * u, o["w"] * u, o["h"] * u
+        cx, cy = x + w / 2, y + h / 2
+        rot = f' transform="rotate({o["rotation"]:g} {cx:.1f} {cy:.1f})"' if o["rotation"] else ""
+        out.append(f'<g{rot}><rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" rx="{rx}" '
+                   f'fill="{fill}" stroke="{stroke}"/>')
+        if o.get("label") and text_size:
+            out.append(f'<text x="{cx:.1f}" y="{cy + text_size / 3:.1f}" font-size="{text_size}" '
+                       f'text-anchor="middle">{escape(o["label"])}</text>')
+        out.append("</g>")
+
+    for pts in scene["walls"]:
+        if len(pts) >= 2:
+            d = " ".join(f"{x * u:.1f},{y * u:.1f}" for x, y in pts)
+            out.append(f'<polyline points="{d}" fill="none" stroke="#333" stroke-width="4" '
+                       f'stroke-linecap="square" stroke-linejoin="miter"/>')
+    for s in scene["seats"]:
+        rect(s, "#f8fafc", "#94a3b8", text_size=8)
+    for f in scene["furniture"]:
+        rect(f, _furniture_fill(f), "#333", rx=0.375 * u if f["radius"] else 0, text_size=9)
+    for e in scene["students"]:
+        rect(e, "#fff", "#1e3a8a", rx=3, text_size=8)
+    out.append("</svg>")
+    return "\n".join(out)
+
+
+# ===== Vignettes =====
+def thumb_key(conn, plan_id: int):
+    """Clé de vignette : révision + dimensions (les noms n'y figurent pas). None si plan absent."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT revision, width, height FROM seating_plans WHERE id=%s", (plan_id,))
+        r = cur.fetchone()
+    if not r:
+        return None
+    return f"{plan_id}-r{r[0]}-{r[1]}x{r[2]}-t{THUMB_VERSION}", r[0]
+
+
+def load_thumb_scene(conn, plan_id: int):
+    """
+    Scène pour la vignette. Une copie pas encore ouverte (voir history.py) est
+    dessinée depuis son snapshot, sans la matérialiser.
+    """
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+          SELECT p.id, p.name, p.width, p.height, p.materialized, NULL AS annee
+          FROM seating_plans p WHERE p.id=%s
+        """, (plan_id,))
+        plan = cur.fetchone()
+        if not plan:
+            return None
+        if plan["materialized"]:
+            return load_scene(conn, plan_id)
+        cur.execute("""
+          SELECT data FROM seating_plan_history
+          WHERE plan_id=%s AND kind='snapshot' ORDER BY rev LIMIT 1
+        """, (plan_id,))
+        r = cur.fetchone()
+    data = (r or {}).get("data") or {}
+    return _build_scene(plan, data.get("seats") or [], data.get("furniture") or [],
+                        data.get("positions") or [], data.get("walls") or [])
+
+
+def _thumb_scale(scene, width):
+    return width / max(scene["width"], 1), round(width * scene["height"] / max(scene["width"], 1))
+
+
+def _corners(o, u):
+    """Coins (px) d'un rectangle tourné autour de son centre."""
+    x, y, w, h = o["x"] * u, o["y"] * u, o["w"] * u, o["h"] * u
+    cx, cy = x + w / 2, y + h / 2
+    a = math.radians(o["rotation"] or 0)
+    ca, sa = math.cos(a), math.sin(a)
+    return [(cx + dx * ca - dy * sa, cy + dx * sa + dy * ca)
+            for dx, dy in ((-w / 2, -h / 2), (w / 2, -h / 2), (w / 2, h / 2), (-w / 2, h / 2))]
+
+
+def render_thumb_svg(scene, width=THUMB_W) -> str:
+    """Vignette sans texte : murs, places, meubles, élèves (pastilles)."""
+    u, H = _thumb_scale(scene, width)
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{H}" viewBox="0 0 {width} {H}">',
+           f'<rect width="{width}" height="{H}" fill="#fff" stroke="#ccc"/>']
+
+    def poly(o, fill, stroke):
+        pts = " ".join(f"{x:.1f},{y:.1f}" for x, y in _corners(o, u))
+        out.append(f'<polygon points="{pts}" fill="{fill}" stroke="{stroke}" stroke-width="0.5"/>')
+
+    for pts in scene["walls"]:
+        if len(pts) >= 2:
+            d = " ".join(f"{x * u:.1f},{y * u:.1f}" for x, y in pts)
+            out.append(f'<polyline points="{d}" fill="none" stroke="#333" stroke-width="{max(1.0, u / 8):.1f}"/>')
+    for s in scene["seats"]:
+        poly(s, "#f1f5f9", "#94a3b8")
+    for f in scene["furniture"]:
+        poly(f, _furniture_fill(f), "#555")
+    for e in scene["students"]:
+        poly(e, "#1e3a8a", "#1e3a8a")
+    out.append("</svg>")
+    return "".join(out)
+
+
+def render_thumb_png(scene, width=THUMB_W) -> bytes:
+    """Même dessin en PNG (Pillow, déjà requis par ReportLab)."""
+    from PIL import Image, ImageDraw
+
+    ss = 2  # sur-échantillonnage puis réduction (anticrénelage)
+    u, H = _thumb_scale(scene, width * ss)
+    img = Image.new("RGB", (width * ss, max(H, 1)), "#ffffff")
+    d = ImageDraw.Draw(img)
+
+    for pts in scene["walls"]:
+        if len(pts) >= 2:
+            d.line([(x * u, y * u) for x, y in pts], fill="#333333", width=max(2, int(u / 8)))
+    for s in scene["seats"]:
+        d.polygon(_corners(s, u), fill="#f1f5f9", outline="#94a3b8")
+    for f in scene["furniture"]:
+        d.polygon(_corners(f, u), fill=_furniture_fill(f), outline="#555555")
+    for e in scene["students"]:
+        d.polygon(_corners(e, u), fill="#1e3a8a")
+    img = img.resize((width, max(round(H / ss), 1)), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def thumbnail(conn, plan_id: int, fmt: str):
+    """
+    Chemin de la vignette (rendue si absente du cache) et révision du plan,
+    ou (None, None) si plan absent.
+    """
+    found = thumb_key(conn, plan_id)
+    if found is None:
+        return None, None
+    key, revision = found
+    path = cached_export(key, fmt, base=THUMB_DIR)
+    if path is None:
+        scene = load_thumb_scene(conn, plan_id)
+        if scene is None:
+            return None, None
+        data = render_thumb_png(scene) if fmt == "png" else render_thumb_svg(scene).encode("utf-8")
+        path = _store(key, fmt, data, base=THUMB_DIR)
+    return path, revision
+
+
+# ===== PDF =====
+def _draw_pdf_page(c, scene, page_w, page_h):
+    from reportlab.lib.units import mm
+    from reportlab.lib import colors
+
+    margin = 10 * mm
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(margin, page_h - margin, scene["title"])
+    avail_w, avail_h = page_w - 2 * margin, page_h - 2 * margin - 8 * mm
+    s = min(avail_w / max(scene["width"], 1), avail_h / max(scene["height"], 1))
+    ox, top = margin, page_h - margin - 8 * mm
+
+    def X(x): return ox + x * s
+    def Y(y): return top - y * s
+
+    c.setStrokeColor(colors.HexColor("#bbbbbb")); c.setLineWidth(0.5)
+    c.rect(X(0), Y(scene["height"]), scene["width"] * s, scene["height"] * s)
+
+    def rect(o, fill, stroke, radius=0, font=7):
+        c.saveState()
+        cx, cy = X(o["x"] + o["w"] / 2), Y(o["y"] + o["h"] / 2)
+        c.translate(cx, cy)
+        if o["rotation"]:
+            c.rotate(-o["rotation"])  # sens horaire à l'écran = négatif en repère PDF
+        w, h = o["w"] * s, o["h"] * s
+        c.setFillColor(colors.HexColor(fill)); c.setStrokeColor(colors.HexColor(stroke))
+        if radius:
+            c.roundRect(-w / 2, -h / 2, w, h, radius * s, fill=1, stroke=1)
+        else:
+            c.rect(-w / 2, -h / 2, w, h, fill=1, stroke=1)
+        if o.get("label"):
+            c.setFillColor(colors.black)
+            c.setFont("Helvetica", font)
+            c.drawCentredString(0, -font / 3, o["label"])
+        c.restoreState()
+
+    c.setStrokeColor(colors.HexColor("#333333")); c.setLineWidth(max(1.5, 0.12 * s))
+    for pts in scene["walls"]:
+        if len(pts) >= 2:
+            p = c.beginPath()
+            p.moveTo(X(pts[0][0]), Y(pts[0][1]))
+            for x, y in pts[1:]:
+                p.lineTo(X(x), Y(y))
+            c.drawPath(p, stroke=1, fill=0)
+    c.setLineWidth(0.6)
+    for seat in scene["seats"]:
+        rect(seat, "#f8fafc", "#94a3b8", font=6)
+    for f in scene["furniture"]:
+        rect(f, _furniture_fill(f), "#333333", radius=0.375 if f["radius"] else 0)
+    for e in scene["students"]:
+        rect(e, "#ffffff", "#1e3a8a", radius=0.12, font=max(5, min(8, 0.28 * s)))
+
+
+def render_pdf(scenes) -> bytes:
+    """Un plan par page (A4 paysage), entièrement vectoriel."""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4, landscape
+
+    buf = io.BytesIO()
+    page_w, page_h = landscape(A4)
+    c = canvas.Canvas(buf, pagesize=(page_w, page_h))
+    for scene in scenes:
+        _draw_pdf_page(c, scene, page_w, page_h)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+# ===== Cache =====
+def _cache_path(key: str, fmt: str, base: str = CACHE_DIR) -> str:
+    return os.path.join(base, f"{key}.{fmt}")
+
+
+def cached_export(key: str, fmt: str, base: str = CACHE_DIR):
+    p = _cache_path(key, fmt, base)
+    return p if os.path.isfile(p) else None
+
+
+def _store(key: str, fmt: str, data: bytes, base: str = CACHE_DIR) -> str:
+    os.makedirs(base, exist_ok=True)
+    plan_prefix = key.split("-", 1)[0] + "-"
+    for name in os.listdir(base):  # anciennes révisions du même plan
+        if name.startswith(plan_prefix) and name.endswith("." + fmt) and not name.startswith(key):
+            try:
+                os.remove(os.path.join(base, name))
+            except OSError:
+                pass
+    path = _cache_path(key, fmt, base)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def _render_one(db_conn_factory, plan_id: int, key: str, fmt: str) -> str:
+    conn = db_conn_factory()
+    try:
+        scene = load_scene(conn, plan_id)
+    finally:
+        conn.close()
+    if scene is None:
+        raise LookupError(plan_id)
+    data = render_pdf([scene]) if fmt == "pdf" else render_svg(scene).encode("utf-8")
+    return _store(key, fmt, data)
+
+
+def submit_render(db_conn_factory, plan_id: int, key: str, fmt: str):
+    """Future du chemin du fichier rendu (dans le pool de rendu)."""
+    return _EXECUTOR.submit(_render_one, db_conn_factory, plan_id, key, fmt)
+
+
+# ===== Jobs (impression de plusieurs plans) =====
+def _prune_jobs():
+    limit = time.time() - JOB_TTL_S
+    with _JOBS_LOCK:
+        for jid in [j for j, v in _JOBS.items() if v["created"] < limit]:
+            path = _JOBS.pop(jid).get("path")
+            if path and path.startswith(tempfile.gettempdir()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _run_batch(job_id, db_conn_factory, plan_ids, fmt):
+    job = _JOBS[job_id]
+    job["status"] = "running"
+    try:
+        conn = db_conn_factory()
+        try:
+            scenes = []
+            for pid in plan_ids:
+                scene = load_scene(conn, pid)
+                if scene is not None:
+                    scenes.append((pid, scene))
+                job["done"] = len(scenes)
+        finally:
+            conn.close()
+        if not scenes:
+            raise LookupError("aucun plan trouvé")
+
+        fd, path = tempfile.mkstemp(suffix=".pdf" if fmt == "pdf" else ".zip", prefix="plans_")
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "pdf":
+                f.write(render_pdf([s for _, s in scenes]))
+            else:
+                with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as z:
+                    for pid, s in scenes:
+                        z.writestr(f"plan_classe_{pid}.svg", render_svg(s))
+        job.update(status="done", path=path, finished=datetime.now().isoformat(timespec="seconds"))
+    except Exception as e:
+        job.update(status="error", error=str(e))
+
+
+def submit_batch(db_conn_factory, plan_ids, fmt="pdf") -> str:
+    _prune_jobs()
+    job_id = uuid.uuid4().hex
+    with _JOBS_LOCK:
+        _JOBS[job_id] = {"status": "queued", "fmt": fmt, "plan_ids": list(plan_ids),
+                         "total": len(plan_ids), "done": 0, "created": time.time()}
+    _EXECUTOR.submit(_run_batch, job_id, db_conn_factory, list(plan_ids), fmt)
+    return job_id
+
+
+def job_status(job_id: str):
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        return dict(job) if job else None
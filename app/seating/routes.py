@@ -4,26 +4,42 @@
 # - UI : rendu du template
 # - API :
 #    * GET    /api/plans/<classe_id>[?plan_id=ID]  -> liste des plans + contenu
+#    * GET    /api/plans/<classe_id>?plan_id=ID&since=REV -> changements depuis REV
+#    * POST   /api/plans/<plan_id>/ops             -> lot d'opérations (move/create/delete)
 #    * POST   /api/plans                           -> créer un plan
 #    * PUT    /api/plans/<plan_id>/activate        -> activer ce plan
-#    * POST   /api/plans/<plan_id>/duplicate       -> dupliquer le plan
+#    * POST   /api/plans/<plan_id>/duplicate       -> dupliquer le plan (copy-on-write)
+#    * GET    /api/plans/<plan_id>/history         -> révisions enregistrées
+#    * GET    /api/plans/<plan_id>/history/<rev>   -> état du plan à une révision (aperçu)
+#    * POST   /api/plans/<plan_id>/history/<rev>/restore -> revenir à une révision
 #    * PUT    /api/plans/<plan_id>/positions       -> upsert positions élèves
 #    * DELETE /api/plans/<plan_id>/positions       -> supprimer une position
 #    * PUT    /api/plans/<plan_id>/furniture       -> upsert meubles
 #    * DELETE /api/plans/<plan_id>/furniture/<id>  -> supprimer un meuble
 #    * POST   /api/plans/<plan_id>/reset           -> reset (soft/hard)
-#    * GET    /api/plans/<plan_id>/export/pdf      -> export PDF du plan
+#    * POST   /api/plans/<plan_id>/solve           -> placement automatique des élèves
+#    * GET    /api/plans/<plan_id>/export/<pdf|svg> -> export vectoriel du plan (cache)
+#    * GET    /api/plans/<plan_id>/thumb.<svg|png>[?v=REV] -> vignette du plan (cache)
+#    * POST   /api/export/plans                    -> impression groupée (job)
+#    * GET    /api/export/jobs/<job_id>            -> suivi / téléchargement du job
 #    * POST|DELETE /api/plans/<plan_id>/delete     -> supprimer un plan
+#    * GET    /api/moyennes/status                 -> état du rafraîchissement des moyennes
 # =============================================================================
 
 from flask import render_template, request, jsonify, abort, current_app, send_file
 from psycopg2.extras import RealDictCursor
 from io import BytesIO
+import os
 import json
+import time
 
 
 from . import seating_bp
-from .mview import refresh_moyennes_if_needed
+from .mview import moyennes_refresher_status, moyennes_classe
+from . import solver, render, history
+from .payload import fetch_plan_payload, fetch_plan_delta
+from .walls import normalize_walls
+from . import sync
 
 # ===== Connexion DB =====
 def db_conn():
@@ -102,129 +118,38 @@ def api_get_plans(classe_id: int):
       "eleves": [...],
       "walls": [...]             # [{ "id": "...", "points": [{"x":..,"y":..}, ...] }, ...]
     }
-    """
-    # 0) Matérialisation éventuelle des moyennes (ne doit pas casser l'API si indispo)
-    try:
-        refresh_moyennes_if_needed(db_conn)
-    except Exception:
-        pass
 
+    • Avec ?plan_id=<id>&since=<rev> -> seulement les changements depuis <rev> :
+      { "delta": true, "rev", "since", "furniture", "positions",
+        "deleted": {"furniture": [ids], "positions": [eleve_ids]}, "walls": [...]|null }
+      ou { "full": true, "rev" } si le client doit tout recharger.
+    """
+    # Tout le payload est construit par Postgres en une requête (voir payload.py) ;
+    # les moyennes sont rafraîchies en tâche de fond (voir mview.MoyennesRefresher).
+    requested_id = request.args.get("plan_id", type=int) or None
+    since = request.args.get("since", type=int)
     conn = db_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        # 1) Lister tous les plans de la classe
-        cur.execute(
-            "SELECT * FROM seating_plans WHERE classe_id=%s ORDER BY created_at DESC",
-            (classe_id,)
-        )
-        plans = cur.fetchall()
-
-        # 2) Déterminer le plan à AFFICHER
-        requested_id = request.args.get("plan_id", type=int)
-        if requested_id is not None:
-            # Si un plan_id est demandé, il doit appartenir à la classe
-            active_plan = next((p for p in plans if p["id"] == requested_id), None)
-            if requested_id and not active_plan:
-                # plan demandé inexistant ou n'appartenant pas à la classe
+        t0 = time.perf_counter()
+        if since is not None and requested_id is not None:
+            revision, payload = fetch_plan_delta(conn, classe_id, requested_id, since)
+            if revision is None:
                 return jsonify({"ok": False, "error": "Plan introuvable pour cette classe"}), 404
-        else:
-            # Sinon : plan actif, ou à défaut le plus récent
-            active_plan = next((p for p in plans if p.get("is_active")), plans[0] if plans else None)
-
-        # Valeurs par défaut si aucun plan à afficher
-        seats, furniture, positions, api_walls = [], [], [], []
-
-        # 3) Charger le contenu du plan sélectionné (si présent)
-        if active_plan:
-            pid = active_plan["id"]
-
-            # Seats
-            cur.execute("SELECT * FROM seats WHERE plan_id=%s ORDER BY z, id", (pid,))
-            seats = cur.fetchall()
-
-            # Furniture
-            cur.execute("SELECT * FROM furniture_items WHERE plan_id=%s ORDER BY z, id", (pid,))
-            furniture = cur.fetchall()
-
-            # Positions élèves
-            cur.execute("SELECT * FROM seating_positions WHERE plan_id=%s", (pid,))
-            positions = cur.fetchall()
-
-            # Walls (JSONB par plan)
-            try:
-                cur.execute("SELECT walls_json FROM seating_plan_walls WHERE plan_id=%s", (pid,))
-                r = cur.fetchone()
-                if r:
-                    # RealDictCursor -> r est un dict
-                    api_walls = r.get("walls_json") or []
-                    # Sécurise le type
-                    if not isinstance(api_walls, list):
-                        api_walls = []
-            except Exception:
-                # On tolère l'absence de table en environnement où elle n'existe pas encore
-                conn.rollback()
-                api_walls = []
-
-        # 4) Élèves de la classe (niveau si dispo)
-        eleves = []
-        classe_niveau = None
-        try:
-            cur.execute("""
-                SELECT e.id, e.prenom, e.nom, e.photo_filename, e.sexe, e.niveau
-                FROM eleves e
-                WHERE e.classe_id=%s
-                ORDER BY e.nom, e.prenom
-            """, (classe_id,))
-            eleves = cur.fetchall()
-        except Exception:
-            # Tolérance si la colonne "niveau" n'existe pas
-            conn.rollback()
-            try:
-                cur.execute("SELECT niveau FROM classes WHERE id=%s", (classe_id,))
-                r = cur.fetchone()
-                if r:
-                    # r peut être dict (RealDictCursor) ou tuple
-                    classe_niveau = r["niveau"] if isinstance(r, dict) else r[0]
-            except Exception:
-                conn.rollback()
-            cur.execute("""
-                SELECT e.id, e.prenom, e.nom, e.photo_filename, e.sexe
-                FROM eleves e
-                WHERE e.classe_id=%s
-                ORDER BY e.nom, e.prenom
-            """, (classe_id,))
-            eleves = cur.fetchall()
-
-        # 5) Moyennes (si la vue existe)
-        moyennes_map = {}
-        try:
-            cur.execute("SELECT eleve_id, moyenne_20 FROM eleve_moyennes")
-            for row in cur.fetchall():
-                # row est un dict via RealDictCursor
-                moyennes_map[row["eleve_id"]] = row["moyenne_20"]
-        except Exception:
-            conn.rollback()
-
-        # 6) Payload final
-        return jsonify({
-            "plans": plans,
-            "active_plan": active_plan,   # ← c'est le plan dont on renvoie seats/furniture/positions/walls
-            "seats": seats,
-            "furniture": furniture,
-            "positions": positions,
-            "eleves": [
-                {
-                    **dict(e),
-                    "moyenne_20": moyennes_map.get(e["id"]),
-                    # si pas de e.niveau, on retombe sur le niveau de la classe (si récupéré)
-                    "niveau": (dict(e).get("niveau") if "niveau" in dict(e) else classe_niveau)
-                }
-                for e in eleves
-            ],
-            "walls": api_walls  # ✅ murs renvoyés au front
-        })
+            if payload is None:
+                return jsonify({"full": True, "rev": revision})
+            resp = current_app.response_class(payload, mimetype="application/json")
+            resp.headers["Server-Timing"] = f"db;dur={(time.perf_counter() - t0) * 1000:.1f}"
+            return resp
+
+        shown_id, payload = fetch_plan_payload(conn, classe_id, requested_id)
+        db_ms = (time.perf_counter() - t0) * 1000
+        if requested_id is not None and shown_id is None:
+            # plan demandé inexistant ou n'appartenant pas à la classe
+            return jsonify({"ok": False, "error": "Plan introuvable pour cette classe"}), 404
+        resp = current_app.response_class(payload, mimetype="application/json")
+        resp.headers["Server-Timing"] = f"db;dur={db_ms:.1f}"
+        return resp
     finally:
-        cur.close()
         conn.close()
 
 from psycopg2.extras import RealDictCursor, Json
@@ -235,21 +160,15 @@ def api_upsert_walls(plan_id: int):
     """
     Upsert des murs pour un plan.
     Le front envoie: { "walls": [ { "id": "...", "points": [ { "x": int, "y": int }, ... ] }, ... ] }
-    Les x,y sont des ENTiers encodés (× PLAN_SUBDIV). On stocke tels quels en JSONB.
+    Les x,y sont des ENTiers encodés (× PLAN_SUBDIV). Les murs sont normalisés
+    avant stockage JSONB (voir walls.py : grille, doublons, colinéaires, simplification).
+    Réponse: { ok, rev, prev_rev, walls (normalisés), stats }
     """
     data = request.get_json(force=True) or {}
-    walls = data.get("walls", [])
-
-    if not isinstance(walls, list):
-        return jsonify({"ok": False, "error": "walls must be a list"}), 400
-
-    # Validation minimale de structure
-    for w in walls:
-        if not isinstance(w, dict) or "points" not in w:
-            return jsonify({"ok": False, "error": "invalid wall structure"}), 400
-        pts = w.get("points", [])
-        if not isinstance(pts, list):
-            return jsonify({"ok": False, "error": "invalid points"}), 400
+    try:
+        walls, stats = normalize_walls(data.get("walls", []))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
     conn = db_conn()
     cur = conn.cursor()
@@ -261,15 +180,18 @@ def api_upsert_walls(plan_id: int):
             return jsonify({"ok": False, "error": "Plan not found"}), 404
 
         # Upsert JSONB
+        rev = sync.bump_revision(cur, plan_id)
         cur.execute("""
-            INSERT INTO seating_plan_walls (plan_id, walls_json, updated_at)
-            VALUES (%s, %s, NOW())
+            INSERT INTO seating_plan_walls (plan_id, walls_json, updated_at, rev)
+            VALUES (%s, %s, NOW(), %s)
             ON CONFLICT (plan_id)
             DO UPDATE SET walls_json = EXCLUDED.walls_json,
-                          updated_at = NOW()
-        """, (plan_id, Json(walls)))
+                          updated_at = NOW(),
+                          rev = EXCLUDED.rev
+        """, (plan_id, Json(walls), rev))
+        history.record_revision(cur, plan_id, rev)
         conn.commit()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "rev": rev, "prev_rev": rev - 1, "walls": walls, "stats": stats})
     except Exception as e:
         conn.rollback()
         current_app.logger.exception("api_upsert_walls failed for plan %s", plan_id)
@@ -328,55 +250,107 @@ def api_activate_plan(plan_id: int):
 @seating_bp.post("/api/plans/<int:plan_id>/duplicate")
 def api_duplicate_plan(plan_id: int):
     """
-    Duplique un plan (meubles et positions). Le plan dupliqué est créé inactif.
+    Duplique un plan (places, meubles, positions, murs). Le plan dupliqué est créé inactif.
+    Copie « copy-on-write » : seul un snapshot est écrit ; les lignes du nouveau
+    plan sont créées à sa première ouverture (voir history.py).
+    Body JSON facultatif: { rev } -> dupliquer l'état d'une révision passée.
     """
-    conn = db_conn(); cur = conn.cursor()
+    data = request.get_json(silent=True) or {}
+    conn = db_conn()
     try:
-        cur.execute("SELECT classe_id, name, width, height, grid_size FROM seating_plans WHERE id=%s", (plan_id,))
-        src = cur.fetchone()
-        if not src: abort(404)
-        classe_id, name, width, height, grid_size = src
-        cur.execute("""
-          INSERT INTO seating_plans (classe_id,name,width,height,grid_size,is_active)
-          VALUES (%s,%s || ' (copie)',%s,%s,%s,FALSE) RETURNING id
-        """, (classe_id, name, width, height, grid_size))
-        new_id = cur.fetchone()[0]
-
-        # Copier seats / furniture / positions
-        cur.execute("""INSERT INTO seats (plan_id,label,x,y,w,h,rotation,z)
-                       SELECT %s, label, x, y, w, h, rotation, z FROM seats WHERE plan_id=%s""",
-                    (new_id, plan_id))
-        cur.execute("""INSERT INTO furniture_items (plan_id,type,label,x,y,w,h,rotation,z)
-                       SELECT %s, type, label, x, y, w, h, rotation, z FROM furniture_items WHERE plan_id=%s""",
-                    (new_id, plan_id))
-        cur.execute("""INSERT INTO seating_positions (plan_id, eleve_id, x, y, seat_id)
-                       SELECT %s, eleve_id, x, y, NULL FROM seating_positions WHERE plan_id=%s""",
-                    (new_id, plan_id))
+        # la copie part des lignes vivantes : une source elle-même copie non ouverte
+        # (aucune ligne) doit d'abord être matérialisée
+        history.ensure_materialized(conn, plan_id)
+        new_id = history.create_branch(conn, plan_id, data.get("rev"))
+        if new_id is None: abort(404)
         conn.commit()
         return jsonify({"ok": True, "plan_id": new_id}), 201
+    except LookupError:
+        conn.rollback()
+        return jsonify({"ok": False, "error": "Révision absente de l'historique"}), 404
+    finally:
+        conn.close()
+
+
+# ===== Historique des versions =====
+@seating_bp.get("/api/plans/<int:plan_id>/history")
+def api_plan_history(plan_id: int):
+    """
+    Révisions enregistrées du plan (plus récente d'abord).
+    Réponse: { ok, rev, revisions: [{ rev, kind: "snapshot"|"delta", created_at, size }] }
+    """
+    conn = db_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT revision FROM seating_plans WHERE id=%s", (plan_id,))
+        r = cur.fetchone()
+        if not r: abort(404)
+        return jsonify({"ok": True, "rev": r[0], "revisions": history.list_revisions(cur, plan_id)})
     finally:
         cur.close(); conn.close()
 
 
+@seating_bp.get("/api/plans/<int:plan_id>/history/<int:rev>")
+def api_plan_history_state(plan_id: int, rev: int):
+    """
+    Aperçu : état du plan à la révision <rev> (même format que le payload de
+    l'éditeur : seats / furniture / positions / walls), sans rien modifier.
+    """
+    conn = db_conn()
+    cur = conn.cursor()
+    try:
+        state = history.state_at(cur, plan_id, rev)
+        if state is None:
+            return jsonify({"ok": False, "error": "Révision absente de l'historique"}), 404
+        return jsonify({"ok": True, **state})
+    finally:
+        cur.close(); conn.close()
+
+
+@seating_bp.post("/api/plans/<int:plan_id>/history/<int:rev>/restore")
+def api_plan_history_restore(plan_id: int, rev: int):
+    """
+    Revient à l'état de la révision <rev>. La restauration est elle-même une
+    nouvelle révision : elle peut être annulée en restaurant la précédente.
+    Réponse: { ok, rev, prev_rev, restored_from }
+    """
+    conn = db_conn()
+    try:
+        res = history.restore_revision(conn, plan_id, rev)
+        conn.commit()
+        return jsonify({"ok": True, **res})
+    except LookupError:
+        conn.rollback()
+        return jsonify({"ok": False, "error": "Plan ou révision introuvable"}), 404
+    finally:
+        conn.close()
+
+
 @seating_bp.put("/api/plans/<int:plan_id>/positions")
 def api_upsert_positions(plan_id: int):
     """
-    Upsert des positions élèves pour un plan.
-    Body JSON: { positions: [{ eleve_id, x, y, seat_id? }, ...] }
+    Upsert des positions élèves pour un plan, en une seule requête.
+    Body JSON: { positions: [{ eleve_id, x, y, seat_id?, rotation? }, ...], full?: bool }
+      full=true : le lot est l'état complet -> les positions absentes sont supprimées.
+    Réponse: { ok, rev, prev_rev, upserted, deleted, ms } (+ en-tête Server-Timing)
     """
     data = request.get_json(force=True)
     items = data.get("positions", [])
-    conn = db_conn(); cur = conn.cursor()
+    full = bool(data.get("full"))
+    conn = db_conn()
+    cur = conn.cursor()
     try:
-        for it in items:
-            cur.execute("""
-              INSERT INTO seating_positions (plan_id, eleve_id, x, y, seat_id)
-              VALUES (%s,%s,%s,%s,%s)
-              ON CONFLICT (plan_id, eleve_id)
-              DO UPDATE SET x=EXCLUDED.x, y=EXCLUDED.y, seat_id=EXCLUDED.seat_id
-            """, (plan_id, it["eleve_id"], it["x"], it["y"], it.get("seat_id")))
+        t0 = time.perf_counter()
+        rev = sync.bump_revision(cur, plan_id)
+        if rev is None: abort(404)
+        upserted, deleted = sync.upsert_positions(cur, plan_id, items, rev, full_sync=full)
+        history.record_revision(cur, plan_id, rev)
         conn.commit()
-        return jsonify({"ok": True})
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        resp = jsonify({"ok": True, "rev": rev, "prev_rev": rev - 1,
+                        "upserted": upserted, "deleted": deleted, "ms": ms})
+        resp.headers["Server-Timing"] = f"db;dur={ms}"
+        return resp
     finally:
         cur.close(); conn.close()
 
@@ -389,11 +363,15 @@ def api_delete_position(plan_id: int):
     """
     data = request.get_json(force=True)
     eleve_id = int(data["eleve_id"])
-    conn = db_conn(); cur = conn.cursor()
+    conn = db_conn()
+    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM seating_positions WHERE plan_id=%s AND eleve_id=%s", (plan_id, eleve_id))
+        rev = sync.bump_revision(cur, plan_id)
+        if rev is None: abort(404)
+        sync.delete_positions(cur, plan_id, [eleve_id], rev)
+        history.record_revision(cur, plan_id, rev)
         conn.commit()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "rev": rev, "prev_rev": rev - 1})
     finally:
         cur.close(); conn.close()
 
@@ -401,30 +379,21 @@ def api_delete_position(plan_id: int):
 @seating_bp.put("/api/plans/<int:plan_id>/furniture")
 def api_upsert_furniture(plan_id: int):
     """
-    Upsert de meubles (insert si pas d'id, update sinon).
-    Body JSON: { furniture: [{ id?, type, label?, x,y,w,h, rotation?, z? }, ...] }
+    Upsert de meubles en une requête (insert si pas d'id, update sinon).
+    Body JSON: { furniture: [{ id?, client_uid?, type, label?, color?, x,y,w,h, rotation?, z?, radius? }, ...] }
+    Réponse: { ok, rev, prev_rev, created: {client_uid: id} } (ids des meubles créés)
     """
     data = request.get_json(force=True)
     items = data.get("furniture", [])
-    conn = db_conn(); cur = conn.cursor()
+    conn = db_conn()
+    cur = conn.cursor()
     try:
-        for it in items:
-            fid = it.get("id")
-            if fid:
-                cur.execute("""
-                  UPDATE furniture_items
-                     SET type=%s, label=%s, x=%s, y=%s, w=%s, h=%s, rotation=%s, z=%s
-                   WHERE id=%s AND plan_id=%s
-                """, (it["type"], it.get("label"), it["x"], it["y"], it["w"], it["h"],
-                      it.get("rotation",0), it.get("z",0), fid, plan_id))
-            else:
-                cur.execute("""
-                  INSERT INTO furniture_items (plan_id,type,label,x,y,w,h,rotation,z)
-                  VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                """, (plan_id, it["type"], it.get("label"), it["x"], it["y"], it["w"], it["h"],
-                      it.get("rotation",0), it.get("z",0)))
+        rev = sync.bump_revision(cur, plan_id)
+        if rev is None: abort(404)
+        created = sync.upsert_furniture(cur, plan_id, items, rev)
+        history.record_revision(cur, plan_id, rev)
         conn.commit()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "rev": rev, "prev_rev": rev - 1, "created": created})
     finally:
         cur.close(); conn.close()
 
@@ -434,15 +403,49 @@ def api_delete_furniture(plan_id: int, item_id: int):
     """
     Supprime un meuble par id pour ce plan.
     """
-    conn = db_conn(); cur = conn.cursor()
+    conn = db_conn()
+    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM furniture_items WHERE plan_id=%s AND id=%s", (plan_id, item_id))
+        rev = sync.bump_revision(cur, plan_id)
+        if rev is None: abort(404)
+        sync.delete_furniture(cur, plan_id, [item_id], rev)
+        history.record_revision(cur, plan_id, rev)
         conn.commit()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "rev": rev, "prev_rev": rev - 1})
     finally:
         cur.close(); conn.close()
 
 
+@seating_bp.post("/api/plans/<int:plan_id>/ops")
+def api_plan_ops(plan_id: int):
+    """
+    Applique un lot d'opérations de l'éditeur (une transaction, une révision).
+    Body JSON: { ops: [{ op: "move"|"update"|"create"|"delete", kind: "position"|"furniture", ... }] }
+    Réponse: { ok, rev, prev_rev, created: {client_uid: id} }
+      prev_rev permet au client de savoir si d'autres écritures se sont intercalées.
+    """
+    data = request.get_json(force=True) or {}
+    ops = data.get("ops") or []
+    if not isinstance(ops, list):
+        return jsonify({"ok": False, "error": "ops must be a list"}), 400
+
+    conn = db_conn()
+    try:
+        res = sync.apply_ops(conn, plan_id, ops)
+        with conn.cursor() as cur:
+            history.record_revision(cur, plan_id, res["rev"])
+        conn.commit()
+        return jsonify({"ok": True, **res})
+    except LookupError:
+        conn.rollback()
+        return jsonify({"ok": False, "error": "Plan not found"}), 404
+    except (ValueError, KeyError, TypeError) as e:
+        conn.rollback()
+        return jsonify({"ok": False, "error": f"opération invalide : {e}"}), 400
+    finally:
+        conn.close()
+
+
 @seating_bp.post("/api/plans/<int:plan_id>/reset")
 def api_reset_plan(plan_id: int):
     """
@@ -453,20 +456,25 @@ def api_reset_plan(plan_id: int):
     data = request.get_json(silent=True) or {}
     full = bool(data.get("full"))
 
-    conn = db_conn(); cur = conn.cursor()
+    conn = db_conn()
+    cur = conn.cursor()
     try:
-        # Vérifie existence du plan
-        cur.execute("SELECT 1 FROM seating_plans WHERE id=%s", (plan_id,))
-        if not cur.fetchone():
+        # Vérifie existence du plan (et passe à la révision suivante)
+        rev = sync.bump_revision(cur, plan_id)
+        if rev is None:
             abort(404)
 
         # 1) Supprimer d'abord les positions (FK vers seats possibles)
-        cur.execute("DELETE FROM seating_positions WHERE plan_id=%s", (plan_id,))
-        deleted_positions = cur.rowcount or 0
+        cur.execute("DELETE FROM seating_positions WHERE plan_id=%s RETURNING eleve_id", (plan_id,))
+        gone = [r[0] for r in cur.fetchall()]
+        sync.record_tombstones(cur, plan_id, sync.POSITION, gone, rev)
+        deleted_positions = len(gone)
 
         # 2) Puis les meubles
-        cur.execute("DELETE FROM furniture_items WHERE plan_id=%s", (plan_id,))
-        deleted_furniture = cur.rowcount or 0
+        cur.execute("DELETE FROM furniture_items WHERE plan_id=%s RETURNING id", (plan_id,))
+        gone = [r[0] for r in cur.fetchall()]
+        sync.record_tombstones(cur, plan_id, sync.FURNITURE, gone, rev)
+        deleted_furniture = len(gone)
 
         # 3) Optionnel : reset complet -> seats
         deleted_seats = 0
@@ -474,10 +482,13 @@ def api_reset_plan(plan_id: int):
             cur.execute("DELETE FROM seats WHERE plan_id=%s", (plan_id,))
             deleted_seats = cur.rowcount or 0
 
+        history.record_revision(cur, plan_id, rev)
         conn.commit()
         return jsonify({
             "ok": True,
             "full": full,
+            "rev": rev,
+            "prev_rev": rev - 1,
             "deleted": {
                 "positions": deleted_positions,
                 "furniture": deleted_furniture,
@@ -488,81 +499,230 @@ def api_reset_plan(plan_id: int):
         cur.close(); conn.close()
 
 
-# ===== Export PDF =====
-@seating_bp.get("/api/plans/<int:plan_id>/export/pdf")
-def api_export_pdf(plan_id: int):
+# ===== Placement automatique =====
+SOLVE_MIN_ITERATIONS = 1_000
+SOLVE_MAX_ITERATIONS = 200_000  # borne le temps CPU d'une requête (recuit en pur Python)
+
+
+@seating_bp.post("/api/plans/<int:plan_id>/solve")
+def api_solve_plan(plan_id: int):
     """
-    Exporte une vue très simple du plan au format PDF (ReportLab).
+    Place les élèves de la classe sur les places du plan (voir solver.py).
+    Places = table `seats` du plan, ou à défaut places dérivées des tables (meubles).
+    Body JSON (tout est facultatif) :
+      { seed, iterations, eleve_ids: [...], apply: bool,
+        constraints: { apart: [[a,b]], together: [[a,b]], near: {board: [ids], desk: [ids]},
+                       alternate_sexe, mix_niveau, mix_moyenne } }
+    Réponse: { ok, positions: [{eleve_id, seat_id, x, y}], cost, initial_cost, iterations, ms,
+               applied, rev? }  — avec apply=true les positions remplacent celles du plan.
     """
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
+    data = request.get_json(silent=True) or {}
+    constraints = data.get("constraints") or {}
+    try:
+        only = {int(i) for i in data.get("eleve_ids") or []}
+        seed = int(data.get("seed") or 0)
+        iterations = data.get("iterations")
+        if iterations is not None:
+            iterations = min(max(int(iterations), SOLVE_MIN_ITERATIONS), SOLVE_MAX_ITERATIONS)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "seed, iterations et eleve_ids doivent être des entiers"}), 400
+    S = solver.PLAN_SUBDIV
 
-    conn = db_conn(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    conn = db_conn()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cur.execute("SELECT * FROM seating_plans WHERE id=%s", (plan_id,))
+        if data.get("apply"):
+            history.ensure_materialized(conn, plan_id)  # écriture : la copie reçoit ses lignes
+        cur.execute("SELECT classe_id, materialized FROM seating_plans WHERE id=%s", (plan_id,))
         plan = cur.fetchone()
-        if not plan: abort(404)
-        cur.execute("SELECT * FROM furniture_items WHERE plan_id=%s", (plan_id,))
-        furn = cur.fetchall()
+        if not plan:
+            return jsonify({"ok": False, "error": "Plan not found"}), 404
+        classe_id = plan["classe_id"]
+
+        if plan["materialized"]:
+            cur.execute("SELECT id, x, y, w, h FROM seats WHERE plan_id=%s ORDER BY id", (plan_id,))
+            seat_rows = cur.fetchall()
+            cur.execute("SELECT id, type, x, y, w, h FROM furniture_items WHERE plan_id=%s", (plan_id,))
+            furniture_rows = cur.fetchall()
+        else:
+            # aperçu d'une copie jamais ouverte : lu dans son snapshot, sans la matérialiser
+            # (places sans id : les positions proposées n'ont pas de seat_id)
+            with conn.cursor() as hcur:
+                state = history.state_at(hcur, plan_id, 0) or {}
+            seat_rows = [{**t, "id": None} for t in state.get("seats") or []]
+            furniture_rows = state.get("furniture") or []
+        seats = [{"id": r["id"], "x": r["x"] / S, "y": r["y"] / S,
+                  "w": (r["w"] or S) / S, "h": (r["h"] or S) / S} for r in seat_rows]
+        furniture = [{"id": r["id"], "type": r["type"],
+                      "x": r["x"] / S, "y": r["y"] / S, "w": r["w"] / S, "h": r["h"] / S}
+                     for r in furniture_rows]
+        if not seats:
+            seats = solver.seats_from_furniture(furniture)
+        targets = {}
+        for f in furniture:
+            if f["type"] in ("board", "desk"):
+                targets.setdefault(f["type"], []).append((f["x"] + f["w"] / 2, f["y"] + f["h"] / 2))
+
         cur.execute("""
-            SELECT p.*, e.prenom, e.nom
-            FROM seating_positions p
-            JOIN eleves e ON e.id = p.eleve_id
-            WHERE p.plan_id=%s
-        """, (plan_id,))
-        pos = cur.fetchall()
+            SELECT e.id, e.sexe, to_jsonb(e) ->> 'niveau' AS niveau
+            FROM eleves e
+            WHERE e.classe_id=%s
+              AND NOT COALESCE((to_jsonb(e) ->> 'import_absent')::boolean, FALSE)
+            ORDER BY e.id
+        """, (classe_id,))
+        moyennes = moyennes_classe(conn, classe_id)
+        students = [{**r, "moyenne_20": moyennes.get(r["id"])}
+                    for r in cur.fetchall() if not only or r["id"] in only]
+
+        try:
+            res = solver.solve(seats, students, targets, constraints,
+                               seed=seed, iterations=iterations)
+        except ValueError as e:
+            return jsonify({"ok": False, "error": str(e)}), 422
+
+        positions = []
+        for a in res.pop("assignments"):
+            seat = seats[a["seat_index"]]
+            positions.append({"eleve_id": a["eleve_id"], "seat_id": seat["id"],
+                              "x": round(seat["x"] * S), "y": round(seat["y"] * S)})
+
+        out = {"ok": True, "positions": positions, "applied": False, **res}
+        if data.get("apply"):
+            rev = sync.bump_revision(cur, plan_id)
+            sync.upsert_positions(cur, plan_id, positions, rev, full_sync=True)
+            history.record_revision(cur, plan_id, rev)
+            conn.commit()
+            out.update(applied=True, rev=rev, prev_rev=rev - 1)
+        return jsonify(out)
     finally:
         cur.close(); conn.close()
 
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    W,H = A4
-    margin = 12*mm
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, H-margin, f"Plan de classe — {plan['name']}  ({plan['width']}×{plan['height']} unités)")
-
-    # grille (échelle simple)
-    scale = 8
-    origin_x = margin
-    origin_y = H - margin - (plan["height"]*scale)
-
-    c.setStrokeGray(0.85)
-    for gx in range(plan["width"]+1):
-        x = origin_x + gx*scale
-        c.line(x, origin_y, x, origin_y + plan["height"]*scale)
-    for gy in range(plan["height"]+1):
-        y = origin_y + gy*scale
-        c.line(origin_x, y, origin_x + plan["width"]*scale, y)
-
-    # meubles
-    c.setStrokeGray(0.2); c.setFillGray(0.9)
-    for f in furn:
-        x = origin_x + f["x"]*scale
-        y = origin_y + f["y"]*scale
-        c.rect(x, y, f["w"]*scale, f["h"]*scale, fill=1)
-        if f.get("label"):
-            c.setFont("Helvetica", 8)
-            c.setFillGray(0.2)
-            c.drawString(x+2, y+(f["h"]*scale)/2, f["label"])
-
-    # positions élèves
-    c.setFillGray(0)
-    for p in pos:
-        x = origin_x + p["x"]*scale
-        y = origin_y + p["y"]*scale
-        c.circle(x+5, y+5, 4, stroke=1, fill=0)
-        c.setFont("Helvetica", 7)
-        c.drawString(x+12, y+2, f"{p['nom'].upper()} {p['prenom']}")
-
-    c.showPage(); c.save()
-    buf.seek(0)
-    return send_file(
-        buf,
-        mimetype="application/pdf",
-        as_attachment=True,
-        download_name=f"plan_classe_{plan_id}.pdf"
+
+# ===== Export PDF / SVG =====
+EXPORT_MIMETYPES = {"pdf": "application/pdf", "svg": "image/svg+xml"}
+EXPORT_WAIT_S = 10  # au-delà, on rend la main (202) et le client repasse plus tard
+
+
+def _db_conn_factory():
+    """Fabrique de connexions utilisable hors requête (threads de rendu)."""
+    app = current_app._get_current_object()
+
+    def factory():
+        with app.app_context():
+            return db_conn()
+    return factory
+
+
+@seating_bp.get("/api/plans/<int:plan_id>/export/<string:fmt>")
+def api_export_plan(plan_id: int, fmt: str):
+    """
+    Export vectoriel du plan (PDF A4 paysage ou SVG) : murs, places, meubles
+    (avec rotation) et élèves. Le fichier est mis en cache par révision du plan :
+    un re-téléchargement sans modification est servi directement.
+    Le rendu se fait dans le pool de rendu ; si trop long -> 202 { retry_after }.
+    """
+    from concurrent.futures import TimeoutError as FutureTimeout
+    if fmt not in EXPORT_MIMETYPES:
+        abort(404)
+
+    conn = db_conn()
+    try:
+        history.ensure_materialized(conn, plan_id)
+        key = render.plan_fingerprint(conn, plan_id)
+    finally:
+        conn.close()
+    if key is None:
+        abort(404)
+
+    path = render.cached_export(key, fmt)
+    if path is None:
+        future = render.submit_render(_db_conn_factory(), plan_id, key, fmt)
+        try:
+            path = future.result(timeout=EXPORT_WAIT_S)
+        except FutureTimeout:
+            resp = jsonify({"ok": False, "pending": True, "retry_after": 2})
+            resp.headers["Retry-After"] = "2"
+            return resp, 202
+        except LookupError:
+            abort(404)
+
+    resp = send_file(
+        path,
+        mimetype=EXPORT_MIMETYPES[fmt],
+        as_attachment=(fmt == "pdf"),
+        download_name=f"plan_classe_{plan_id}.{fmt}",
+        max_age=0,
     )
+    resp.headers["ETag"] = f'"{key}"'
+    return resp
+
+
+THUMB_MIMETYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+
+@seating_bp.get("/api/plans/<int:plan_id>/thumb.<string:fmt>")
+def api_plan_thumbnail(plan_id: int, fmt: str):
+    """
+    Vignette du plan (murs, places, meubles, élèves ; sans texte) pour le
+    sélecteur de plans. Cachée sur disque par révision.
+    Avec ?v=<révision courante>, l'URL change à chaque modification du plan :
+    la réponse est alors cachable indéfiniment par le navigateur.
+    """
+    if fmt not in THUMB_MIMETYPES:
+        abort(404)
+    conn = db_conn()
+    try:
+        try:
+            path, revision = render.thumbnail(conn, plan_id, fmt)
+        except ImportError:
+            return jsonify({"ok": False, "error": "Vignette PNG indisponible (Pillow absent)"}), 501
+    finally:
+        conn.close()
+    if path is None:
+        abort(404)
+
+    immutable = request.args.get("v") == str(revision)
+    resp = send_file(path, mimetype=THUMB_MIMETYPES[fmt], max_age=0, etag=os.path.basename(path))
+    resp.headers["Cache-Control"] = ("public, max-age=31536000, immutable" if immutable
+                                     else "no-cache")
+    return resp
+
+
+@seating_bp.post("/api/export/plans")
+def api_export_plans_batch():
+    """
+    Impression de plusieurs plans (ex. plusieurs classes) en tâche de fond.
+    Body JSON: { plan_ids: [...], format: "pdf"|"svg" }  (pdf = une page par plan, svg = zip)
+    Réponse 202: { ok, job_id, status_url }
+    """
+    data = request.get_json(force=True) or {}
+    fmt = data.get("format", "pdf")
+    try:
+        plan_ids = [int(i) for i in data.get("plan_ids") or []]
+    except (TypeError, ValueError):
+        plan_ids = []
+    if fmt not in EXPORT_MIMETYPES or not plan_ids:
+        return jsonify({"ok": False, "error": "plan_ids et format (pdf|svg) requis"}), 400
+    job_id = render.submit_batch(_db_conn_factory(), plan_ids, fmt)
+    return jsonify({"ok": True, "job_id": job_id,
+                    "status_url": f"{request.script_root}{seating_bp.url_prefix or ''}/api/export/jobs/{job_id}"}), 202
+
+
+@seating_bp.get("/api/export/jobs/<string:job_id>")
+def api_export_job(job_id: str):
+    """
+    Suivi d'une impression groupée ; ?download=1 renvoie le fichier une fois prêt.
+    """
+    job = render.job_status(job_id)
+    if not job:
+        abort(404)
+    if request.args.get("download") and job["status"] == "done":
+        ext = "pdf" if job["fmt"] == "pdf" else "zip"
+        return send_file(job["path"], as_attachment=True,
+                         mimetype=EXPORT_MIMETYPES["pdf"] if ext == "pdf" else "application/zip",
+                         download_name=f"plans_de_classe.{ext}")
+    return jsonify({"ok": job["status"] != "error",
+                    **{k: job.get(k) for k in ("status", "total", "done", "error", "finished")}})
 
 
 # ----- SUPPRESSION D'UN PLAN -----
@@ -609,3 +769,12 @@ def api_delete_plan(plan_id: int):
 def api_delete_plan_alt(plan_id: int):
     # réutilise la logique ci-dessus
     return api_delete_plan(plan_id)
+
+
+@seating_bp.get("/api/moyennes/status")
+def api_moyennes_status():
+    """
+    État du rafraîchissement de fond de eleve_moyennes_mv
+    (dernier refresh, âge en secondes, refresh en attente, dernière erreur).
+    """
+    return jsonify(moyennes_refresher_status())
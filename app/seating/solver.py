@@ -0,0 +1,305 @@
+# solver.py
+# =============================================================================
+# Placement automatique des élèves sur les places d'un plan (recuit simulé).
+#
+# Entrées (pures, sans BDD) :
+#   seats    : [{id, x, y, w, h, table}]      coordonnées en unités du plan
+#   students : [{id, sexe, niveau, moyenne_20}]
+#   targets  : {"board": [(x, y), ...], "desk": [(x, y), ...]}  centres des meubles
+#   constraints :
+#     apart    : [[a, b], ...]   élèves à éloigner
+#     together : [[a, b], ...]   élèves à placer côte à côte
+#     near     : {"board": [ids], "desk": [ids]}
+#     alternate_sexe / mix_niveau / mix_moyenne : bool (défaut True)
+#
+# Recherche : permutations élèves -> places (échange de deux élèves ou
+# déplacement vers une place libre), coût recalculé localement à chaque pas.
+# Résultat déterministe pour une graine donnée.
+#
+# Bench : python -m app.seating.solver bench [--seed 1] [--runs 5]
+# =============================================================================
+import sys
+import math
+import time
+import random
+import argparse
+import statistics
+
+# Poids des critères (coût à minimiser)
+WEIGHTS = {
+    "apart": 8.0,      # par unité manquante sous APART_MIN
+    "together": 6.0,   # par unité au-delà du voisinage
+    "near": 3.0,       # par unité de distance à la cible
+    "sexe": 1.0,       # par paire de voisins de même sexe
+    "niveau": 1.0,     # par paire de voisins de même niveau
+    "moyenne": 0.15,   # écart² de la moyenne d'une table à la moyenne générale
+}
+PLAN_SUBDIV = 32       # coordonnées stockées en entiers x PLAN_SUBDIV (cf. plan_classe.js)
+APART_MIN = 4.0        # distance (unités) en dessous de laquelle "apart" coûte
+NEIGHBOR_DIST = 1.6    # deux places à moins de cette distance sont voisines
+
+# Meubles "table" -> places dérivées si le plan n'a pas de places enregistrées
+TABLE_TYPES = {"table_rect", "table_round"}
+
+
+def seats_from_furniture(furniture):
+    """
+    Places dérivées des tables : une place par unité de largeur pour une table
+    rectangulaire, quatre autour d'une table ronde. `table` = id du meuble.
+    """
+    seats = []
+    for f in furniture:
+        if (f.get("type") or "") not in TABLE_TYPES:
+            continue
+        x, y, w, h = float(f["x"]), float(f["y"]), float(f["w"]), float(f["h"])
+        if f["type"] == "table_round":
+            cx, cy = x + w / 2, y + h / 2
+            spots = [(cx - 0.5, y - 1), (x + w, cy - 0.5), (cx - 0.5, y + h), (x - 1, cy - 0.5)]
+        else:
+            spots = [(x + i, y + h) for i in range(max(1, int(round(w))))]
+        for i, (sx, sy) in enumerate(spots):
+            seats.append({"id": None, "key": f"f{f['id']}-{i}", "x": sx, "y": sy,
+                          "w": 1.0, "h": 1.0, "table": f"f{f['id']}"})
+    return seats
+
+
+def _tables_by_adjacency(centers):
+    """Groupes de places contiguës (composantes connexes du voisinage)."""
+    n = len(centers)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            if math.dist(centers[i], centers[j]) <= NEIGHBOR_DIST:
+                parent[find(i)] = find(j)
+    return [find(i) for i in range(n)]
+
+
+class _Problem:
+    def __init__(self, seats, students, targets, constraints):
+        if len(students) > len(seats):
+            raise ValueError(f"{len(students)} élèves pour {len(seats)} places")
+        c = constraints or {}
+        self.seats = seats
+        self.students = students
+        self.n, self.m = len(students), len(seats)
+
+        centers = [(s["x"] + s.get("w", 1) / 2, s["y"] + s.get("h", 1) / 2) for s in seats]
+        self.dist = [[math.dist(a, b) for b in centers] for a in centers]
+        self.neigh = [[j for j in range(self.m) if j != i and self.dist[i][j] <= NEIGHBOR_DIST]
+                      for i in range(self.m)]
+        if all(s.get("table") is not None for s in seats):
+            keys = [s["table"] for s in seats]
+        else:
+            keys = _tables_by_adjacency(centers)
+        ids = {k: t for t, k in enumerate(dict.fromkeys(keys))}
+        self.table = [ids[k] for k in keys]
+        self.nb_tables = len(ids)
+
+        idx = {st["id"]: i for i, st in enumerate(students)}
+        self.sexe = [(st.get("sexe") or "")[:1].upper() or None for st in students]
+        self.niveau = [st.get("niveau") or None for st in students]
+        self.moy = [st.get("moyenne_20") for st in students]
+        known = [m for m in self.moy if m is not None]
+        self.moy_mean = statistics.fmean(known) if known else None
+
+        self.w_sexe = WEIGHTS["sexe"] if c.get("alternate_sexe", True) else 0.0
+        self.w_niv = WEIGHTS["niveau"] if c.get("mix_niveau", True) else 0.0
+        self.w_moy = WEIGHTS["moyenne"] if c.get("mix_moyenne", True) and known else 0.0
+
+        # paires (élève -> [(autre, type)])
+        self.pairs = [[] for _ in range(self.n)]
+        for kind in ("apart", "together"):
+            for a, b in c.get(kind) or []:
+                if a in idx and b in idx and a != b:
+                    self.pairs[idx[a]].append((idx[b], kind))
+                    self.pairs[idx[b]].append((idx[a], kind))
+
+        # coût unaire (distance à la cible) : unary[i][seat] ou None
+        self.unary = [None] * self.n
+        for kind, eleve_ids in (c.get("near") or {}).items():
+            pts = (targets or {}).get(kind) or []
+            if not pts:
+                continue
+            for eid in eleve_ids:
+                i = idx.get(eid)
+                if i is None:
+                    continue
+                row = [WEIGHTS["near"] * min(math.dist(centers[s], p) for p in pts) for s in range(self.m)]
+                self.unary[i] = row if self.unary[i] is None else [u + v for u, v in zip(self.unary[i], row)]
+
+    # --- coût ---
+    def student_terms(self, i, seat_of, occupant, exclude):
+        """Termes touchant l'élève i, sans recompter ceux des élèves de `exclude` d'indice > i."""
+        s = seat_of[i]
+        cost = self.unary[i][s] if self.unary[i] is not None else 0.0
+        for j, kind in self.pairs[i]:
+            if j in exclude and j < i:
+                continue
+            d = self.dist[s][seat_of[j]]
+            if kind == "apart":
+                cost += WEIGHTS["apart"] * max(0.0, APART_MIN - d)
+            else:
+                cost += WEIGHTS["together"] * max(0.0, d - NEIGHBOR_DIST)
+        if self.w_sexe or self.w_niv:
+            for t in self.neigh[s]:
+                j = occupant[t]
+                if j < 0 or (j in exclude and j < i):
+                    continue
+                if self.w_sexe and self.sexe[i] and self.sexe[i] == self.sexe[j]:
+                    cost += self.w_sexe
+                if self.w_niv and self.niveau[i] and self.niveau[i] == self.niveau[j]:
+                    cost += self.w_niv
+        return cost
+
+    def table_cost(self, sums, counts, t):
+        if not self.w_moy or not counts[t]:
+            return 0.0
+        return self.w_moy * counts[t] * (sums[t] / counts[t] - self.moy_mean) ** 2
+
+    def total(self, seat_of, occupant, sums, counts):
+        every = set(range(self.n))
+        cost = sum(self.student_terms(i, seat_of, occupant, every) for i in range(self.n))
+        return cost + sum(self.table_cost(sums, counts, t) for t in range(self.nb_tables))
+
+
+def solve(seats, students, targets=None, constraints=None, seed=0, iterations=None):
+    """
+    Retourne {assignments: [{eleve_id, seat_index}], cost, initial_cost, iterations, ms}.
+    """
+    t0 = time.perf_counter()
+    p = _Problem(seats, students, targets, constraints)
+    rng = random.Random(seed)
+    n, m = p.n, p.m
+    if n == 0:
+        return {"assignments": [], "cost": 0.0, "initial_cost": 0.0, "iterations": 0,
+                "ms": round((time.perf_counter() - t0) * 1000, 1)}
+    iterations = iterations or max(4000, 300 * n)
+
+    order = list(range(m))
+    rng.shuffle(order)
+    seat_of = order[:n]
+    occupant = [-1] * m
+    for i, s in enumerate(seat_of):
+        occupant[s] = i
+    sums = [0.0] * p.nb_tables
+    counts = [0] * p.nb_tables
+    for i, s in enumerate(seat_of):
+        if p.moy[i] is not None:
+            sums[p.table[s]] += p.moy[i]
+            counts[p.table[s]] += 1
+
+    cost = initial = p.total(seat_of, occupant, sums, counts)
+    best, best_seats = cost, list(seat_of)
+
+    # température : de ~coût moyen d'un mauvais échange vers quasi 0
+    t_start, t_end = 2.0, 0.01
+    alpha = (t_end / t_start) ** (1.0 / iterations)
+    temp = t_start
+
+    for _ in range(iterations):
+        a = rng.randrange(n)
+        target = rng.randrange(m)
+        sa, b = seat_of[a], occupant[target]
+        if target == sa:
+            temp *= alpha
+            continue
+        moved = (a,) if b < 0 else (a, b)
+        ex = set(moved)
+        tables = {p.table[sa], p.table[target]}
+
+        before = sum(p.student_terms(i, seat_of, occupant, ex) for i in moved)
+        before += sum(p.table_cost(sums, counts, t) for t in tables)
+
+        _apply_move(p, seat_of, occupant, sums, counts, a, b, sa, target)
+
+        after = sum(p.student_terms(i, seat_of, occupant, ex) for i in moved)
+        after += sum(p.table_cost(sums, counts, t) for t in tables)
+        delta = after - before
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temp):
+            cost += delta
+            if cost < best - 1e-9:
+                best, best_seats = cost, list(seat_of)
+        else:
+            _apply_move(p, seat_of, occupant, sums, counts, a, b, target, sa)
+        temp *= alpha
+
+    return {
+        "assignments": [{"eleve_id": p.students[i]["id"], "seat_index": s} for i, s in enumerate(best_seats)],
+        "cost": round(best, 3),
+        "initial_cost": round(initial, 3),
+        "iterations": iterations,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+def _apply_move(p, seat_of, occupant, sums, counts, a, b, sa, target):
+    """Déplace a de sa vers target ; b (occupant de target, ou -1) prend sa."""
+    ta, tt = p.table[sa], p.table[target]
+    if p.moy[a] is not None and ta != tt:
+        sums[ta] -= p.moy[a]; counts[ta] -= 1
+        sums[tt] += p.moy[a]; counts[tt] += 1
+    if b >= 0 and p.moy[b] is not None and ta != tt:
+        sums[tt] -= p.moy[b]; counts[tt] -= 1
+        sums[ta] += p.moy[b]; counts[ta] += 1
+    seat_of[a], occupant[target] = target, a
+    occupant[sa] = b
+    if b >= 0:
+        seat_of[b] = sa
+
+
+# ===== Bench =====
+def _bench_case(seed=1, nb_tables=20, nb_students=30):
+    """20 tables de 2 places (40 places) en 5 rangées, 30 élèves variés."""
+    rng = random.Random(seed)
+    seats = []
+    for t in range(nb_tables):
+        row, col = divmod(t, 4)
+        for k in range(2):
+            seats.append({"id": len(seats) + 1, "x": 2 + col * 6 + k, "y": 4 + row * 3,
+                          "w": 1, "h": 1, "table": t})
+    students = [{
+        "id": 100 + i,
+        "sexe": rng.choice(["F", "M"]),
+        "niveau": rng.choice(["CM1", "CM2"]),
+        "moyenne_20": round(rng.uniform(6, 19), 1),
+    } for i in range(nb_students)]
+    ids = [s["id"] for s in students]
+    constraints = {
+        "apart": [ids[0:2], ids[2:4], ids[4:6]],
+        "together": [ids[6:8]],
+        "near": {"board": ids[8:11], "desk": ids[11:12]},
+    }
+    targets = {"board": [(13, 0.5)], "desk": [(2, 1.5)]}
+    return seats, students, targets, constraints
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.seating.solver")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    pb = sub.add_parser("bench", help="30 élèves x 40 places, graines déterministes")
+    pb.add_argument("--seed", type=int, default=1)
+    pb.add_argument("--runs", type=int, default=5)
+    pb.add_argument("--iterations", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    seats, students, targets, constraints = _bench_case()
+    times = []
+    for k in range(args.runs):
+        r = solve(seats, students, targets, constraints, seed=args.seed + k, iterations=args.iterations)
+        times.append(r["ms"])
+        print(f"graine {args.seed + k}: coût {r['initial_cost']} -> {r['cost']} "
+              f"({r['iterations']} itérations, {r['ms']} ms)")
+    print(f"médiane : {statistics.median(times)} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
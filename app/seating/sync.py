@@ -0,0 +1,212 @@
+# sync.py
+# =============================================================================
+# Révisions par plan & écritures versionnées de l'éditeur
+# - seating_plans.revision : compteur croissant, +1 à chaque écriture du plan
+# - <table>.rev            : révision de la dernière écriture de la ligne
+# - seating_tombstones     : suppressions (meuble par id, position par eleve_id)
+# - seating_plan_history   : historique des révisions (voir history.py)
+# Colonnes et tables : migration « seating_sync » (app/schema.py).
+#
+# Le client envoie des opérations (move / update / create / delete) et récupère
+# ensuite uniquement ce qui a changé via GET /api/plans/<classe_id>?plan_id=..&since=<rev>
+# (voir payload.fetch_plan_delta).
+# =============================================================================
+from psycopg2.extras import Json
+
+POSITION = "position"
+FURNITURE = "furniture"
+
+
+def bump_revision(cur, plan_id: int):
+    """
+    Incrémente la révision du plan (verrouille la ligne : les écritures d'un même
+    plan sont sérialisées). Retourne la nouvelle révision, None si plan absent.
+    Une copie pas encore matérialisée (voir history.py) l'est au passage.
+    """
+    cur.execute(
+        "UPDATE seating_plans SET revision = revision + 1 WHERE id=%s RETURNING revision, materialized",
+        (plan_id,)
+    )
+    r = cur.fetchone()
+    if not r:
+        return None
+    if not r[1]:
+        from .history import materialize
+        materialize(cur, plan_id)
+    return r[0]
+
+
+def record_tombstones(cur, plan_id: int, kind: str, ids, rev: int):
+    if not ids:
+        return
+    cur.execute("""
+      INSERT INTO seating_tombstones (plan_id, kind, entity_id, rev)
+      SELECT %s, %s, unnest(%s::int[]), %s
+      ON CONFLICT (plan_id, kind, entity_id) DO UPDATE SET rev = EXCLUDED.rev
+    """, (plan_id, kind, list(ids), rev))
+
+
+# ===== Écritures versionnées =====
+def upsert_positions(cur, plan_id: int, items, rev: int, full_sync: bool = False) -> tuple:
+    """
+    items: [{eleve_id, x, y, seat_id?, rotation?}, ...] — une seule requête pour le lot.
+    full_sync=True : le lot décrit TOUT le plan -> les positions absentes sont
+    supprimées dans la même requête (et enregistrées comme suppressions).
+    Retourne (nb upserts, nb suppressions).
+    """
+    # une ligne par élève (la dernière l'emporte) : ON CONFLICT refuse les doublons
+    rows = list({int(it["eleve_id"]): {
+        "eleve_id": int(it["eleve_id"]), "x": it["x"], "y": it["y"],
+        "seat_id": it.get("seat_id"), "rotation": it.get("rotation"),
+    } for it in items}.values())
+    if not rows and not full_sync:
+        return 0, 0
+    cur.execute("""
+      WITH v AS (
+        SELECT * FROM jsonb_to_recordset(%(rows)s::jsonb)
+          AS v(eleve_id int, x int, y int, seat_id int, rotation int)
+      ),
+      up AS (
+        INSERT INTO seating_positions (plan_id, eleve_id, x, y, seat_id, rotation, rev)
+        SELECT %(plan_id)s, eleve_id, x, y, seat_id, COALESCE(rotation, 0), %(rev)s FROM v
+        ON CONFLICT (plan_id, eleve_id)
+        DO UPDATE SET x=EXCLUDED.x, y=EXCLUDED.y, seat_id=EXCLUDED.seat_id,
+                      rotation=EXCLUDED.rotation, rev=EXCLUDED.rev
+        RETURNING eleve_id
+      ),
+      del AS (
+        DELETE FROM seating_positions sp
+        WHERE %(full)s AND sp.plan_id = %(plan_id)s
+          AND NOT EXISTS (SELECT 1 FROM v WHERE v.eleve_id = sp.eleve_id)
+        RETURNING sp.eleve_id
+      ),
+      tomb AS (
+        INSERT INTO seating_tombstones (plan_id, kind, entity_id, rev)
+        SELECT %(plan_id)s, %(kind)s, eleve_id, %(rev)s FROM del
+        ON CONFLICT (plan_id, kind, entity_id) DO UPDATE SET rev = EXCLUDED.rev
+      ),
+      revived AS (
+        DELETE FROM seating_tombstones t
+        WHERE t.plan_id = %(plan_id)s AND t.kind = %(kind)s
+          AND t.entity_id IN (SELECT eleve_id FROM v)
+      )
+      SELECT (SELECT count(*) FROM up), (SELECT count(*) FROM del)
+    """, {"rows": Json(rows), "plan_id": plan_id, "rev": rev, "full": bool(full_sync), "kind": POSITION})
+    upserted, deleted = cur.fetchone()
+    return upserted, deleted
+
+
+def delete_positions(cur, plan_id: int, eleve_ids, rev: int):
+    cur.execute(
+        "DELETE FROM seating_positions WHERE plan_id=%s AND eleve_id = ANY(%s) RETURNING eleve_id",
+        (plan_id, list(eleve_ids))
+    )
+    record_tombstones(cur, plan_id, POSITION, [r[0] for r in cur.fetchall()], rev)
+
+
+_FURNITURE_FIELDS = "id int, client_uid text, type text, label text, color text, " \
+                    "x int, y int, w int, h int, rotation numeric, z int, radius boolean"
+
+
+def upsert_furniture(cur, plan_id: int, items, rev: int) -> dict:
+    """
+    items: [{id?, client_uid?, type, label?, color?, x,y,w,h, rotation?, z?, radius?}, ...]
+    Une seule requête pour tout le lot : UPDATE des lignes avec id (champs absents
+    conservés) + INSERT des autres, dont les ids sont réservés d'avance (nextval)
+    pour pouvoir renvoyer {client_uid: id} sans ambiguïté.
+    """
+    if not items:
+        return {}
+    rows = [{**it, "id": it.get("id") or None} for it in items]
+    cur.execute(f"""
+      WITH v AS (
+        SELECT * FROM jsonb_to_recordset(%(rows)s::jsonb) AS v({_FURNITURE_FIELDS})
+      ),
+      upd AS (
+        UPDATE furniture_items f
+           SET type=COALESCE(v.type, f.type), label=COALESCE(v.label, f.label),
+               color=COALESCE(v.color, f.color),
+               x=COALESCE(v.x, f.x), y=COALESCE(v.y, f.y), w=COALESCE(v.w, f.w), h=COALESCE(v.h, f.h),
+               rotation=COALESCE(v.rotation, f.rotation), z=COALESCE(v.z, f.z),
+               radius=COALESCE(v.radius, f.radius), rev=%(rev)s
+          FROM v
+         WHERE v.id IS NOT NULL AND f.id = v.id AND f.plan_id = %(plan_id)s
+        RETURNING f.id
+      ),
+      nv AS (
+        SELECT v.*, nextval(pg_get_serial_sequence('furniture_items', 'id')) AS new_id
+        FROM v WHERE v.id IS NULL
+      ),
+      ins AS (
+        INSERT INTO furniture_items (id, plan_id, type, label, color, x, y, w, h, rotation, z, radius, rev)
+        SELECT new_id, %(plan_id)s, type, label, color, x, y, w, h,
+               COALESCE(rotation, 0), COALESCE(z, 0), COALESCE(radius, FALSE), %(rev)s
+        FROM nv
+        RETURNING id
+      )
+      -- upd / ins s'exécutent toujours (CTE modifiantes), même non référencées
+      SELECT nv.client_uid, nv.new_id FROM nv WHERE nv.client_uid IS NOT NULL
+    """, {"rows": Json(rows), "plan_id": plan_id, "rev": rev})
+    return {uid: new_id for uid, new_id in cur.fetchall()}
+
+
+def delete_furniture(cur, plan_id: int, ids, rev: int):
+    cur.execute(
+        "DELETE FROM furniture_items WHERE plan_id=%s AND id = ANY(%s) RETURNING id",
+        (plan_id, list(ids))
+    )
+    record_tombstones(cur, plan_id, FURNITURE, [r[0] for r in cur.fetchall()], rev)
+
+
+# ===== Opérations du client =====
+def apply_ops(conn, plan_id: int, ops) -> dict:
+    """
+    Applique un lot d'opérations en une transaction et UNE révision.
+      {op: "move"|"update"|"create", kind: "position", eleve_id, x, y, seat_id?}
+      {op: "delete",                 kind: "position", eleve_id}
+      {op: "move"|"update",          kind: "furniture", id, ...champs modifiés}
+      {op: "create",                 kind: "furniture", client_uid, type, x, y, w, h, ...}
+      {op: "delete",                 kind: "furniture", id}
+    Pour une même entité, la dernière opération du lot l'emporte.
+    Retourne {rev, prev_rev, created: {client_uid: id}}.
+    Lève LookupError (plan absent) ou ValueError (opération invalide).
+    """
+    positions, furniture = {}, {}
+    for op in ops:
+        action, kind = op.get("op"), op.get("kind")
+        if action not in ("move", "update", "create", "delete"):
+            raise ValueError(f"opération inconnue : {action!r}")
+        if kind == POSITION:
+            positions[int(op["eleve_id"])] = op
+        elif kind == FURNITURE:
+            if action == "create":
+                if not op.get("client_uid"):
+                    raise ValueError("création de meuble sans client_uid")
+                furniture[("uid", str(op["client_uid"]))] = op
+            else:
+                furniture[("id", int(op["id"]))] = op
+        else:
+            raise ValueError(f"type d'entité inconnu : {kind!r}")
+
+    with conn.cursor() as cur:
+        rev = bump_revision(cur, plan_id)
+        if rev is None:
+            raise LookupError(plan_id)
+
+        pos_del = [eid for eid, op in positions.items() if op["op"] == "delete"]
+        pos_up = [op for op in positions.values() if op["op"] != "delete"]
+        if pos_del:
+            delete_positions(cur, plan_id, pos_del, rev)
+        if pos_up:
+            upsert_positions(cur, plan_id, pos_up, rev)
+
+        furn_del = [key[1] for key, op in furniture.items() if op["op"] == "delete"]
+        furn_up = [
+            {**op, "id": None} if op["op"] == "create" else op
+            for op in furniture.values() if op["op"] != "delete"
+        ]
+        if furn_del:
+            delete_furniture(cur, plan_id, furn_del, rev)
+        created = upsert_furniture(cur, plan_id, furn_up, rev) if furn_up else {}
+
+    return {"rev": rev, "prev_rev": rev - 1, "created": created}
@@ -0,0 +1,138 @@
+# walls.py
+# =============================================================================
+# Normalisation des murs à l'enregistrement (seating_plan_walls.walls_json)
+# Les murs tracés à main levée ou déplacés au clavier accumulent des points
+# redondants qui alourdissent chaque payload et renderWalls côté éditeur.
+# Pour chaque polyligne :
+#   1. calage sur la grille PLAN_SUBDIV (coordonnées entières encodées)
+#   2. suppression des points consécutifs identiques
+#   3. fusion des segments colinéaires (même direction)
+#   4. simplification Douglas-Peucker à WALL_TOLERANCE près
+# puis suppression des murs dégénérés (< 2 points distincts) et des doublons.
+# =============================================================================
+import math
+
+PLAN_SUBDIV = 32      # coordonnées stockées en entiers x PLAN_SUBDIV
+WALL_TOLERANCE = 4    # écart max toléré (en 1/PLAN_SUBDIV d'unité, soit ~3 cm)
+MAX_WALLS = 500
+MAX_POINTS = 5000     # par mur
+
+
+def _cross(a, b, c) -> int:
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _dedupe(pts):
+    out = []
+    for p in pts:
+        if not out or out[-1] != p:
+            out.append(p)
+    return out
+
+
+def _merge_collinear(pts):
+    """Retire b de a-b-c si a, b, c sont alignés et b entre a et c (pas de demi-tour)."""
+    out = []
+    for p in pts:
+        while len(out) >= 2:
+            a, b = out[-2], out[-1]
+            forward = (b[0] - a[0]) * (p[0] - b[0]) + (b[1] - a[1]) * (p[1] - b[1]) > 0
+            if _cross(a, b, p) == 0 and forward:
+                out.pop()
+            else:
+                break
+        out.append(p)
+    return out
+
+
+def _seg_dist(p, a, b) -> float:
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def _simplify(pts, tol: float):
+    """Douglas-Peucker itératif (les extrémités sont toujours conservées)."""
+    if len(pts) < 3 or tol <= 0:
+        return pts
+    keep = [False] * len(pts)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        i, j = stack.pop()
+        best, idx = -1.0, None
+        for k in range(i + 1, j):
+            d = _seg_dist(pts[k], pts[i], pts[j])
+            if d > best:
+                best, idx = d, k
+        if idx is not None and best > tol:
+            keep[idx] = True
+            stack.append((i, idx))
+            stack.append((idx, j))
+    return [p for p, k in zip(pts, keep) if k]
+
+
+def _parse_points(raw):
+    """[{x, y}, ...] -> [(x, y)] entiers calés sur la grille ; ValueError si invalide."""
+    if not isinstance(raw, list):
+        raise ValueError("invalid points")
+    if len(raw) > MAX_POINTS:
+        raise ValueError(f"too many points (max {MAX_POINTS})")
+    pts = []
+    for p in raw:
+        if not isinstance(p, dict):
+            raise ValueError("invalid point")
+        try:
+            x, y = float(p["x"]), float(p["y"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("invalid point coordinates")
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError("invalid point coordinates")
+        pts.append((int(round(x)), int(round(y))))
+    return pts
+
+
+def normalize_walls(walls, tolerance: float = WALL_TOLERANCE):
+    """
+    Valide et compacte la liste de murs envoyée par l'éditeur
+    ([{id, points: [{x, y}, ...]}, ...], coordonnées × PLAN_SUBDIV).
+    Retourne (murs normalisés, stats). Lève ValueError si la structure est invalide.
+    """
+    if not isinstance(walls, list):
+        raise ValueError("walls must be a list")
+    if len(walls) > MAX_WALLS:
+        raise ValueError(f"too many walls (max {MAX_WALLS})")
+
+    stats = {"walls_in": len(walls), "walls_out": 0, "points_in": 0, "points_out": 0,
+             "removed": {"duplicates": 0, "collinear": 0, "simplified": 0},
+             "dropped_walls": 0}
+    out, seen = [], set()
+    for w in walls:
+        if not isinstance(w, dict) or "points" not in w:
+            raise ValueError("invalid wall structure")
+        pts = _parse_points(w["points"])
+        stats["points_in"] += len(pts)
+
+        step = _dedupe(pts)
+        stats["removed"]["duplicates"] += len(pts) - len(step)
+        merged = _merge_collinear(step)
+        stats["removed"]["collinear"] += len(step) - len(merged)
+        simple = _simplify(merged, tolerance)
+        stats["removed"]["simplified"] += len(merged) - len(simple)
+
+        key = tuple(simple)
+        if len(simple) < 2 or key in seen or tuple(reversed(simple)) in seen:
+            stats["dropped_walls"] += 1
+            continue
+        seen.add(key)
+        stats["points_out"] += len(simple)
+        wall = {**w, "points": [{"x": x, "y": y} for x, y in simple]}
+        if wall.get("id") is not None:
+            wall["id"] = str(wall["id"])
+        out.append(wall)
+
+    stats["walls_out"] = len(out)
+    stats["points_removed"] = stats["points_in"] - stats["points_out"]
+    return out, stats
@@ -0,0 +1,145 @@
+# app/tabular.py — lecture/écriture CSV/XLSX en flux (imports de grilles, exports)
+import io
+import os
+import csv
+import codecs
+import tempfile
+import unicodedata
+from datetime import date, datetime
+
+
+def norm_cell(v) -> str:
+    """Texte comparable : sans accents, majuscules, espaces réduits."""
+    if v is None:
+        return ""
+    s = unicodedata.normalize("NFKD", str(v))
+    s = "".join(c for c in s if not unicodedata.category(c).startswith("M"))
+    return " ".join(s.upper().split())
+
+
+def _is_xlsx(filename: str, head: bytes) -> bool:
+    return (filename or "").lower().endswith((".xlsx", ".xlsm")) or head[:2] == b"PK"
+
+
+def _iter_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except Exception as e:
+        raise ValueError(f"Lecture XLSX indisponible (openpyxl manquant) : {e}")
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield ["" if v is None else str(v).strip() for v in row]
+    finally:
+        wb.close()
+
+
+def _iter_csv(stream, head: bytes):
+    # Encodage : UTF-8 (avec ou sans BOM) sinon Windows-1252 (exports ONDE/Excel)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "windows-1252"
+
+    sample = head.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+    except csv.Error:
+        delimiter = ";"
+
+    text = io.TextIOWrapper(stream, encoding=encoding, newline="")
+    try:
+        for row in csv.reader(text, delimiter=delimiter):
+            yield [c.strip() for c in row]
+    finally:
+        text.detach()
+
+
+def iter_rows(file_storage):
+    """
+    Itère les lignes (listes de str) d'un fichier uploadé CSV ou XLSX,
+    sans charger le contenu en mémoire (le CSV est décodé au fil de l'eau,
+    le XLSX lu en mode read_only).
+    """
+    stream = file_storage.stream
+    head = stream.read(8192)
+    if stream.seekable():
+        stream.seek(0)
+    else:
+        stream = io.BytesIO(head + stream.read())
+
+    if _is_xlsx(file_storage.filename, head):
+        yield from _iter_xlsx(stream)
+    else:
+        yield from _iter_csv(stream, head)
+
+
+# ===== Écriture (exports) =====
+CSV_FLUSH_ROWS = 500
+FILE_CHUNK = 64 * 1024
+
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, (datetime, date)):
+        return v.isoformat(sep=" ") if isinstance(v, datetime) else v.isoformat()
+    return v
+
+
+def csv_chunks(headers, rows, delimiter=";"):
+    """
+    Génère un CSV (UTF-8 avec BOM, lisible par Excel) par paquets d'octets.
+    `rows` est consommé au fil de l'eau : la mémoire reste constante.
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=delimiter, lineterminator="\r\n")
+    buf.write("\ufeff")
+    w.writerow(headers)
+    n = 0
+    for row in rows:
+        w.writerow([_csv_value(v) for v in row])
+        n += 1
+        if n % CSV_FLUSH_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def xlsx_chunks(headers, rows, title="Export"):
+    """
+    Génère un XLSX par paquets d'octets. Le classeur est écrit en mode
+    write_only (lignes sérialisées au fil de l'eau dans un fichier temporaire),
+    puis ce fichier est relu par blocs.
+    Lève ValueError tout de suite (avant la réponse) si openpyxl manque.
+    """
+    try:
+        from openpyxl import Workbook
+    except Exception as e:
+        raise ValueError(f"Export XLSX indisponible (openpyxl manquant) : {e}")
+
+    def _gen():
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=title[:31])
+        ws.append(list(headers))
+        for row in rows:
+            ws.append(list(row))
+
+        fd, tmp = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            wb.save(tmp)
+            with open(tmp, "rb") as f:
+                while True:
+                    chunk = f.read(FILE_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    return _gen()
@@ -22,6 +22,10 @@ from datetime import datetime, date
 from pathlib import Path
 import html as htmlmod
 import json
+import hashlib
+import zipfile
+import zlib
+import threading
 
 # ——— Flask & DB ———
 from flask import (
@@ -57,44 +61,36 @@ REUNIONS_DIRNAME = "19 - Réunions"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 REFERENCE_DOCX = os.path.join(BASE_DIR, "static", "export", "reference.docx")
 
-# Cache de la racine choisie (évite d'interroger le FS tout le temps)
-_ACTIVE_ROOT = None
-_LAST_CHECK  = 0
-_CHECK_EVERY_SEC = 30  # re-test toutes les 30s
+# Copie du HTML normalisé à côté de chaque .docx (diagnostic pandoc) : opt-in
+EXPORT_DEBUG_HTML = os.getenv("EXPORT_DEBUG_HTML", "0") == "1"
+# Conversion DOCX en process (python-docx) avant pandoc
+EXPORT_DOCX_NATIVE = os.getenv("EXPORT_DOCX_NATIVE", "1") != "0"
+
+# Surveillance du partage (thread de fond, accès bornés) : les requêtes lisent
+# l'index des dossiers sans jamais attendre un montage SMB/RaiDrive figé
+from exports.share import ShareMonitor
+
+DOCS_SHARE = ShareMonitor(
+    candidates=lambda: [os.getenv("DOCS_ROOT_PRIMARY") or PRIMARY_ROOT,
+                        os.getenv("DOCS_ROOT_SECONDARY") or SECONDARY_ROOT],
+    reunions_dirname=lambda: REUNIONS_DIRNAME,
+)
 
 
 def pick_docs_root() -> Path:
     """
-    Retourne la racine disponible :
+    Retourne la racine disponible (selon le dernier sondage de DOCS_SHARE) :
      - d'abord ENV DOCS_ROOT_PRIMARY / DOCS_ROOT_SECONDARY
      - sinon constantes PRIMARY_ROOT / SECONDARY_ROOT
      - sinon fallback local ./exports_local
     """
-    global _ACTIVE_ROOT, _LAST_CHECK
-    now = time.time()
-    if _ACTIVE_ROOT and (now - _LAST_CHECK) < _CHECK_EVERY_SEC:
-        return _ACTIVE_ROOT
-
-    candidates = [
-        os.getenv("DOCS_ROOT_PRIMARY")   or PRIMARY_ROOT,
-        os.getenv("DOCS_ROOT_SECONDARY") or SECONDARY_ROOT,
-    ]
-    for raw in candidates:
-        if not raw:
-            continue
-        p = Path(raw)
-        if p.exists():
-            _ACTIVE_ROOT = p
-            _LAST_CHECK = now
-            print(f"[EXPORT] racine sélectionnée => {p}")
-            return p
+    root = DOCS_SHARE.active_root()
+    if root is not None:
+        return root
 
     # Fallback local si rien d’accessible
     fb = Path(current_app.root_path) / "exports_local"
     fb.mkdir(parents=True, exist_ok=True)
-    _ACTIVE_ROOT = fb
-    _LAST_CHECK = now
-    print(f"[EXPORT] aucune racine réseau dispo, fallback => {fb}")
     return fb
 
 
@@ -102,7 +98,11 @@ def find_year_folder(docs_root: Path, annee_scolaire: str) -> Path:
     """
     Trouve un dossier contenant '(AAAA-AAAA)'.
     Priorité : suffixe exact, sinon présence n'importe où, sinon racine.
+    Racine réseau : lu dans l'index de DOCS_SHARE (pas de parcours du partage).
     """
+    if DOCS_SHARE.indexes(docs_root):
+        return DOCS_SHARE.year_folder(annee_scolaire) or docs_root
+
     wanted = f"({annee_scolaire})"
     best = None
     for child in docs_root.iterdir():
@@ -120,11 +120,25 @@ def find_year_folder(docs_root: Path, annee_scolaire: str) -> Path:
 
 def ensure_reunions_dir(year_dir: Path) -> Path:
     """Crée (si besoin) et retourne le dossier '19 - Réunions'."""
+    known = DOCS_SHARE.reunions_dir(year_dir)
+    if known:
+        return Path(known["path"])
     d = year_dir / REUNIONS_DIRNAME
     d.mkdir(parents=True, exist_ok=True)
+    DOCS_SHARE.note_dir(year_dir, d)
     return d
 
 
+def _ensure_reunions_subdir(year_dir: Path, reunions: Path, sub: str) -> Path:
+    """Sous-dossier élève / type de réunion ; mkdir évité s'il est déjà indexé."""
+    final = reunions / sub
+    known = DOCS_SHARE.reunions_dir(year_dir)
+    if not (known and sub in known["subdirs"]):
+        final.mkdir(parents=True, exist_ok=True)
+        DOCS_SHARE.note_dir(year_dir, reunions, sub)
+    return final
+
+
 def resolve_export_dir(annee_scolaire: str, type_label: str | None, eleve_dirname: str | None) -> Path:
     """
     Dossier final d’export, selon ta structure :
@@ -133,9 +147,7 @@ def resolve_export_dir(annee_scolaire: str, type_label: str | None, eleve_dirnam
     root = pick_docs_root()
     year_dir = find_year_folder(root, annee_scolaire)
     reunions = ensure_reunions_dir(year_dir)
-    final = reunions / (eleve_dirname or (type_label or "Autres réunions"))
-    final.mkdir(parents=True, exist_ok=True)
-    return final
+    return _ensure_reunions_subdir(year_dir, reunions, eleve_dirname or (type_label or "Autres réunions"))
 
 
 def _slug(s: str) -> str:
@@ -148,10 +160,12 @@ def _slug(s: str) -> str:
     return s
 
 
-def ensure_export_dir_for_rapport(conn, rapport_id: int, allow_create_year: bool = True) -> str:
+def ensure_export_dir_for_rapport(conn, rapport_id: int, allow_create_year: bool = True,
+                                  create: bool = True) -> str:
     """
     Dossier final d’export pour un rapport :
       <root>\(AAAA-AAAA)\19 - Réunions\<NOM Prénom|Sous-type|Type>
+    create=False : chemin calculé seulement (index du partage), aucun mkdir.
     """
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
         cur.execute("""
@@ -177,10 +191,15 @@ def ensure_export_dir_for_rapport(conn, rapport_id: int, allow_create_year: bool
             year_dir = find_year_folder(root, r["classe_annee"])
         else:
             year_dir = root / "Sans classe"
-            year_dir.mkdir(exist_ok=True)
+            if create:
+                year_dir.mkdir(exist_ok=True)
 
         # 2) Dossier '19 - Réunions'
-        reunions = ensure_reunions_dir(year_dir)
+        if create:
+            reunions = ensure_reunions_dir(year_dir)
+        else:
+            known = DOCS_SHARE.reunions_dir(year_dir)
+            reunions = Path(known["path"]) if known else year_dir / REUNIONS_DIRNAME
 
         # 3) Sous-dossier
         if r["eleve_id"]:
@@ -190,9 +209,37 @@ def ensure_export_dir_for_rapport(conn, rapport_id: int, allow_create_year: bool
         else:
             sub = _slug(r["sous_lib"] or r["type_lib"] or "Réunion")
 
-        final = reunions / sub
-        final.mkdir(parents=True, exist_ok=True)
-        return str(final)
+        if not create:
+            return str(reunions / sub)
+        return str(_ensure_reunions_subdir(year_dir, reunions, sub))
+
+
+# Exports « local d'abord » : fichier produit dans exports_spool/, copié ensuite
+# vers le partage par un thread de fond (reprise, vérification, liste d'attente)
+from exports.spool import ExportSpool, ShareOffline
+
+
+def _spool_dest_dir(meta: dict) -> str:
+    """Dossier final d'un fichier du spool (appelé par le thread d'envoi)."""
+    root = DOCS_SHARE.active_root()
+    if root is None:
+        raise ShareOffline("partage réseau indisponible")
+    if not DOCS_SHARE.indexes(root):
+        # sans index, le dossier d'année serait deviné (racine) : on attend le prochain sondage
+        raise ShareOffline("index du partage en cours")
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            if meta.get("rapport_ids"):  # archive d'un lot : dossier commun
+                return os.path.commonpath([
+                    ensure_export_dir_for_rapport(conn, rid, allow_create_year=False)
+                    for rid in meta["rapport_ids"]])
+            return ensure_export_dir_for_rapport(conn, meta["rapport_id"], allow_create_year=False)
+        finally:
+            conn.close()
+
+
+EXPORT_SPOOL = ExportSpool(_spool_dest_dir, is_online=lambda: DOCS_SHARE.active_root() is not None)
 
 
 # ===========================================
@@ -452,15 +499,176 @@ def _wrap_html_for_pdf(body_html: str, title="Rapport") -> str:
 </body></html>"""
 
 
+# ----- Moteurs de conversion (registre adaptatif, voir exports/backends.py) -----
+def _pandoc_bin():
+    p = os.getenv("PANDOC_BIN") or shutil.which("pandoc") or r"C:\Program Files\Pandoc\pandoc.exe"
+    return p if p and os.path.exists(p) else None
+
+
+def _wkhtmltopdf_bin():
+    for p in (os.getenv("WKHTMLTOPDF_PATH"), shutil.which("wkhtmltopdf"),
+              r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe",
+              r"C:\Program Files (x86)\wkhtmltopdf\bin\wkhtmltopdf.exe"):
+        if p and os.path.exists(p):
+            return p
+    return None
+
+
+def _require_output(out_path: str):
+    if not (os.path.exists(out_path) and os.path.getsize(out_path) > 0):
+        raise RuntimeError("fichier produit vide")
+
+
+def _probe_docx_native():
+    if not EXPORT_DOCX_NATIVE:
+        return False
+    import exports.docx_native  # noqa: F401
+    return True
+
+
+def _docx_via_native(html_in, out_path, reference_docx):
+    # pas de process pandoc ni de fichiers temporaires ; refus (False) hors sous-ensemble
+    from exports.docx_native import html_to_docx, UnsupportedHTML
+    try:
+        html_to_docx(html_in, out_path, reference_docx=reference_docx)
+    except UnsupportedHTML as e:
+        print(f"[DOCX] natif : HTML hors sous-ensemble ({e})")
+        return False
+
+
+def _docx_via_pandoc_cli(html_in, out_path, reference_docx):
+    with tempfile.TemporaryDirectory() as td:
+        html_file = os.path.join(td, "in.html")
+        with open(html_file, "w", encoding="utf-8") as f:
+            f.write(html_in)
+        cmd = [_pandoc_bin(), "-f", "html", "-t", "docx", html_file, "-o", out_path]
+        if reference_docx:
+            cmd += ["--reference-doc", reference_docx]
+        print(f"[DOCX] run: {' '.join(cmd)}")
+        subprocess.run(cmd, check=True)
+    _require_output(out_path)
+
+
+def _probe_pypandoc():
+    import pypandoc
+    return pypandoc.get_pandoc_version()
+
+
+def _docx_via_pypandoc(html_in, out_path, reference_docx):
+    import pypandoc
+    extra = ["--reference-doc", reference_docx] if reference_docx else []
+    pypandoc.convert_text(html_in, "docx", format="html", outputfile=out_path, extra_args=extra)
+    _require_output(out_path)
+
+
+def _probe_html2docx():
+    from html2docx import html2docx  # noqa: F401
+    return True
+
+
+def _docx_via_html2docx(html_in, out_path, reference_docx):
+    from html2docx import html2docx as _html2docx
+    doc = Document()
+    _html2docx(html_in, doc)
+    if not ("".join(p.text for p in doc.paragraphs).strip() or doc.tables):
+        raise RuntimeError("html2docx a produit un document vide")
+    doc.save(out_path)
+
+
+def _docx_via_text(html_in, out_path, reference_docx):
+    text = _plain_text_from_html(html_in) or "(contenu non interprétable)"
+    doc = Document()
+    for line in text.splitlines():
+        doc.add_paragraph(line)
+    doc.save(out_path)
+
+
+def _probe_playwright():
+    import playwright  # noqa: F401  (Chromium lancé au premier rendu, pas au sondage)
+    return True
+
+
+def _pdf_via_playwright(html_str, out_path, html_body):
+    from exports.browser import get_browser_pool
+    get_browser_pool().pdf(html_str, out_path)
+    _require_output(out_path)
+
+
+def _probe_wkhtmltopdf():
+    import pdfkit  # noqa: F401
+    return _wkhtmltopdf_bin()
+
+
+def _pdf_via_wkhtmltopdf(html_str, out_path, html_body):
+    import pdfkit
+    cfg = pdfkit.configuration(wkhtmltopdf=_wkhtmltopdf_bin())
+    options = {
+        'quiet': '', 'encoding': 'UTF-8', 'page-size': 'A4',
+        'margin-top': '20mm', 'margin-right': '20mm', 'margin-bottom': '20mm', 'margin-left': '20mm',
+        'print-media-type': '', 'enable-local-file-access': '', 'dpi': 96, 'image-dpi': 300, 'image-quality': 92
+    }
+    pdfkit.from_string(html_str, out_path, configuration=cfg, options=options)
+    _require_output(out_path)
+
+
+def _pdf_via_reportlab(html_str, out_path, html_body):
+    text = _plain_text_from_html(html_body or "")
+    c = rl_canvas.Canvas(out_path, pagesize=RL_A4)
+    width, height = RL_A4
+    x, y = 20 * RL_mm, height - 20 * RL_mm
+    c.setFont("Helvetica", 11)
+    for line in text.splitlines():
+        if y < 20 * RL_mm:
+            c.showPage(); c.setFont("Helvetica", 11); y = height - 20 * RL_mm
+        c.drawString(x, y, line[:1200])
+        y -= 14
+    c.save()
+
+
+def _build_export_backends():
+    from exports.backends import BackendRegistry
+    reg = BackendRegistry()
+    reg.register("docx", "python-docx", _probe_docx_native, _docx_via_native)
+    reg.register("docx", "pandoc", _pandoc_bin, _docx_via_pandoc_cli)
+    reg.register("docx", "pypandoc", _probe_pypandoc, _docx_via_pypandoc)
+    reg.register("docx", "html2docx", _probe_html2docx, _docx_via_html2docx, degraded=True)
+    reg.register("docx", "texte", lambda: True, _docx_via_text, last_resort=True)
+    reg.register("pdf", "chromium", _probe_playwright, _pdf_via_playwright)
+    reg.register("pdf", "wkhtmltopdf", _probe_wkhtmltopdf, _pdf_via_wkhtmltopdf, degraded=True)
+    reg.register("pdf", "reportlab", lambda: True, _pdf_via_reportlab, last_resort=True)
+    return reg
+
+
+EXPORT_BACKENDS = _build_export_backends()
+
+
+def init_exports(flask_app=None):
+    """
+    Démarre les services de fond des exports (serveur uniquement : create_app()
+    et le __main__ legacy). L'import du module n'en démarre aucun, pour que
+    les CLI (app.archive, bancs d'essai) et les tests restent légers ; sans
+    appel, chaque service démarre de lui-même au premier usage.
+      - surveillance du partage réseau (DOCS_SHARE)
+      - envoi des exports restés en attente au dernier arrêt (EXPORT_SPOOL)
+      - sondage des moteurs de conversion, hors thread de requête (EXPORT_BACKENDS)
+    """
+    DOCS_SHARE.start()
+    EXPORT_SPOOL.start()
+    EXPORT_BACKENDS.probe_in_background()
+
+
 def export_docx_best_effort(html_input: str, out_path: str, reference_docx: str | None = None):
     """
-    HTML -> DOCX robuste (essais successifs) :
-      1) Pandoc CLI
-      2) pypandoc
-      3) html2docx
-      4) fallback texte
-    + écrit un fichier debug .html à côté du .docx
+    HTML -> DOCX robuste : moteurs disponibles essayés dans l'ordre de santé
+    observé (EXPORT_BACKENDS) — python-docx natif (désactivable :
+    EXPORT_DOCX_NATIVE=0), pandoc CLI, pypandoc, html2docx ; texte en dernier recours.
+    Conversions des moteurs préférés mises en cache (exports/cache.py) : HTML
+    normalisé et reference.docx inchangés -> copie du résultat précédent, sans
+    reconversion (html2docx et texte ne sont jamais mis en cache).
+    + fichier debug .html à côté du .docx si EXPORT_DEBUG_HTML=1
     """
+    from exports import cache as export_cache
+
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
     html_in = (html_input or "").strip()
@@ -474,144 +682,52 @@ def export_docx_best_effort(html_input: str, out_path: str, reference_docx: str
     html_in = normalize_html_for_docx(html_in)
 
     # debug
-    try:
-        debug_html = out_path[:-5] + "_DEBUG.html"
-        with open(debug_html, "w", encoding="utf-8") as f:
-            f.write(html_in)
-        print(f"[DOCX] debug html -> {debug_html}")
-    except Exception as e:
-        print(f"[DOCX] debug html save KO: {e}")
-
-    try:
-        print(f"[DOCX] has headings? {_has_headings(html_in)}")
-    except Exception:
-        pass
-    if reference_docx and os.path.exists(reference_docx):
-        print(f"[DOCX] using reference: {reference_docx}")
-    else:
-        print("[DOCX] no reference.docx")
-
-    # 1) Pandoc CLI direct
-    try:
-        pandoc_bin = os.getenv("PANDOC_BIN") or shutil.which("pandoc") or r"C:\Program Files\Pandoc\pandoc.exe"
-        if pandoc_bin and os.path.exists(pandoc_bin):
-            with tempfile.TemporaryDirectory() as td:
-                html_file = os.path.join(td, "in.html")
-                with open(html_file, "w", encoding="utf-8") as f:
-                    f.write(html_in)
-                cmd = [pandoc_bin, "-f", "html", "-t", "docx", html_file, "-o", out_path]
-                if reference_docx and os.path.exists(reference_docx):
-                    cmd += ["--reference-doc", reference_docx]
-                print(f"[DOCX] run: {' '.join(cmd)}")
-                subprocess.run(cmd, check=True)
-                if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
-                    print("[DOCX] OK via pandoc CLI")
-                    return
-                else:
-                    print("[DOCX] pandoc CLI a produit un fichier vide")
-        else:
-            print("[DOCX] pandoc non trouvé (PATH/PANDOC_BIN)")
-    except subprocess.CalledProcessError as e:
-        print(f"[DOCX] pandoc CLI KO (code={e.returncode})")
-    except Exception as e:
-        print(f"[DOCX] pandoc CLI exception: {e}")
-
-    # 2) pypandoc
-    try:
-        import pypandoc
-        extra = []
-        if reference_docx and os.path.exists(reference_docx):
-            extra += ["--reference-doc", reference_docx]
-        pypandoc.convert_text(html_in, "docx", format="html", outputfile=out_path, extra_args=extra)
-        if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
-            print("[DOCX] OK via pypandoc")
-            return
-        else:
-            print("[DOCX] pypandoc a produit un fichier vide")
-    except Exception as e:
-        print(f"[DOCX] pypandoc KO: {e}")
-
-    # 3) html2docx
-    try:
-        from html2docx import html2docx as _html2docx
-        doc = Document()
-        _html2docx(html_in, doc)
-        all_text = "".join(p.text for p in doc.paragraphs).strip()
-        if all_text or doc.tables:
-            doc.save(out_path)
-            print("[DOCX] OK via html2docx")
-            return
-        else:
-            print("[DOCX] html2docx a produit “vide” -> fallback texte")
-    except Exception as e:
-        print(f"[DOCX] html2docx KO: {e}")
+    if EXPORT_DEBUG_HTML:
+        try:
+            debug_html = out_path[:-5] + "_DEBUG.html"
+            with open(debug_html, "w", encoding="utf-8") as f:
+                f.write(html_in)
+            print(f"[DOCX] debug html -> {debug_html}")
+        except Exception as e:
+            print(f"[DOCX] debug html save KO: {e}")
+
+    if not (reference_docx and os.path.exists(reference_docx)):
+        reference_docx = None
+    cache_key = export_cache.conversion_key(
+        "docx:native" if EXPORT_DOCX_NATIVE else "docx", html_in, files=[reference_docx])
+    if export_cache.fetch(cache_key, "docx", out_path):
+        print("[DOCX] OK via cache")
+        return
 
-    # 4) Fallback texte
-    text = _plain_text_from_html(html_in) or "(contenu non interprétable)"
-    doc = Document()
-    for line in text.splitlines():
-        doc.add_paragraph(line)
-    doc.save(out_path)
-    print("[DOCX] fallback texte")
+    backend = EXPORT_BACKENDS.run("docx", html_in, out_path, reference_docx, log_prefix="[DOCX]")
+    if backend.cacheable:  # rendu de repli : pas servi depuis le cache une fois pandoc revenu
+        export_cache.store(cache_key, "docx", out_path)
 
 
 def export_pdf_faithful(html_body: str, out_path: str, title="Rapport"):
-    """HTML -> PDF (Playwright, puis wkhtmltopdf, puis ReportLab fallback)."""
+    """
+    HTML -> PDF : Chromium (navigateur persistant partagé), wkhtmltopdf, puis
+    ReportLab (texte) en dernier recours, dans l'ordre de santé observé.
+    Seuls les rendus navigateur sont mis en cache, sur le HTML final (export.css et titre inclus).
+    """
+    from exports import cache as export_cache
+    from exports.backends import BackendsExhausted
+
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     html_str = _wrap_html_for_pdf(html_body or "", title=title)
-
-    # 1) Playwright/Chromium
-    try:
-        from playwright.sync_api import sync_playwright
-        with sync_playwright() as p:
-            browser = p.chromium.launch(args=["--no-sandbox"])
-            page = browser.new_page()
-            page.set_content(html_str, wait_until="networkidle")
-            page.pdf(
-                path=out_path,
-                format="A4",
-                margin={"top": "20mm", "right": "20mm", "bottom": "20mm", "left": "20mm"},
-                print_background=True,
-                prefer_css_page_size=True
-            )
-            browser.close()
-            return
-    except Exception as e:
-        print(f"[PDF] Playwright KO: {e}")
-
-    # 2) wkhtmltopdf via pdfkit
-    try:
-        import pdfkit
-        wkhtml = (os.getenv("WKHTMLTOPDF_PATH") or shutil.which("wkhtmltopdf")
-                  or r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-                  or r"C:\Program Files (x86)\wkhtmltopdf\bin\wkhtmltopdf.exe")
-        cfg = pdfkit.configuration(wkhtmltopdf=wkhtml) if wkhtml and os.path.exists(wkhtml) else None
-        options = {
-            'quiet': '', 'encoding': 'UTF-8', 'page-size': 'A4',
-            'margin-top': '20mm', 'margin-right': '20mm', 'margin-bottom': '20mm', 'margin-left': '20mm',
-            'print-media-type': '', 'enable-local-file-access': '', 'dpi': 96, 'image-dpi': 300, 'image-quality': 92
-        }
-        pdfkit.from_string(html_str, out_path, configuration=cfg, options=options)
+    cache_key = export_cache.conversion_key("pdf", html_str)
+    if export_cache.fetch(cache_key, "pdf", out_path):
+        print("[PDF] OK via cache")
         return
-    except Exception as e:
-        print(f"[PDF] wkhtmltopdf KO: {e}")
 
-    # 3) Fallback texte (ReportLab)
     try:
-        text = _plain_text_from_html(html_body or "")
-        c = rl_canvas.Canvas(out_path, pagesize=RL_A4)
-        width, height = RL_A4
-        x, y = 20 * RL_mm, height - 20 * RL_mm
-        c.setFont("Helvetica", 11)
-        for line in text.splitlines():
-            if y < 20 * RL_mm:
-                c.showPage(); c.setFont("Helvetica", 11); y = height - 20 * RL_mm
-            c.drawString(x, y, line[:1200])
-            y -= 14
-        c.save()
-    except Exception as e:
+        backend = EXPORT_BACKENDS.run("pdf", html_str, out_path, html_body, log_prefix="[PDF]")
+    except BackendsExhausted as e:
         print(f"[PDF] fallback KO: {e}")
         open(out_path, "wb").close()  # dernier recours
+        return
+    if backend.cacheable:  # seul le rendu Chromium est mis en cache
+        export_cache.store(cache_key, "pdf", out_path)
 
 
 # ===========================================
@@ -1945,11 +2061,13 @@ def api_create_rapport():
 
     conn = get_db_connection(); cur = conn.cursor()
     try:
+        cfg = _rapport_ts_config(cur)
         cur.execute("""
-            INSERT INTO rapports (classe_id, eleve_id, type_id, sous_type_id, titre, contenu, heure_debut)
-            VALUES (%s,%s,%s,%s,%s,'', NOW())
+            INSERT INTO rapports (classe_id, eleve_id, type_id, sous_type_id, titre, contenu, heure_debut,
+                                  contenu_text, search_tsv)
+            VALUES (%s,%s,%s,%s,%s,'', NOW(), '', setweight(to_tsvector(%s::regconfig, %s), 'A'))
             RETURNING id, heure_debut;
-        """, (classe_id, eleve_id, type_id, sous_type_id, titre))
+        """, (classe_id, eleve_id, type_id, sous_type_id, titre, cfg, titre or ""))
         rid, hdeb = cur.fetchone()
         conn.commit()
         return jsonify(ok=True, id=rid, heure_debut=hdeb.isoformat()), 201
@@ -1960,35 +2078,233 @@ def api_create_rapport():
         cur.close(); conn.close()
 
 
+# ----- Révisions du contenu (autosave différentiel) -----
+# L'éditeur envoie un splice {at, del, ins} (positions en points de code)
+# calculé contre la dernière révision acquittée (base_rev) ; chaque écriture du
+# contenu crée une révision : snapshot complet toutes les RAPPORT_SNAPSHOT_EVERY
+# révisions, sinon uniquement le splice — le tout compressé (zlib).
+# ----- Recherche plein texte -----
+# rapports.contenu_text (HTML retiré) + rapports.search_tsv (titre poids A,
+# texte poids B), tenus à jour à l'écriture par l'application ; index GIN.
+# Colonnes, tables et configuration de recherche : migrations app/schema.py.
+# Les rapports sans search_tsv (existants, ou ré-injectés par app.archive
+# restore) sont indexés en tâche de fond, par lots committés un à un.
+RAPPORT_SNAPSHOT_EVERY = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_INDEX_BATCH = 500
+_RAPPORT_TSV_SQL = ("search_tsv = setweight(to_tsvector(%s::regconfig, %s), 'A')"
+                    " || setweight(to_tsvector(%s::regconfig, %s), 'B')")
+_TS_CONFIG = None
+_INDEXER = None
+_INDEXER_LOCK = threading.Lock()
+
+
+def _rapport_ts_config(cur) -> str:
+    """Configuration retenue par la migration (commentaire de rapports.search_tsv)."""
+    global _TS_CONFIG
+    if _TS_CONFIG is None:
+        cur.execute("SELECT col_description('rapports'::regclass, attnum) FROM pg_attribute "
+                    "WHERE attrelid = 'rapports'::regclass AND attname = 'search_tsv'")
+        row = cur.fetchone()
+        if not (row and row[0]):
+            return "french"  # migration pas encore passée : relu au prochain appel
+        _TS_CONFIG = row[0]
+    return _TS_CONFIG
+
+
+def _index_pending_rapports(conn) -> int:
+    """
+    Calcule contenu_text / search_tsv des rapports qui n'en ont pas, par lots
+    committés un à un (jamais toute la table dans une transaction). Une ligne
+    indexée entre-temps par une écriture n'est pas écrasée.
+    """
+    total, last_id = 0, 0
+    while True:
+        with conn.cursor() as cur:
+            config = _rapport_ts_config(cur)
+            cur.execute("""
+                SELECT id, titre, contenu FROM rapports
+                WHERE search_tsv IS NULL AND id > %s ORDER BY id LIMIT %s
+            """, (last_id, SEARCH_INDEX_BATCH))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            batch = []
+            for rid, titre, contenu in rows:
+                plain = _plain_text_from_html(contenu or "")
+                batch.append((plain, config, titre or "", config, plain, rid))
+            psycopg2.extras.execute_batch(cur, f"""
+                UPDATE rapports SET contenu_text = %s, {_RAPPORT_TSV_SQL}
+                WHERE id = %s AND search_tsv IS NULL
+            """, batch)
+        conn.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+    if total:
+        print(f"[RAPPORTS] index de recherche : {total} rapport(s) indexé(s)")
+    return total
+
+
+def _run_rapport_indexer():
+    conn = get_db_connection()
+    try:
+        _index_pending_rapports(conn)
+    except Exception as e:
+        conn.rollback()
+        print(f"[RAPPORTS] indexation KO: {e}")
+    finally:
+        conn.close()
+
+
+def start_rapport_indexer() -> bool:
+    """Lance l'indexation de fond des rapports non indexés (sans effet si elle tourne déjà)."""
+    global _INDEXER
+    with _INDEXER_LOCK:
+        if _INDEXER is not None and _INDEXER.is_alive():
+            return False
+        _INDEXER = threading.Thread(target=_run_rapport_indexer, name="rapports-index", daemon=True)
+        _INDEXER.start()
+        return True
+
+
+def _text_splice(old: str, new: str):
+    """Plus petit remplacement contigu old -> new : {at, del, ins} (None si identiques)."""
+    if old == new:
+        return None
+    n = min(len(old), len(new))
+    p = 0
+    while p < n and old[p] == new[p]:
+        p += 1
+    q = 0
+    while q < n - p and old[-1 - q] == new[-1 - q]:
+        q += 1
+    return {"at": p, "del": len(old) - p - q, "ins": new[p:len(new) - q]}
+
+
+def _apply_text_ops(text: str, ops) -> str:
+    """Applique une liste de splices (dans l'ordre) ; ValueError si hors bornes / mal formé."""
+    if not isinstance(ops, list):
+        raise ValueError("ops doit être une liste")
+    for op in ops:
+        try:
+            at, dl, ins = int(op["at"]), int(op.get("del", 0)), op.get("ins") or ""
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("op mal formée")
+        if not isinstance(ins, str) or at < 0 or dl < 0 or at + dl > len(text):
+            raise ValueError("op hors bornes")
+        text = text[:at] + ins + text[at + dl:]
+    return text
+
+
+def _pack(obj) -> bytes:
+    return zlib.compress(json.dumps(obj, ensure_ascii=False).encode("utf-8"), 6)
+
+
+def _unpack(data) -> dict:
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+def _record_rapport_revision(cur, rapport_id: int, rev: int, new_text: str, ops):
+    """Snapshot (révision 1, puis toutes les RAPPORT_SNAPSHOT_EVERY) ou delta."""
+    if (rev - 1) % RAPPORT_SNAPSHOT_EVERY == 0:
+        kind, data = "snapshot", _pack({"text": new_text})
+    else:
+        kind, data = "delta", _pack({"ops": ops})
+    cur.execute("""
+        INSERT INTO rapport_revisions (rapport_id, rev, kind, data, size)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (rapport_id, rev) DO UPDATE SET kind = EXCLUDED.kind, data = EXCLUDED.data,
+                                                    size = EXCLUDED.size, created_at = NOW()
+    """, (rapport_id, rev, kind, psycopg2.Binary(data), len(data)))
+
+
+def _rapport_text_at(cur, rapport_id: int, rev: int):
+    """Contenu à la révision `rev` : dernier snapshot <= rev + deltas suivants (None si inconnu)."""
+    cur.execute("""
+        SELECT rev, kind, data FROM rapport_revisions
+        WHERE rapport_id = %s AND rev <= %s
+          AND rev >= (SELECT MAX(rev) FROM rapport_revisions
+                      WHERE rapport_id = %s AND rev <= %s AND kind = 'snapshot')
+        ORDER BY rev
+    """, (rapport_id, rev, rapport_id, rev))
+    rows = cur.fetchall()
+    if not rows or rows[-1][0] != rev:
+        return None
+    text = None
+    for _rev, kind, data in rows:
+        payload = _unpack(data)
+        text = payload["text"] if kind == "snapshot" else _apply_text_ops(text, payload["ops"])
+    return text
+
+
 @app.route("/api/rapports/<int:rapport_id>", methods=["PATCH"])
 def api_update_rapport(rapport_id):
-    """Patch partiel d’un rapport ; met à jour heure_fin à chaque écriture."""
+    """
+    Patch partiel d’un rapport ; met à jour heure_fin à chaque écriture.
+    Contenu : "contenu" (HTML complet) ou "contenu_patch" :
+      { "base_rev": N, "ops": [{"at", "del", "ins"}], "length": <points de code attendus> }
+    base_rev périmé / longueur différente -> 409 { conflict, rev, contenu } : renvoyer le complet.
+    Réponse : { ok, heure_fin, updated_at, rev } (rev = révision courante du contenu).
+    """
     data = request.get_json(force=True) or {}
     champs, vals = [], []
 
-    for cle in ("titre", "contenu", "type_id", "sous_type_id", "classe_id", "eleve_id"):
+    for cle in ("titre", "type_id", "sous_type_id", "classe_id", "eleve_id"):
         if cle in data:
             champs.append(f"{cle}=%s")
             vals.append(data[cle])
 
-    champs.append("heure_fin=NOW()")
-
-    if not champs:
-        return jsonify(ok=True)
-
-    sql = f"UPDATE rapports SET {', '.join(champs)} WHERE id=%s RETURNING heure_fin, updated_at;"
-    vals.append(rapport_id)
-
     conn = get_db_connection(); cur = conn.cursor()
     try:
-        cur.execute(sql, tuple(vals))
+        cur.execute("SELECT contenu, content_rev, titre FROM rapports WHERE id=%s FOR UPDATE", (rapport_id,))
         row = cur.fetchone()
         if not row:
             conn.rollback()
             return jsonify(ok=False, error="rapport introuvable"), 404
+        old_text, rev, old_titre = row[0] or "", row[1], row[2]
+
+        new_text, ops = None, None
+        patch = data.get("contenu_patch")
+        if patch is not None:
+            conflict = patch.get("base_rev") != rev
+            if not conflict:
+                try:
+                    ops = patch.get("ops") or []
+                    new_text = _apply_text_ops(old_text, ops)
+                except ValueError as e:
+                    conn.rollback()
+                    return jsonify(ok=False, error=str(e)), 400
+                conflict = "length" in patch and len(new_text) != patch["length"]
+            if conflict:
+                conn.rollback()
+                return jsonify(ok=False, conflict=True, error="révision périmée",
+                               rev=rev, contenu=old_text), 409
+        elif "contenu" in data:
+            new_text = data["contenu"] or ""
+            splice = _text_splice(old_text, new_text)
+            ops = [splice] if splice else []
+
+        content_changed = new_text is not None and new_text != old_text
+        if content_changed:
+            rev += 1
+            champs += ["contenu=%s", "content_rev=%s"]
+            vals += [new_text, rev]
+            _record_rapport_revision(cur, rapport_id, rev, new_text, ops)
+
+        # index de recherche : seulement si titre ou contenu ont réellement changé
+        titre = data["titre"] if "titre" in data else old_titre
+        if content_changed or titre != old_titre:
+            plain = _plain_text_from_html(new_text if content_changed else old_text)
+            champs += ["contenu_text=%s", _RAPPORT_TSV_SQL]
+            cfg = _rapport_ts_config(cur)
+            vals += [plain, cfg, titre or "", cfg, plain]
+
+        champs.append("heure_fin=NOW()")
+        cur.execute(f"UPDATE rapports SET {', '.join(champs)} WHERE id=%s RETURNING heure_fin, updated_at;",
+                    (*vals, rapport_id))
+        heure_fin, updated_at = cur.fetchone()
         conn.commit()
-        heure_fin, updated_at = row
-        return jsonify(ok=True, heure_fin=heure_fin.isoformat(), updated_at=updated_at.isoformat())
+        return jsonify(ok=True, heure_fin=heure_fin.isoformat(), updated_at=updated_at.isoformat(), rev=rev)
     except Exception as e:
         conn.rollback()
         return jsonify(ok=False, error=str(e)), 500
@@ -1996,6 +2312,128 @@ def api_update_rapport(rapport_id):
         cur.close(); conn.close()
 
 
+@app.get("/api/rapports/<int:rapport_id>/revisions")
+def api_rapport_revisions(rapport_id):
+    """Historique du contenu : [{rev, kind, size (octets compressés), created_at}]."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                SELECT rev, kind, size, created_at FROM rapport_revisions
+                WHERE rapport_id = %s ORDER BY rev DESC
+            """, (rapport_id,))
+            revs = cur.fetchall()
+        for r in revs:
+            r["created_at"] = r["created_at"].isoformat()
+        return jsonify(ok=True, revisions=revs)
+    finally:
+        conn.close()
+
+
+@app.get("/api/rapports/<int:rapport_id>/revisions/<int:rev>")
+def api_rapport_revision(rapport_id, rev):
+    """Contenu du rapport tel qu’il était à la révision `rev`."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            text = _rapport_text_at(cur, rapport_id, rev)
+        if text is None:
+            return jsonify(ok=False, error="révision inconnue"), 404
+        return jsonify(ok=True, rev=rev, contenu=text)
+    finally:
+        conn.close()
+
+
+# Délimiteurs internes de ts_headline : le texte est échappé avant d'insérer <mark>
+_HL_START, _HL_STOP = "\x02", "\x03"
+
+
+def _search_snippet(raw: str) -> str:
+    return (htmlmod.escape(raw or "").replace(_HL_START, "<mark>").replace(_HL_STOP, "</mark>"))
+
+
+@app.get("/api/rapports/search")
+def api_search_rapports():
+    """
+    Recherche plein texte (titre + contenu) :
+      ?q=...  syntaxe « web » : "expression exacte", ou, -exclu
+      filtres : classe_id, eleve_id, type_id, date_from, date_to (AAAA-MM-JJ)
+      limit (défaut 20, max SEARCH_MAX_LIMIT), offset
+    Réponse : { ok, total, indexing (rapports en cours d'indexation : résultats partiels),
+               results: [{id, titre, type, sous_type, classe_id, eleve, heure_debut,
+               rank, snippet (HTML échappé, termes en <mark>)}] }
+    """
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify(ok=False, error="q manquant"), 400
+    filters = {k: request.args.get(k) for k in ("classe_id", "eleve_id", "type_id", "date_from", "date_to")}
+    try:
+        for k in ("classe_id", "eleve_id", "type_id"):
+            filters[k] = int(filters[k]) if filters[k] else None
+        for k in ("date_from", "date_to"):
+            if filters[k]:
+                date.fromisoformat(filters[k])
+        limit = max(1, min(SEARCH_MAX_LIMIT, int(request.args.get("limit") or 20)))
+        offset = max(0, int(request.args.get("offset") or 0))
+    except ValueError:
+        return jsonify(ok=False, error="paramètre invalide"), 400
+    where, params = _rapport_filters_sql(filters)
+
+    t0 = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cfg = _rapport_ts_config(cur)
+            # rapports pas encore indexés (ex. ré-injectés par app.archive restore) :
+            # indexation de fond, la réponse le signale (résultats partiels)
+            cur.execute("SELECT EXISTS (SELECT 1 FROM rapports WHERE search_tsv IS NULL)")
+            indexing = cur.fetchone()[0]
+        if indexing:
+            start_rapport_indexer()
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            # ts_headline (coûteux) seulement sur la page de résultats
+            cur.execute(f"""
+                WITH hits AS (
+                    SELECT r.id, ts_rank_cd(r.search_tsv, q.query) AS rank,
+                           COUNT(*) OVER () AS total, q.query
+                    FROM rapports r, websearch_to_tsquery(%s::regconfig, %s) AS q(query)
+                    WHERE r.search_tsv @@ q.query {''.join(' AND ' + w for w in where)}
+                    ORDER BY rank DESC, r.heure_debut DESC, r.id DESC
+                    LIMIT %s OFFSET %s
+                )
+                SELECT h.id, h.rank, h.total, r.heure_debut, r.classe_id, r.eleve_id,
+                       COALESCE(NULLIF(r.titre, ''), rst.libelle, rt.libelle, 'Rapport') AS titre,
+                       rt.libelle AS type, rst.libelle AS sous_type,
+                       NULLIF(CONCAT_WS(' ', e.nom, e.prenom), '') AS eleve,
+                       ts_headline(%s::regconfig, COALESCE(r.contenu_text, ''), h.query,
+                                   'StartSel=' || CHR(2) || ', StopSel=' || CHR(3)
+                                   || ', MaxFragments=2, MaxWords=25, MinWords=8, FragmentDelimiter=" … "')
+                           AS snippet
+                FROM hits h
+                JOIN rapports r ON r.id = h.id
+                JOIN rapport_types rt ON r.type_id = rt.id
+                LEFT JOIN rapport_sous_types rst ON r.sous_type_id = rst.id
+                LEFT JOIN eleves e ON r.eleve_id = e.id
+                ORDER BY h.rank DESC, r.heure_debut DESC, r.id DESC
+            """, (cfg, q, *params, limit, offset, cfg))
+            rows = cur.fetchall()
+    except psycopg2.Error as e:
+        conn.rollback()
+        return jsonify(ok=False, error=str(e)), 500
+    finally:
+        conn.close()
+
+    total = rows[0]["total"] if rows else 0
+    results = [{
+        "id": r["id"], "titre": r["titre"], "type": r["type"], "sous_type": r["sous_type"],
+        "classe_id": r["classe_id"], "eleve_id": r["eleve_id"], "eleve": r["eleve"],
+        "heure_debut": r["heure_debut"].isoformat() if r["heure_debut"] else None,
+        "rank": round(float(r["rank"]), 4), "snippet": _search_snippet(r["snippet"]),
+    } for r in rows]
+    return jsonify(ok=True, q=q, total=total, limit=limit, offset=offset, results=results,
+                   indexing=indexing, took_ms=round((time.perf_counter() - t0) * 1000, 1))
+
+
 @app.route("/api/rapport_sous_types/<int:type_id>", methods=["GET"])
 def api_get_sous_types(type_id):
     """Liste les sous-types pour un type donné."""
@@ -2007,64 +2445,281 @@ def api_get_sous_types(type_id):
         conn.close()
 
 
+def _export_rapport(rapport_id: int, fmt: str, html_override: str = "", progress=None,
+                    name_suffix: str = "") -> dict:
+    """
+    Exporte un rapport en DOCX / PDF : conversion dans le spool local, puis
+    copie de fond vers son dossier (structure Réunions) par EXPORT_SPOOL.
+    Exécuté par la file d'exports (exports.jobs) : pas de contexte de requête,
+    on pousse celui de l'application. Retourne {path (prévu), local_path, size,
+    sync} ; lève en cas d'échec.
+    """
+    progress = progress or (lambda stage, **extra: None)
+    with app.app_context():
+        # Charger rapport
+        progress("lecture du rapport")
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("""
+            SELECT r.titre, r.contenu, r.classe_id,
+                   rt.libelle AS type_lib, rst.libelle AS sous_lib, c.annee AS classe_annee
+            FROM rapports r
+            JOIN rapport_types rt ON r.type_id = rt.id
+            LEFT JOIN rapport_sous_types rst ON r.sous_type_id = rst.id
+            LEFT JOIN classes c ON r.classe_id = c.id
+            WHERE r.id = %s
+        """, (rapport_id,))
+        r = cur.fetchone()
+        cur.close(); conn.close()
+        if not r:
+            raise LookupError("Rapport introuvable")
+
+        titre = r["titre"] or (r["sous_lib"] or r["type_lib"] or "Rapport")
+        contenu_html = html_override if html_override else (r["contenu"] or "")
+
+        # Dossier de sortie prévu (selon structure) : calculé sur l'index du
+        # partage, sans y toucher ; la copie est faite par EXPORT_SPOOL
+        progress("dossier d’export")
+        export_dir = None
+        if DOCS_SHARE.active_root() is not None:
+            conn = get_db_connection()
+            try:
+                export_dir = ensure_export_dir_for_rapport(conn, rapport_id, allow_create_year=False,
+                                                           create=False)
+            finally:
+                conn.close()
+
+        # Export (dans le spool local)
+        progress(f"conversion {fmt.upper()}")
+        safe_titre = "".join(ch if ch.isalnum() or ch in " -_." else "_" for ch in titre).strip()[:80] or "rapport"
+        filename = f"{safe_titre}{name_suffix}.{fmt}"
+        out_path = EXPORT_SPOOL.reserve(filename)
+        if fmt == "docx":
+            reference_docx = os.path.join(current_app.root_path, "static", "export", "reference.docx")
+            if not os.path.exists(reference_docx):
+                reference_docx = None
+            export_docx_best_effort(contenu_html, out_path, reference_docx=reference_docx)
+        else:
+            export_pdf_faithful(contenu_html, out_path, title=titre)
+
+    item = EXPORT_SPOOL.commit(out_path, {"rapport_id": rapport_id},
+                               expected_dest=os.path.join(export_dir, filename) if export_dir else None)
+    return {"path": item["dest_path"] or item["local_path"], "local_path": item["local_path"],
+            "size": item["size"], "sync": "pending", "sync_id": item["id"]}
+
+
 @app.post("/api/rapports/<int:rapport_id>/export")
 def api_export_rapport(rapport_id):
     """
-    Export d’un rapport en DOCX ou PDF.
+    Export d’un rapport en DOCX ou PDF, en tâche de fond.
     Body JSON :
-      { "format": "docx"|"pdf", "html": "<override optionnel>" }
+      { "format": "docx"|"pdf", "html": "<override optionnel>", "wait": false }
+    Réponse 202 { ok, job_id, status_url } ; suivre GET /api/export/jobs/<job_id>.
+    Avec "wait": true, attend la fin (comportement historique : { ok, path, size }).
     """
+    from exports import jobs
+
     data = request.get_json(silent=True) or {}
     fmt = (data.get("format") or "docx").lower()
     html_override = (data.get("html") or "").strip()
+    if fmt not in ("docx", "pdf"):
+        return jsonify(ok=False, error="Format inconnu"), 400
 
-    # Charger rapport
+    # version courante du rapport dans la clé : « enregistrer puis exporter » ne
+    # récupère jamais un job lancé sur le contenu d'avant l'enregistrement
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
-        SELECT r.titre, r.contenu, r.classe_id,
-               rt.libelle AS type_lib, rst.libelle AS sous_lib, c.annee AS classe_annee
-        FROM rapports r
-        JOIN rapport_types rt ON r.type_id = rt.id
-        LEFT JOIN rapport_sous_types rst ON r.sous_type_id = rst.id
-        LEFT JOIN classes c ON r.classe_id = c.id
-        WHERE r.id = %s
-    """, (rapport_id,))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    if not r:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT content_rev, heure_fin FROM rapports WHERE id = %s", (rapport_id,))
+            row = cur.fetchone()
+    finally:
+        conn.close()
+    if not row:
         return jsonify(ok=False, error="Rapport introuvable"), 404
+    version = (row[0], row[1].isoformat() if row[1] else None)
+
+    key = ("rapport", rapport_id, fmt, version, hashlib.sha1(html_override.encode("utf-8")).hexdigest())
+    job, created = jobs.submit(key, _export_rapport, rapport_id, fmt, html_override,
+                               label=f"rapport {rapport_id} ({fmt})")
+
+    if data.get("wait"):
+        job = jobs.wait(job["id"], timeout=180) or job
+        if job["status"] == jobs.DONE:
+            return jsonify(ok=True, **job["result"])
+        if job["status"] == jobs.ERROR:
+            code = 404 if job["error"] == "Rapport introuvable" else 500
+            return jsonify(ok=False, error=job["error"]), code
+
+    return jsonify(ok=True, job_id=job["id"], status=job["status"], deduplicated=not created,
+                   status_url=url_for("api_export_job", job_id=job["id"])), 202
+
 
-    titre = r["titre"] or (r["sous_lib"] or r["type_lib"] or "Rapport")
-    contenu_html = html_override if html_override else (r["contenu"] or "")
+EXPORT_BATCH_WORKERS = int(os.getenv("EXPORT_BATCH_WORKERS", "3"))
 
-    # Dossier de sortie (selon structure)
+
+def _rapport_filters_sql(filters: dict):
+    """Clauses WHERE (alias r) : classe, élève, type, période sur heure_debut."""
+    where, params = [], []
+    for col in ("classe_id", "eleve_id", "type_id"):
+        if filters.get(col):
+            where.append(f"r.{col} = %s"); params.append(filters[col])
+    if filters.get("date_from"):
+        where.append("r.heure_debut >= %s"); params.append(filters["date_from"])
+    if filters.get("date_to"):
+        where.append("r.heure_debut < %s::date + 1"); params.append(filters["date_to"])
+    return where, params
+
+
+def _select_rapports_for_batch(filters: dict) -> list:
+    """Rapports correspondant aux filtres (classe, élève, type, période sur heure_debut)."""
+    where, params = _rapport_filters_sql(filters)
     conn = get_db_connection()
     try:
-        export_dir = ensure_export_dir_for_rapport(conn, rapport_id, allow_create_year=False)
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT r.id, r.heure_debut,
+                       COALESCE(NULLIF(r.titre, ''), rst.libelle, rt.libelle, 'Rapport') AS titre
+                FROM rapports r
+                JOIN rapport_types rt ON r.type_id = rt.id
+                LEFT JOIN rapport_sous_types rst ON r.sous_type_id = rst.id
+                WHERE {' AND '.join(where) or 'TRUE'}
+                ORDER BY r.heure_debut, r.id
+            """, params)
+            return cur.fetchall()
     finally:
         conn.close()
 
-    # Export
-    safe_titre = "".join(ch if ch.isalnum() or ch in " -_." else "_" for ch in titre).strip()[:80] or "rapport"
-    if fmt == "docx":
-        out_path = os.path.join(export_dir, f"{safe_titre}.docx")
-        reference_docx = os.path.join(current_app.root_path, "static", "export", "reference.docx")
-        if not os.path.exists(reference_docx):
-            reference_docx = None
-        export_docx_best_effort(contenu_html, out_path, reference_docx=reference_docx)
-
-    elif fmt == "pdf":
-        out_path = os.path.join(export_dir, f"{safe_titre}.pdf")
-        export_pdf_faithful(contenu_html, out_path, title=titre)
-    else:
+
+def _export_rapports_batch(filters: dict, fmt: str, make_zip: bool = False, progress=None) -> dict:
+    """
+    Exporte tous les rapports sélectionnés, en parallèle (EXPORT_BATCH_WORKERS).
+    Chaque fichier va dans son dossier habituel (ensure_export_dir_for_rapport,
+    via le spool local et la synchronisation de fond) ;
+    les titres identiques reçoivent la date + l'id pour ne pas s'écraser.
+    Retourne le récapitulatif : fichiers (durée, chemin ou erreur), ZIP éventuel.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    progress = progress or (lambda stage, **extra: None)
+    t0 = time.perf_counter()
+    rows = _select_rapports_for_batch(filters)
+    total = len(rows)
+    progress("sélection", done=0, total=total)
+    if not rows:
+        return {"count": 0, "ok": 0, "failed": 0, "files": [], "zip": None, "duration_ms": 0}
+
+    if fmt == "pdf":
+        try:  # Chromium prêt avant que les workers ne se le disputent
+            from exports.browser import get_browser_pool
+            get_browser_pool().warmup()
+        except Exception as e:
+            print(f"[EXPORT] lot : Chromium indisponible ({e})")
+
+    titles = {}
+    for r in rows:
+        titles[r["titre"]] = titles.get(r["titre"], 0) + 1
+
+    def _one(r):
+        started = time.perf_counter()
+        suffix = ""
+        if titles[r["titre"]] > 1:
+            day = r["heure_debut"].strftime("%Y-%m-%d") if r["heure_debut"] else "sans-date"
+            suffix = f" - {day} #{r['id']}"
+        item = {"rapport_id": r["id"], "titre": r["titre"]}
+        try:
+            item.update(_export_rapport(r["id"], fmt, name_suffix=suffix))
+        except Exception as e:
+            item["error"] = str(e)
+        item["duration_ms"] = round((time.perf_counter() - started) * 1000)
+        return item
+
+    files, done = [], 0
+    with ThreadPoolExecutor(max_workers=max(1, EXPORT_BATCH_WORKERS),
+                            thread_name_prefix="export-batch") as pool:
+        for fut in as_completed([pool.submit(_one, r) for r in rows]):
+            files.append(fut.result())
+            done += 1
+            progress(f"conversion {done}/{total}", done=done, total=total)
+    files.sort(key=lambda f: f["rapport_id"])
+    ok_files = [f for f in files if f.get("path")]
+
+    zip_path = None
+    if make_zip and ok_files:
+        progress("archive ZIP", done=done, total=total)
+        # arborescence du partage si connue, sinon « id - fichier »
+        dests = [f["path"] for f in ok_files if f["path"] != f["local_path"]]
+        base = os.path.commonpath([os.path.dirname(p) for p in dests]) if len(dests) == len(ok_files) else None
+        zip_name = f"Export rapports {datetime.now():%Y-%m-%d %H%M%S}.zip"
+        zip_work = EXPORT_SPOOL.reserve(zip_name)
+        with zipfile.ZipFile(zip_work, "w", zipfile.ZIP_DEFLATED) as zf:
+            for f in ok_files:
+                arcname = (os.path.relpath(f["path"], base) if base
+                           else f"{f['rapport_id']} - {os.path.basename(f['path'])}")
+                zf.write(f["local_path"], arcname=arcname)
+        item = EXPORT_SPOOL.commit(zip_work, {"rapport_ids": [f["rapport_id"] for f in ok_files]},
+                                   expected_dest=os.path.join(base, zip_name) if base else None)
+        zip_path = item["dest_path"] or item["local_path"]
+
+    return {
+        "count": total, "ok": len(ok_files), "failed": total - len(ok_files),
+        "files": files, "zip": zip_path,
+        "duration_ms": round((time.perf_counter() - t0) * 1000),
+    }
+
+
+@app.post("/api/rapports/export/batch")
+def api_export_rapports_batch():
+    """
+    Export groupé des rapports, en tâche de fond.
+    Body JSON :
+      { "format": "docx"|"pdf", "classe_id"?, "eleve_id"?, "type_id"?,
+        "date_from"?: "AAAA-MM-JJ", "date_to"?: "AAAA-MM-JJ", "zip"?: false }
+    Au moins un filtre requis. Réponse 202 { ok, job_id, status_url } ; le
+    récapitulatif est dans job.result une fois terminé.
+    """
+    from exports import jobs
+
+    data = request.get_json(silent=True) or {}
+    fmt = (data.get("format") or "docx").lower()
+    if fmt not in ("docx", "pdf"):
         return jsonify(ok=False, error="Format inconnu"), 400
 
+    filters = {}
     try:
-        size = os.path.getsize(out_path)
-    except Exception:
-        size = None
-    return jsonify(ok=True, path=out_path, size=size)
+        for col in ("classe_id", "eleve_id", "type_id"):
+            if data.get(col) not in (None, ""):
+                filters[col] = int(data[col])
+        for col in ("date_from", "date_to"):
+            if data.get(col):
+                filters[col] = datetime.strptime(data[col], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return jsonify(ok=False, error="Filtre invalide"), 400
+    if not filters:
+        return jsonify(ok=False, error="Au moins un filtre requis (classe, élève, type ou période)"), 400
+
+    make_zip = bool(data.get("zip"))
+    key = ("batch", fmt, make_zip, tuple(sorted((k, str(v)) for k, v in filters.items())))
+    job, created = jobs.submit(key, _export_rapports_batch, filters, fmt, make_zip,
+                               label=f"lot de rapports ({fmt})")
+    return jsonify(ok=True, job_id=job["id"], status=job["status"], deduplicated=not created,
+                   status_url=url_for("api_export_job", job_id=job["id"])), 202
+
+
+@app.get("/api/export/jobs")
+def api_export_jobs():
+    """Derniers jobs d’export (en attente, en cours, terminés récemment)."""
+    from exports import jobs
+    return jsonify(ok=True, jobs=jobs.list_jobs())
+
+
+@app.get("/api/export/jobs/<job_id>")
+def api_export_job(job_id):
+    """État d’un job d’export : status, stage, result {path, size} ou error."""
+    from exports import jobs
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(ok=False, error="Job inconnu ou expiré"), 404
+    return jsonify(ok=True, job=job)
 
 
 # ===========================================
@@ -2077,7 +2732,7 @@ def config_export():
       - Chemins d’export (en mémoire process, surchargés par ENV)
       - Réglages UI (anim_mode, anim_duration) stockés en DB (app_settings)
     """
-    global PRIMARY_ROOT, SECONDARY_ROOT, REUNIONS_DIRNAME, _ACTIVE_ROOT, _LAST_CHECK
+    global PRIMARY_ROOT, SECONDARY_ROOT, REUNIONS_DIRNAME
 
     # Menu latéral (classes)
     conn = get_db_connection()
@@ -2111,8 +2766,8 @@ def config_export():
         SECONDARY_ROOT   = new_secondary
         REUNIONS_DIRNAME = new_reunions
 
-        # Force re-détection de la racine dispo
-        _ACTIVE_ROOT = None; _LAST_CHECK = 0
+        # Force re-détection de la racine dispo (+ réindexation)
+        DOCS_SHARE.refresh()
 
         # — UI (animation) —
         mode = (request.form.get("anim_mode") or current_anim_mode).strip()
@@ -2141,18 +2796,60 @@ def config_export():
     )
 
 
+@app.get("/api/export/browser")
+def api_export_browser_status():
+    """État du Chromium partagé des exports PDF (lancements, rendus, erreurs) et du cache de conversions."""
+    from exports.browser import browser_pool_status
+    from exports.cache import cache_status
+    return jsonify(ok=True, **browser_pool_status(), cache=cache_status())
+
+
+@app.get("/api/export/backends")
+def api_export_backends():
+    """
+    Diagnostic des moteurs de conversion : disponibilité (sondage), ordre
+    courant, tentatives / succès / refus, latence moyenne, dernière erreur.
+    ?reprobe=1 relance le sondage (moteur installé depuis le démarrage).
+    """
+    if request.args.get("reprobe") in ("1", "true"):
+        EXPORT_BACKENDS.probe_all()
+    return jsonify(ok=True, **EXPORT_BACKENDS.stats())
+
+
 @app.get("/api/config/test-paths")
 def api_test_paths():
     """Test simple d’existence des chemins configurés."""
     p = request.args.get("primary")   or PRIMARY_ROOT
     s = request.args.get("secondary") or SECONDARY_ROOT
     res = {
-        "primary":   {"path": p, "exists": os.path.exists(p)},
-        "secondary": {"path": s, "exists": os.path.exists(s)},
+        "primary":   DOCS_SHARE.probe_path(p),    # borné : un partage figé ne bloque pas la requête
+        "secondary": DOCS_SHARE.probe_path(s),
     }
     return jsonify(ok=True, **res)
 
 
+@app.get("/api/export/pending")
+def api_export_pending():
+    """Envois vers le partage en attente (hors ligne / en échec) + derniers envois réussis."""
+    return jsonify(ok=True, **EXPORT_SPOOL.status())
+
+
+@app.post("/api/export/pending/retry")
+def api_export_pending_retry():
+    """Relance immédiatement les envois en attente (partage revenu, dossier corrigé...)."""
+    DOCS_SHARE.refresh()
+    EXPORT_SPOOL.retry_now()
+    return jsonify(ok=True, pending=len(EXPORT_SPOOL.pending()))
+
+
+@app.get("/api/export/share")
+def api_export_share_status():
+    """État du partage : racine retenue, racines testées, index des dossiers, accès bloqués."""
+    if request.args.get("refresh") in ("1", "true"):
+        DOCS_SHARE.refresh(wait=True)
+    return jsonify(ok=True, **DOCS_SHARE.status())
+
+
 # ===========================================
 #  DÉMARRAGE LOCAL
 # ===========================================
@@ -2168,4 +2865,15 @@ if __name__ == "__main__":
     except Exception as e:
         print("❌ Erreur de connexion à PostgreSQL :", e)
 
+    try:
+        from app.schema import migrate
+        conn = get_db_connection()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        print("❌ Migrations de schéma :", e)
+    init_exports(app)
+    start_rapport_indexer()
     app.run(debug=True)
@@ -0,0 +1 @@
+# exports/ — outillage des exports de rapports (DOCX / PDF) utilisé par app_legacy.py
@@ -0,0 +1,148 @@
+# exports/backends.py
+# =============================================================================
+# Registre des moteurs de conversion (DOCX / PDF) avec télémétrie
+# - chaque moteur est sondé UNE fois (import, binaire présent...) au démarrage
+#   (probe_in_background) ou au premier export ; les moteurs absents ne sont plus tentés
+#   (plus d'import raté / shutil.which / exception à chaque export)
+# - par moteur : tentatives, succès, échecs, refus, latence lissée (EWMA)
+# - ordre des essais : taux de succès observé, puis latence, puis ordre
+#   déclaré ; les moteurs « dernier recours » (texte brut) restent en dernier
+# - un moteur peut refuser un document (retour False) sans être pénalisé
+#   (ex. convertisseur natif hors sous-ensemble HTML)
+# - moteurs « dégradés » (rendu approximatif) : utilisables, mais leur résultat
+#   n'est pas mis en cache (cacheable) pour ne pas survivre au retour du moteur préféré
+# - nouveau sondage toutes les REPROBE_EVERY_S (moteur installé entre-temps)
+# =============================================================================
+import time
+import threading
+
+REPROBE_EVERY_S = 600
+EWMA_ALPHA = 0.3
+
+
+class BackendsExhausted(RuntimeError):
+    """Aucun moteur n'a produit le fichier."""
+
+
+class _Backend:
+    __slots__ = ("name", "fmt", "probe", "run", "last_resort", "degraded", "order", "available", "probe_info",
+                 "probe_ms", "attempts", "successes", "failures", "declined", "ewma_ms",
+                 "last_error", "last_ok")
+
+    def __init__(self, name, fmt, probe, run, last_resort, degraded, order):
+        self.name, self.fmt, self.probe, self.run = name, fmt, probe, run
+        self.last_resort, self.degraded, self.order = last_resort, degraded, order
+        self.available, self.probe_info, self.probe_ms = None, None, None
+        self.attempts = self.successes = self.failures = self.declined = 0
+        self.ewma_ms, self.last_error, self.last_ok = None, None, None
+
+    @property
+    def cacheable(self) -> bool:
+        return not (self.last_resort or self.degraded)
+
+    def success_rate(self) -> float:
+        # a priori 1/2 : un moteur jamais essayé passe après un moteur qui a réussi
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def sort_key(self):
+        measured = self.ewma_ms if self.ewma_ms is not None else float("inf")
+        return (self.last_resort, -round(self.success_rate(), 1), measured, self.order)
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name, "available": self.available, "probe": self.probe_info,
+            "probe_ms": self.probe_ms, "last_resort": self.last_resort, "degraded": self.degraded,
+            "attempts": self.attempts, "successes": self.successes, "failures": self.failures,
+            "declined": self.declined, "success_rate": round(self.success_rate(), 3),
+            "avg_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            "last_error": self.last_error, "last_ok": self.last_ok,
+        }
+
+
+class BackendRegistry:
+    def __init__(self):
+        self._backends = {}  # fmt -> [_Backend]
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._probed_at = None
+
+    def register(self, fmt: str, name: str, probe, run, last_resort: bool = False, degraded: bool = False):
+        """
+        probe() -> info (vérité = disponible ; lève ou retourne faux sinon)
+        run(*args) -> None si le fichier est produit, False si refus ; lève si échec.
+        degraded : rendu de repli, jamais mis en cache (comme last_resort).
+        """
+        with self._lock:
+            lst = self._backends.setdefault(fmt, [])
+            lst.append(_Backend(name, fmt, probe, run, last_resort, degraded, len(lst)))
+
+    def probe_all(self, force: bool = True):
+        """Sonde tous les moteurs (au démarrage, puis toutes les REPROBE_EVERY_S)."""
+        with self._probe_lock:
+            if not force and self._probed_at is not None and time.time() - self._probed_at < REPROBE_EVERY_S:
+                return  # sondé entre-temps par un autre thread
+            with self._lock:
+                backends = [b for lst in self._backends.values() for b in lst]
+            for b in backends:
+                t0 = time.perf_counter()
+                try:
+                    info = b.probe()
+                    b.available, b.probe_info = bool(info), (info if isinstance(info, str) else None)
+                except Exception as e:
+                    b.available, b.probe_info = False, str(e)
+                b.probe_ms = round((time.perf_counter() - t0) * 1000, 1)
+                print(f"[EXPORT] moteur {b.fmt}/{b.name} : {'OK' if b.available else 'absent'}"
+                      + (f" ({b.probe_info})" if b.probe_info else ""))
+            self._probed_at = time.time()
+
+    def probe_in_background(self):
+        threading.Thread(target=self.probe_all, kwargs={"force": False},
+                         name="export-probe", daemon=True).start()
+
+    def _ensure_probed(self):
+        if self._probed_at is None or time.time() - self._probed_at > REPROBE_EVERY_S:
+            self.probe_all(force=False)
+
+    def ordered(self, fmt: str) -> list:
+        self._ensure_probed()
+        with self._lock:
+            return sorted((b for b in self._backends.get(fmt, []) if b.available), key=_Backend.sort_key)
+
+    def run(self, fmt: str, *args, log_prefix: str = "[EXPORT]"):
+        """Essaie les moteurs disponibles dans l'ordre de santé ; retourne celui qui a réussi."""
+        errors = []
+        for b in self.ordered(fmt):
+            t0 = time.perf_counter()
+            try:
+                result = b.run(*args)
+            except Exception as e:
+                with self._lock:  # compteurs partagés entre threads d'export
+                    b.attempts += 1
+                    b.failures += 1
+                    b.last_error = f"{type(e).__name__}: {e}"
+                errors.append(f"{b.name}: {e}")
+                print(f"{log_prefix} {b.name} KO: {e}")
+                continue
+            if result is False:
+                with self._lock:
+                    b.declined += 1
+                continue
+            ms = (time.perf_counter() - t0) * 1000
+            with self._lock:
+                b.attempts += 1
+                b.successes += 1
+                b.last_ok = time.time()
+                b.ewma_ms = ms if b.ewma_ms is None else EWMA_ALPHA * ms + (1 - EWMA_ALPHA) * b.ewma_ms
+            print(f"{log_prefix} OK via {b.name} ({ms:.0f} ms)")
+            return b
+        raise BackendsExhausted("; ".join(errors) or f"aucun moteur {fmt} disponible")
+
+    def stats(self) -> dict:
+        self._ensure_probed()
+        order = {fmt: [b.name for b in self.ordered(fmt)] for fmt in list(self._backends)}
+        with self._lock:
+            return {
+                "probed_at": self._probed_at,
+                "formats": {fmt: {"order": order[fmt], "backends": [b.as_dict() for b in lst]}
+                            for fmt, lst in self._backends.items()},
+            }
@@ -0,0 +1,144 @@
+# exports/bench_docx.py
+# =============================================================================
+# Banc d'essai DOCX : convertisseur natif (python-docx) vs pandoc CLI
+#   python -m exports.bench_docx [fichier.html ...] [-n 20]
+# Sans fichier : jeux d'essai intégrés (types de rapports courants).
+# Mesures : temps moyen / médian par conversion ; fidélité = similarité du
+# texte (difflib) et comptes titres / éléments de liste / tables / gras.
+# =============================================================================
+import os
+import re
+import sys
+import shutil
+import difflib
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from exports.docx_native import html_to_docx, UnsupportedHTML
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE_DOCX = os.path.join(BASE_DIR, "static", "export", "reference.docx")
+
+SAMPLES = {
+    "court": "<p><strong>Ordre du jour</strong></p><p>Point sur la rentrée, <em>effectifs</em> et sorties.</p>",
+    "liste": "<h2>Décisions</h2><ul><li>Projet cirque validé</li><li>Budget :<ul><li>coop 300 €</li>"
+             "<li>mairie 500 €</li></ul></li></ul><ol><li>Devis</li><li>Planning</li></ol>",
+    "table": "<h1>Équipe éducative</h1><table><tr><th>Nom</th><th>Rôle</th></tr>"
+             + "".join(f"<tr><td>Intervenant {i}</td><td>Avis <strong>favorable</strong></td></tr>" for i in range(12))
+             + "</table>",
+    "long": "".join(f"<h2>Partie {i}</h2><p style=\"text-align: justify;\">Lorem ipsum <strong>dolor</strong> "
+                    f"sit amet, <em>consectetur</em> adipiscing elit.<br>Suite {i}.</p>"
+                    "<ul><li>point a</li><li>point b</li></ul>" for i in range(40)),
+}
+
+_BULLET = re.compile(r"^(?:[•◦]|\d+\.)\t")
+
+
+def _pandoc_bin():
+    p = os.getenv("PANDOC_BIN") or shutil.which("pandoc")
+    return p if p and os.path.exists(p) else None
+
+
+def convert_pandoc(html: str, out_path: str, reference_docx=None):
+    with tempfile.TemporaryDirectory() as td:
+        html_file = os.path.join(td, "in.html")
+        with open(html_file, "w", encoding="utf-8") as f:
+            f.write(html)
+        cmd = [_pandoc_bin(), "-f", "html", "-t", "docx", html_file, "-o", out_path]
+        if reference_docx:
+            cmd += ["--reference-doc", reference_docx]
+        subprocess.run(cmd, check=True, capture_output=True)
+
+
+def _timed(fn, html, out_path, n):
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn(html, out_path, reference_docx=REFERENCE_DOCX if os.path.exists(REFERENCE_DOCX) else None)
+        times.append((time.perf_counter() - t0) * 1000)
+    return times
+
+
+def describe(path: str) -> dict:
+    """Texte (par paragraphe) et structure d'un DOCX, pour comparer deux conversions."""
+    doc = Document(path)
+    texts, headings, items, bold = [], 0, 0, 0
+    for p in doc.paragraphs:
+        text = _BULLET.sub("", p.text).strip()
+        if not text:
+            continue
+        texts.append(text)
+        if p.style.name.startswith("Heading"):
+            headings += 1
+        if _BULLET.match(p.text) or p._p.find(f"{qn('w:pPr')}/{qn('w:numPr')}") is not None:
+            items += 1
+        bold += sum(1 for r in p.runs if r.bold and r.text.strip())
+    for t in doc.tables:
+        for row in t.rows:
+            texts.extend(c.text.strip() for c in row.cells if c.text.strip())
+    return {"texts": texts, "headings": headings, "list_items": items,
+            "tables": len(doc.tables), "bold_runs": bold}
+
+
+def fidelity(a: dict, b: dict) -> dict:
+    ratio = difflib.SequenceMatcher(None, "\n".join(a["texts"]), "\n".join(b["texts"])).ratio()
+    out = {"text_similarity": round(ratio, 3)}
+    for k in ("headings", "list_items", "tables", "bold_runs"):
+        out[k] = f"{a[k]}/{b[k]}"
+    return out
+
+
+def _fmt_ms(times):
+    return f"{statistics.mean(times):7.1f} ms (méd. {statistics.median(times):.1f})"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("files", nargs="*", help="fichiers HTML (défaut : jeux intégrés)")
+    ap.add_argument("-n", type=int, default=20, help="répétitions par conversion")
+    args = ap.parse_args(argv)
+
+    samples = dict(SAMPLES)
+    if args.files:
+        samples = {}
+        for path in args.files:
+            with open(path, encoding="utf-8") as f:
+                samples[os.path.basename(path)] = f.read()
+    try:  # même normalisation que l'export réel
+        from app_legacy import normalize_html_for_docx
+        samples = {k: normalize_html_for_docx(v) for k, v in samples.items()}
+    except Exception as e:
+        print(f"(normalize_html_for_docx indisponible : {e})")
+
+    pandoc = _pandoc_bin()
+    if not pandoc:
+        print("pandoc introuvable (PATH/PANDOC_BIN) : mesures natives seules")
+
+    with tempfile.TemporaryDirectory() as td:
+        for name, html in samples.items():
+            native_out = os.path.join(td, f"{name}.native.docx")
+            pandoc_out = os.path.join(td, f"{name}.pandoc.docx")
+            print(f"\n== {name} ({len(html)} caractères)")
+            try:
+                native = _timed(html_to_docx, html, native_out, args.n)
+                print(f"  natif  : {_fmt_ms(native)}")
+            except UnsupportedHTML as e:
+                print(f"  natif  : hors sous-ensemble ({e})")
+                native = None
+            if pandoc:
+                theirs = _timed(convert_pandoc, html, pandoc_out, max(1, args.n // 4))
+                print(f"  pandoc : {_fmt_ms(theirs)}")
+                if native:
+                    print(f"  gain   : x{statistics.mean(theirs) / statistics.mean(native):.1f}")
+                    print(f"  fidélité (natif/pandoc) : {fidelity(describe(native_out), describe(pandoc_out))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+# exports/browser.py
+# =============================================================================
+# Chromium (Playwright) partagé pour les exports PDF fidèles
+# - UN navigateur lancé à la première demande puis réutilisé par tous les
+#   exports (plus de démarrage de Chromium par rapport)
+# - pool borné de pages (BROWSER_MAX_PAGES) réutilisées d'un export à l'autre
+# - Playwright tourne dans son propre thread (boucle asyncio) : les threads
+#   waitress soumettent un rendu et attendent le résultat
+# - contrôle de santé périodique : navigateur déconnecté -> relancé ;
+#   navigateur inutilisé depuis BROWSER_IDLE_S -> fermé (mémoire rendue)
+# - rendu dans un fichier temporaire renommé en cas de succès ; un rendu qui
+#   dépasse le délai est annulé : il n'écrase jamais le PDF d'un autre moteur
+# =============================================================================
+import os
+import time
+import uuid
+import atexit
+import asyncio
+import threading
+import concurrent.futures
+
+BROWSER_MAX_PAGES = int(os.getenv("EXPORT_BROWSER_PAGES", "2"))
+BROWSER_IDLE_S = int(os.getenv("EXPORT_BROWSER_IDLE_S", "900"))
+HEALTH_EVERY_S = 30
+LAUNCH_ARGS = ["--no-sandbox"]
+
+PDF_OPTIONS = {
+    "format": "A4",
+    "margin": {"top": "20mm", "right": "20mm", "bottom": "20mm", "left": "20mm"},
+    "print_background": True,
+    "prefer_css_page_size": True,
+}
+
+
+class BrowserPool:
+    """Navigateur Chromium persistant + pages réutilisables (voir en-tête)."""
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES, idle_s: int = BROWSER_IDLE_S):
+        self.max_pages = max(1, max_pages)
+        self.idle_s = idle_s
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        # état manipulé uniquement depuis la boucle Playwright
+        self._pw = None
+        self._browser = None
+        self._idle_pages = []
+        self._sem = None
+        self._browser_lock = None
+        self._health_task = None
+        self._stats = {"renders": 0, "failures": 0, "launches": 0, "restarts": 0,
+                       "in_use": 0, "last_error": None, "last_used": None, "launched_at": None}
+
+    # ----- thread Playwright -----
+    def _ensure_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name="export-browser", daemon=True)
+            self._thread.start()
+            self._ready.wait(10)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._sem = asyncio.Semaphore(self.max_pages)
+        self._browser_lock = asyncio.Lock()
+        self._health_task = loop.create_task(self._health_loop())
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _ensure_browser(self):
+        async with self._browser_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            if self._browser is not None:
+                self._stats["restarts"] += 1
+                await self._drop_browser()
+            if self._pw is None:
+                from playwright.async_api import async_playwright
+                self._pw = await async_playwright().start()
+            self._browser = await self._pw.chromium.launch(args=LAUNCH_ARGS)
+            self._stats["launches"] += 1
+            self._stats["launched_at"] = time.time()
+            print(f"[PDF] Chromium lancé (pool de {self.max_pages} pages)")
+            return self._browser
+
+    async def _drop_browser(self):
+        pages, self._idle_pages = self._idle_pages, []
+        browser, self._browser = self._browser, None
+        for page in pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+
+    async def _acquire_page(self):
+        browser = await self._ensure_browser()
+        while self._idle_pages:
+            page = self._idle_pages.pop()
+            if not page.is_closed():
+                return page
+        return await browser.new_page()
+
+    async def _render(self, html: str, out_path: str, options: dict):
+        async with self._sem:
+            self._stats["in_use"] += 1
+            page = None
+            tmp = f"{out_path}.{uuid.uuid4().hex[:8]}.part"
+            try:
+                page = await self._acquire_page()
+                await page.set_content(html, wait_until="networkidle")
+                await page.pdf(path=tmp, **options)
+                os.replace(tmp, out_path)
+                self._idle_pages.append(page)
+                page = None
+                self._stats["renders"] += 1
+            except Exception as e:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = str(e)
+                raise
+            finally:
+                if os.path.exists(tmp):  # échec ou annulation : rien n'atteint out_path
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+                if page is not None:  # page en erreur / annulée : jetée, jamais remise au pool
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass
+                self._stats["in_use"] -= 1
+                self._stats["last_used"] = time.time()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(HEALTH_EVERY_S)
+            try:
+                async with self._browser_lock:
+                    if self._browser is None:
+                        continue
+                    if not self._browser.is_connected():
+                        self._stats["restarts"] += 1
+                        print("[PDF] Chromium déconnecté -> relance à la prochaine demande")
+                        await self._drop_browser()
+                    elif (self._stats["in_use"] == 0 and self.idle_s
+                          and time.time() - (self._stats["last_used"] or 0) > self.idle_s):
+                        print("[PDF] Chromium inutilisé -> fermé")
+                        await self._drop_browser()
+            except Exception as e:
+                self._stats["last_error"] = str(e)
+
+    # ----- API (appelable depuis n'importe quel thread) -----
+    def pdf(self, html: str, out_path: str, timeout: float = 90, **options):
+        """Rend `html` en PDF dans `out_path` (bloquant pour l'appelant)."""
+        self._ensure_thread()
+        fut = asyncio.run_coroutine_threadsafe(
+            self._render(html, out_path, {**PDF_OPTIONS, **options}), self._loop)
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()  # le moteur suivant prend la main : ce rendu ne doit plus écrire
+            raise
+
+    def warmup(self, timeout: float = 60):
+        """Lance Chromium sans attendre un premier export."""
+        self._ensure_thread()
+        asyncio.run_coroutine_threadsafe(self._ensure_browser(), self._loop).result(timeout)
+
+    def status(self) -> dict:
+        s = dict(self._stats)
+        s.update(max_pages=self.max_pages, idle_pages=len(self._idle_pages),
+                 running=bool(self._browser is not None and self._browser.is_connected()))
+        return s
+
+    def close(self, timeout: float = 10):
+        if not (self._loop and self._thread and self._thread.is_alive()) or self._loop.is_closed():
+            return
+
+        async def _shutdown():
+            if self._health_task is not None:
+                self._health_task.cancel()
+            await self._drop_browser()
+            if self._pw is not None:
+                try:
+                    await self._pw.stop()
+                except Exception:
+                    pass
+                self._pw = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result(timeout)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Pool partagé du process. ImportError si Playwright n'est pas installé."""
+    global _POOL
+    import playwright  # noqa: F401  (échec immédiat si absent, sans lancer de thread)
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = BrowserPool()
+            atexit.register(_POOL.close)
+        return _POOL
+
+
+def browser_pool_status():
+    return _POOL.status() if _POOL is not None else {"running": False, "renders": 0}
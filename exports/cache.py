@@ -0,0 +1,143 @@
+# exports/cache.py
+# =============================================================================
+# Cache des conversions DOCX / PDF, adressé par contenu
+# - clé = sha256(format + HTML normalisé + contenu des ressources : reference.docx,
+#   export.css...) : un rapport inchangé n'est pas reconverti, et changer le
+#   gabarit Word ou la feuille CSS invalide naturellement les anciennes entrées
+# - succès : le fichier en cache est copié (ou lié en dur si EXPORT_CACHE_LINK=1)
+#   vers la destination ; lien dur désactivé par défaut : le fichier exporté est
+#   souvent rouvert et modifié dans Word, ce qui altérerait l'entrée du cache
+# - seules les conversions des moteurs préférés sont mises en cache (pas les
+#   moteurs dégradés ni les fallbacks texte) ; KEY_VERSION écarte les entrées
+#   produites avant cette règle
+# - taille bornée (EXPORT_CACHE_MAX_MB) : les entrées les moins récemment
+#   servies sont supprimées
+# =============================================================================
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+
+CACHE_DIR = os.getenv("EXPORT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "classimium_exports")
+CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_MB", "200")) * 1024 * 1024
+USE_HARDLINKS = os.getenv("EXPORT_CACHE_LINK", "0") == "1"
+
+KEY_VERSION = 2
+
+_FILE_HASHES = {}  # (chemin, mtime, taille) -> sha256 : reference.docx n'est pas relu à chaque export
+_LOCK = threading.Lock()
+
+
+def _file_digest(path: str) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "absent"
+    sig = (path, st.st_mtime_ns, st.st_size)
+    digest = _FILE_HASHES.get(sig)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _FILE_HASHES[sig] = digest
+    return digest
+
+
+def conversion_key(fmt: str, html: str, files=()) -> str:
+    """Empreinte d'une conversion : format + HTML + contenu des fichiers ressources."""
+    h = hashlib.sha256()
+    h.update(f"v{KEY_VERSION}:{fmt}".encode("ascii") + b"\0")
+    h.update((html or "").encode("utf-8") + b"\0")
+    for path in files:
+        h.update(_file_digest(path).encode("ascii") if path else b"none")
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _entry(key: str, fmt: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+
+def _place(src: str, dest: str):
+    """Copie (ou lien dur) src -> dest de façon atomique pour la destination."""
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    tmp = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        if USE_HARDLINKS:
+            try:
+                os.link(src, tmp)
+            except OSError:  # autre volume (partage réseau), FS sans liens...
+                shutil.copyfile(src, tmp)
+        else:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def fetch(key: str, fmt: str, out_path: str) -> bool:
+    """Si la conversion est en cache, la dépose dans out_path et retourne True."""
+    src = _entry(key, fmt)
+    if not os.path.isfile(src):
+        return False
+    try:
+        _place(src, out_path)
+        os.utime(src)  # « récemment servi » pour l'éviction
+        return True
+    except OSError as e:
+        print(f"[EXPORT] cache illisible ({src}): {e}")
+        return False
+
+
+def store(key: str, fmt: str, produced_path: str):
+    """Enregistre le fichier produit par une conversion réussie (best effort)."""
+    try:
+        if not os.path.isfile(produced_path) or os.path.getsize(produced_path) == 0:
+            return
+        _place(produced_path, _entry(key, fmt))
+        _prune()
+    except OSError as e:
+        print(f"[EXPORT] cache non écrit: {e}")
+
+
+def _prune():
+    with _LOCK:
+        entries, total = [], 0
+        for root, _dirs, names in os.walk(CACHE_DIR):
+            for name in names:
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                if name.endswith(".tmp") and time.time() - st.st_mtime < 3600:
+                    continue  # écriture en cours
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        for _mtime, size, p in sorted(entries):
+            if total <= CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+
+
+def cache_status() -> dict:
+    files, size = 0, 0
+    for root, _dirs, names in os.walk(CACHE_DIR):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+                files += 1
+            except OSError:
+                pass
+    return {"dir": CACHE_DIR, "files": files, "bytes": size, "max_bytes": CACHE_MAX_BYTES,
+            "hardlinks": USE_HARDLINKS}
@@ -0,0 +1,426 @@
+# exports/docx_native.py
+# =============================================================================
+# Conversion HTML -> DOCX en process (python-docx), sans pandoc
+# Couvre le sous-ensemble produit par TinyMCE puis normalize_html_for_docx :
+#   h1-h6, p/div, br, strong/b, em/i, u, s/strike, sup/sub, a, span (gras,
+#   italique, souligné en style inline), ul/ol imbriquées, blockquote, pre,
+#   tables (th, colspan, MAX_TABLE_COLS colonnes au plus), alignement text-align.
+# Lecture en flux (html.parser) : chaque paragraphe est écrit dès sa fermeture,
+# les tables sont tamponnées jusqu'à </table> (nombre de colonnes requis).
+# Styles repris de reference.docx (Heading N, Quote, Table Grid...) ; les
+# styles absents retombent sur des équivalents (liste -> List Paragraph + puce).
+# Tout élément hors sous-ensemble (img, rowspan, table imbriquée...) lève
+# UnsupportedHTML : l'appelant bascule alors sur pandoc.
+# =============================================================================
+import re
+from html.parser import HTMLParser
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Pt, RGBColor
+
+LIST_INDENT_PT = 18
+MAX_TABLE_COLS = 63  # limite de Word : au-delà, pandoc
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+BLOCK_TAGS = HEADING_TAGS | {"p", "div", "li", "pre", "blockquote", "section", "article"}
+INLINE_FLAGS = {"strong": "bold", "b": "bold", "em": "italic", "i": "italic", "u": "underline",
+                "s": "strike", "strike": "strike", "del": "strike", "sup": "superscript",
+                "sub": "subscript", "code": "mono"}
+IGNORED_TAGS = {"html", "body", "thead", "tbody", "tfoot", "colgroup", "col", "font", "small", "big",
+                "mark", "abbr", "label", "ins"}
+SKIP_CONTENT_TAGS = {"head", "style", "script", "title"}
+UNSUPPORTED_TAGS = {"img", "svg", "math", "iframe", "video", "audio", "object", "embed",
+                    "form", "input", "select", "textarea", "canvas", "picture", "figure"}
+ALIGNMENTS = {"left": WD_ALIGN_PARAGRAPH.LEFT, "center": WD_ALIGN_PARAGRAPH.CENTER,
+              "right": WD_ALIGN_PARAGRAPH.RIGHT, "justify": WD_ALIGN_PARAGRAPH.JUSTIFY}
+
+_WS = re.compile(r"[ \t\r\n\f]+")  # pas \s : les &nbsp; sont conservés
+
+
+class UnsupportedHTML(ValueError):
+    """Le HTML sort du sous-ensemble géré : utiliser pandoc."""
+
+
+def _style_attr(attrs) -> dict:
+    out = {}
+    for decl in (dict(attrs).get("style") or "").split(";"):
+        if ":" in decl:
+            k, v = decl.split(":", 1)
+            out[k.strip().lower()] = v.strip().lower()
+    return out
+
+
+def _pick_style(doc, *names):
+    available = {s.name for s in doc.styles}
+    for name in names:
+        if name in available:
+            return name
+    return None
+
+
+class _Block:
+    """Paragraphe en cours : style, runs [(texte, format)], puce, retrait, alignement."""
+    __slots__ = ("style", "runs", "prefix", "indent", "align", "pre")
+
+    def __init__(self, style=None, prefix="", indent=0, align=None, pre=False):
+        self.style, self.prefix, self.indent, self.align, self.pre = style, prefix, indent, align, pre
+        self.runs = []
+
+    def is_empty(self) -> bool:
+        return not self.prefix and not any(t.strip() for t, _f in self.runs)
+
+
+class _Converter(HTMLParser):
+    def __init__(self, doc):
+        super().__init__(convert_charrefs=True)
+        self.doc = doc
+        self.styles = {
+            "body": _pick_style(doc, "Body Text", "Normal"),
+            "quote": _pick_style(doc, "Quote", "Block Text", "Intense Quote"),
+            "ul": _pick_style(doc, "List Bullet"),
+            "ol": _pick_style(doc, "List Number"),
+            "list": _pick_style(doc, "List Paragraph"),
+            "table": _pick_style(doc, "Table", "Table Grid"),
+            "pre": _pick_style(doc, "Source Code", "HTML Preformatted"),
+        }
+        # nom -> styleId, résolu une fois (p.style = "nom" reparcourt styles.xml à chaque paragraphe)
+        default = doc.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+        self.style_ids = {st.name: (None if default is not None and st.style_id == default.style_id
+                                    else st.style_id)
+                          for st in doc.styles if st.type == WD_STYLE_TYPE.PARAGRAPH}
+        self.block = None
+        self.contexts = [{"style": self.styles["body"], "indent": 0}]  # style des paragraphes implicites
+        self.fmt = []          # pile des formats inline : [(tag, {flag: True, "href": ...})]
+        self.lists = []        # [{"ordered": bool, "n": int}]
+        self.table = None      # {"rows": [[cell]], "cell": {...}|None}
+        self.skip = 0
+        self.pre = 0
+
+    # ----- formats inline -----
+    def _current_fmt(self) -> dict:
+        out = {}
+        for _tag, f in self.fmt:
+            out.update(f)
+        return out
+
+    def _append(self, text: str):
+        if not text:
+            return
+        if self.block is None:
+            ctx = self.contexts[-1]
+            if not self.pre and not text.strip():
+                return
+            self.block = _Block(ctx["style"], indent=ctx["indent"], pre=bool(self.pre))
+        self.block.runs.append((text, self._current_fmt()))
+
+    # ----- blocs -----
+    def _flush(self):
+        block, self.block = self.block, None
+        if block is None or block.is_empty():
+            return
+        if self.table is not None:
+            if self.table["cell"] is None:  # texte entre <tr>/<td> : ignoré comme un navigateur
+                return
+            self.table["cell"]["blocks"].append(block)
+        else:
+            _write_block(self.doc, block, self.style_ids)
+
+    def _open_block(self, tag, attrs):
+        css = _style_attr(attrs)
+        align = ALIGNMENTS.get(css.get("text-align", ""))
+        if tag in ("p", "div") and self.block is not None and not self.block.runs:
+            # <li><p>...</p></li>, <td><p>...</p></td> : le <p> reprend le bloc ouvert (puce comprise)
+            if align is not None:
+                self.block.align = align
+            return
+        self._flush()
+        ctx = self.contexts[-1]
+        if tag in HEADING_TAGS:
+            style = f"Heading {tag[1]}"
+            block = _Block(style if style in self.style_ids else None, indent=ctx["indent"], align=align)
+        elif tag == "li":
+            if not self.lists:
+                self.lists.append({"ordered": False, "n": 0})
+            lst = self.lists[-1]
+            lst["n"] += 1
+            level = len(self.lists)
+            native = self.styles["ol" if lst["ordered"] else "ul"]
+            if native and level == 1:
+                block = _Block(native, align=align)
+            else:
+                prefix = f"{lst['n']}.\t" if lst["ordered"] else ("•\t" if level % 2 else "◦\t")
+                block = _Block(self.styles["list"], prefix=prefix, indent=LIST_INDENT_PT * level, align=align)
+            # suite du même <li> (après une sous-liste) : retrait de la liste, sans nouvelle puce
+            self.contexts.append({"style": self.styles["list"] or self.styles["body"],
+                                  "indent": LIST_INDENT_PT * level})
+        elif tag == "blockquote":
+            self.contexts.append({"style": self.styles["quote"] or ctx["style"], "indent": ctx["indent"]})
+            return
+        elif tag == "pre":
+            self.pre += 1
+            block = _Block(self.styles["pre"] or ctx["style"], indent=ctx["indent"], align=align, pre=True)
+        else:
+            block = _Block(ctx["style"], indent=ctx["indent"], align=align)
+        self.block = block
+
+    def _close_block(self, tag):
+        self._flush()
+        if tag in ("li", "blockquote") and len(self.contexts) > 1:
+            self.contexts.pop()
+        elif tag == "pre":
+            self.pre = max(0, self.pre - 1)
+
+    # ----- tables -----
+    def _table_start(self):
+        if self.table is not None:
+            raise UnsupportedHTML("table imbriquée")
+        self._flush()
+        self.table = {"rows": [], "cell": None, "saved": (self.contexts, self.lists)}
+        self.contexts, self.lists = [{"style": self.styles["body"], "indent": 0}], []
+
+    def _table_end(self):
+        if self.table is None:
+            return
+        self._cell_end()
+        table, self.table = self.table, None
+        self.contexts, self.lists = table["saved"]
+        _write_table(self.doc, table["rows"], self.styles["table"], self.style_ids)
+
+    def _cell_start(self, tag, attrs):
+        if self.table is None:
+            raise UnsupportedHTML(f"<{tag}> hors table")
+        self._cell_end()
+        a = dict(attrs)
+        if (a.get("rowspan") or "1").strip() not in ("", "1"):
+            raise UnsupportedHTML("rowspan")
+        try:
+            span = max(1, int(a.get("colspan") or 1))
+        except ValueError:
+            span = 1
+        if not self.table["rows"]:
+            self.table["rows"].append([])
+        if span + sum(c["span"] for c in self.table["rows"][-1]) > MAX_TABLE_COLS:
+            raise UnsupportedHTML(f"table de plus de {MAX_TABLE_COLS} colonnes")
+        cell = {"blocks": [], "span": span, "header": tag == "th"}
+        self.table["rows"][-1].append(cell)
+        self.table["cell"] = cell
+        if cell["header"]:
+            self.fmt.append(("th", {"bold": True}))
+
+    def _cell_end(self):
+        if self.table is None or self.table["cell"] is None:
+            return
+        self._flush()
+        if self.table["cell"]["header"]:
+            self._pop_fmt("th")
+        self.table["cell"] = None
+
+    # ----- HTMLParser -----
+    def _pop_fmt(self, tag):
+        for i in range(len(self.fmt) - 1, -1, -1):
+            if self.fmt[i][0] == tag:
+                del self.fmt[i]
+                return
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_CONTENT_TAGS:
+            self.skip += 1
+            return
+        if self.skip:
+            return
+        if tag in UNSUPPORTED_TAGS:
+            raise UnsupportedHTML(f"<{tag}>")
+        if tag in INLINE_FLAGS:
+            self.fmt.append((tag, {INLINE_FLAGS[tag]: True}))
+        elif tag == "span":
+            css, f = _style_attr(attrs), {}
+            if css.get("font-weight") in ("bold", "bolder", "600", "700", "800", "900"):
+                f["bold"] = True
+            if css.get("font-style") == "italic":
+                f["italic"] = True
+            if "underline" in css.get("text-decoration", ""):
+                f["underline"] = True
+            if "line-through" in css.get("text-decoration", ""):
+                f["strike"] = True
+            self.fmt.append(("span", f))
+        elif tag == "a":
+            href = dict(attrs).get("href") or ""
+            self.fmt.append(("a", {"href": href} if href and not href.startswith("#") else {}))
+        elif tag == "br":
+            self._append("\n")
+        elif tag == "hr":
+            self._flush()
+        elif tag in ("ul", "ol"):
+            self._flush()
+            self.lists.append({"ordered": tag == "ol", "n": 0})
+        elif tag == "table":
+            self._table_start()
+        elif tag == "tr":
+            if self.table is None:
+                raise UnsupportedHTML("<tr> hors table")
+            self._cell_end()
+            self.table["rows"].append([])
+        elif tag in ("td", "th"):
+            self._cell_start(tag, attrs)
+        elif tag in BLOCK_TAGS:
+            self._open_block(tag, attrs)
+        elif tag == "caption":
+            raise UnsupportedHTML("<caption>")
+        elif tag not in IGNORED_TAGS:
+            raise UnsupportedHTML(f"<{tag}>")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in ("br", "hr", "img", "col"):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_CONTENT_TAGS:
+            self.skip = max(0, self.skip - 1)
+            return
+        if self.skip:
+            return
+        if tag in INLINE_FLAGS or tag in ("span", "a"):
+            self._pop_fmt(tag)
+        elif tag in ("ul", "ol"):
+            self._flush()
+            if self.lists:
+                self.lists.pop()
+        elif tag == "table":
+            self._table_end()
+        elif tag in ("td", "th"):
+            self._cell_end()
+        elif tag == "tr":
+            self._cell_end()
+        elif tag in BLOCK_TAGS:
+            self._close_block(tag)
+
+    def handle_data(self, data):
+        if self.skip:
+            return
+        if not self.pre:
+            data = _WS.sub(" ", data)
+            if self.block is None or not self.block.runs or self.block.runs[-1][0].endswith((" ", "\n")):
+                data = data.lstrip(" ")
+        self._append(data)
+
+    def close(self):
+        super().close()
+        self._table_end()
+        self._flush()
+
+
+# ===== Écriture python-docx =====
+def _add_hyperlink(paragraph, url: str, text: str, fmt: dict):
+    r_id = paragraph.part.relate_to(url, RT.HYPERLINK, is_external=True)
+    link = OxmlElement("w:hyperlink")
+    link.set(qn("r:id"), r_id)
+    run = paragraph.add_run(text)
+    _apply_fmt(run, fmt)
+    run.font.underline = True
+    run.font.color.rgb = RGBColor(0x05, 0x63, 0xC1)
+    link.append(run._r)
+    paragraph._p.append(link)
+
+
+def _apply_fmt(run, fmt: dict):
+    if fmt.get("bold"):
+        run.bold = True
+    if fmt.get("italic"):
+        run.italic = True
+    if fmt.get("underline"):
+        run.underline = True
+    if fmt.get("strike"):
+        run.font.strike = True
+    if fmt.get("superscript"):
+        run.font.superscript = True
+    if fmt.get("subscript"):
+        run.font.subscript = True
+    if fmt.get("mono"):
+        run.font.name = "Consolas"
+
+
+def _fill_paragraph(p, block: _Block, style_ids: dict):
+    if block.style and style_ids.get(block.style):
+        p._p.style = style_ids[block.style]
+    if block.align is not None:
+        p.alignment = block.align
+    if block.indent:
+        p.paragraph_format.left_indent = Pt(block.indent)
+        if block.prefix:
+            p.paragraph_format.first_line_indent = Pt(-LIST_INDENT_PT)
+    if block.prefix:
+        p.add_run(block.prefix)
+
+    runs = list(block.runs)
+    if not block.pre:  # espaces de fin de paragraphe, comme le rendu HTML
+        while runs and not runs[-1][0].strip(" "):
+            runs.pop()
+        if runs:
+            runs[-1] = (runs[-1][0].rstrip(" "), runs[-1][1])
+    for text, fmt in runs:
+        parts = text.split("\n")
+        for i, part in enumerate(parts):
+            if i:
+                p.add_run().add_break()
+            if not part:
+                continue
+            if fmt.get("href"):
+                _add_hyperlink(p, fmt["href"], part, fmt)
+            else:
+                run = p.add_run(part)
+                _apply_fmt(run, fmt)
+                if block.pre:
+                    run.font.name = run.font.name or "Consolas"
+
+
+def _write_block(container, block: _Block, style_ids: dict):
+    _fill_paragraph(container.add_paragraph(), block, style_ids)
+
+
+def _write_table(doc, rows, style, style_ids: dict):
+    rows = [r for r in rows if r]
+    if not rows:
+        return
+    ncols = max(sum(c["span"] for c in r) for r in rows)
+    table = doc.add_table(rows=len(rows), cols=ncols)
+    if style:
+        table.style = style
+    for ri, row in enumerate(rows):
+        ci = 0
+        for cell in row:
+            target = table.cell(ri, ci)
+            if cell["span"] > 1:
+                target = target.merge(table.cell(ri, min(ncols - 1, ci + cell["span"] - 1)))
+            first = True
+            for block in cell["blocks"]:
+                p = target.paragraphs[0] if first else target.add_paragraph()
+                _fill_paragraph(p, block, style_ids)
+                first = False
+            ci += cell["span"]
+    doc.add_paragraph()  # pas de tables collées (comme pandoc)
+
+
+def _new_document(reference_docx: str | None):
+    doc = Document(reference_docx) if reference_docx else Document()
+    body = doc.element.body
+    for child in list(body):  # gabarit : on garde les styles et la mise en page, pas le contenu
+        if child.tag != qn("w:sectPr"):
+            body.remove(child)
+    return doc
+
+
+def html_to_docx(html: str, out_path: str, reference_docx: str | None = None):
+    """
+    Convertit `html` (sous-ensemble éditeur) en DOCX dans out_path.
+    Lève UnsupportedHTML si le contenu sort du sous-ensemble (rien n'est écrit).
+    """
+    doc = _new_document(reference_docx)
+    conv = _Converter(doc)
+    conv.feed(html or "")
+    conv.close()
+    doc.save(out_path)
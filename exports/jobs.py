@@ -0,0 +1,111 @@
+# exports/jobs.py
+# =============================================================================
+# File d'attente des exports (DOCX / PDF) hors des threads de requête
+# - submit() rend la main tout de suite avec un id de job ; la conversion
+#   tourne dans un pool borné (EXPORT_WORKERS) : 2-3 exports simultanés ne
+#   bloquent plus les threads waitress qui servent l'interface
+# - un job identique (même clé) déjà en attente / en cours n'est pas relancé :
+#   le même id est renvoyé
+# - progression par étapes (stage) + résultat (chemin, taille) ou erreur,
+#   consultables via get() ; jobs terminés oubliés après JOB_TTL_S
+# =============================================================================
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+JOB_TTL_S = 3600
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, EXPORT_WORKERS), thread_name_prefix="export-job")
+_JOBS = {}
+_ACTIVE = {}  # clé de dédoublonnage -> job_id (jobs en attente / en cours)
+_LOCK = threading.Lock()
+
+
+def _public(job: dict) -> dict:
+    return {k: v for k, v in job.items() if not k.startswith("_")}
+
+
+def _prune():
+    limit = time.time() - JOB_TTL_S
+    for jid in [j for j, v in _JOBS.items()
+                if v["status"] in (DONE, ERROR) and (v["finished"] or 0) < limit]:
+        _JOBS.pop(jid, None)
+
+
+def _run(job_id: str, fn, args, kwargs):
+    job = _JOBS[job_id]
+    job.update(status=RUNNING, started=time.time(), stage="démarrage")
+
+    def progress(stage: str, **extra):
+        job["stage"] = stage
+        job.update(extra)
+
+    try:
+        result = fn(*args, progress=progress, **kwargs) or {}
+        job.update(status=DONE, stage="terminé", result=result)
+    except Exception as e:
+        job.update(status=ERROR, error=str(e))
+        print(f"[EXPORT] job {job_id} KO: {e}")
+    finally:
+        job["finished"] = time.time()
+        job["duration_ms"] = round((job["finished"] - job["started"]) * 1000)
+        with _LOCK:
+            if _ACTIVE.get(job["key"]) == job_id:
+                _ACTIVE.pop(job["key"], None)
+
+
+def submit(key, fn, *args, label: str = "", **kwargs) -> tuple:
+    """
+    Planifie fn(*args, progress=callback, **kwargs) ; fn retourne un dict
+    (résultat du job). Retourne (job public, créé: bool) — créé=False si un job
+    de même clé était déjà en attente / en cours.
+    """
+    key = repr(key)
+    with _LOCK:
+        _prune()
+        existing = _ACTIVE.get(key)
+        if existing and existing in _JOBS:
+            return _public(_JOBS[existing]), False
+        job_id = uuid.uuid4().hex[:12]
+        _JOBS[job_id] = {
+            "id": job_id, "key": key, "label": label, "status": QUEUED, "stage": "en attente",
+            "created": time.time(), "started": None, "finished": None, "duration_ms": None,
+            "result": None, "error": None,
+        }
+        _ACTIVE[key] = job_id
+    _EXECUTOR.submit(_run, job_id, fn, args, kwargs)
+    return _public(_JOBS[job_id]), True
+
+
+def get(job_id: str):
+    job = _JOBS.get(job_id)
+    if job is None:
+        return None
+    out = _public(job)
+    if job["status"] == QUEUED:
+        with _LOCK:
+            out["position"] = sum(1 for v in _JOBS.values()
+                                  if v["status"] == QUEUED and v["created"] < job["created"])
+    return out
+
+
+def wait(job_id: str, timeout: float):
+    """Attend la fin du job (au plus `timeout` s) ; retourne son état public."""
+    end = time.time() + timeout
+    while time.time() < end:
+        job = _JOBS.get(job_id)
+        if job is None or job["status"] in (DONE, ERROR):
+            break
+        time.sleep(0.1)
+    return get(job_id)
+
+
+def list_jobs(limit: int = 50) -> list:
+    with _LOCK:
+        jobs = sorted(_JOBS.values(), key=lambda j: j["created"], reverse=True)[:limit]
+        return [_public(j) for j in jobs]
@@ -0,0 +1,212 @@
+# exports/share.py
+# =============================================================================
+# Surveillance du partage réseau des exports (UNC / RaiDrive) + index des dossiers
+# - un thread de fond teste les racines candidates toutes les CHECK_EVERY_S,
+#   chaque accès disque borné par PROBE_TIMEOUT_S (un montage SMB figé ne
+#   bloque que le thread de sondage, jamais un thread waitress)
+# - sur la racine retenue : index des dossiers d'année « (AAAA-AAAA) » et de
+#   leurs sous-dossiers « Réunions » (lecture seule, remplacé en bloc)
+# - les requêtes lisent l'instantané (active_root, year_folder...) sans I/O ;
+#   la racine y est publiée dès qu'elle répond, avant l'indexation (qui peut
+#   être longue sur un partage lent mais sain)
+# - un accès encore bloqué n'est pas relancé : la racine reste « indisponible »
+#   jusqu'à ce que l'appel précédent rende la main
+# =============================================================================
+import os
+import re
+import time
+import threading
+from pathlib import Path
+
+CHECK_EVERY_S = int(os.getenv("DOCS_SHARE_CHECK_S", "30"))
+PROBE_TIMEOUT_S = float(os.getenv("DOCS_SHARE_TIMEOUT_S", "4"))
+
+_YEAR_RE = re.compile(r"\((\d{4}-\d{4})\)")
+
+
+class ShareTimeout(OSError):
+    pass
+
+
+class ShareMonitor:
+    def __init__(self, candidates, reunions_dirname):
+        """candidates() -> [chemins bruts] ; reunions_dirname() -> nom du dossier Réunions."""
+        self._candidates = candidates
+        self._reunions_dirname = reunions_dirname
+        self._snapshot = {"root": None, "indexed": None, "checked_at": None, "roots": {}, "years": {},
+                          "reunions": {}, "scan_ms": None}
+        self._pending = set()      # appels disque encore bloqués (par clé)
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._root_ready = threading.Event()  # racine sondée (premier passage)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # ----- accès disque bornés -----
+    def _call(self, key: str, fn, *args):
+        with self._pending_lock:
+            if key in self._pending:
+                raise ShareTimeout(f"{key}: accès précédent toujours bloqué")
+            self._pending.add(key)
+        box = {}
+
+        def _target():
+            try:
+                box["value"] = fn(*args)
+            except BaseException as e:
+                box["error"] = e
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(key)
+
+        t = threading.Thread(target=_target, name="share-probe", daemon=True)
+        t.start()
+        t.join(PROBE_TIMEOUT_S)
+        if t.is_alive():
+            raise ShareTimeout(f"{key}: pas de réponse en {PROBE_TIMEOUT_S:g} s")
+        if "error" in box:
+            raise box["error"]
+        return box["value"]
+
+    @staticmethod
+    def _list_dirs(path: str) -> list:
+        with os.scandir(path) as it:
+            return [(e.name, e.stat().st_mtime) for e in it if e.is_dir()]
+
+    # ----- sondage + indexation -----
+    def _scan(self):
+        t0 = time.perf_counter()
+        roots, active = {}, None
+        for raw in self._candidates():
+            if not raw or raw in roots:
+                continue
+            try:
+                ok = self._call(f"isdir:{raw}", os.path.isdir, raw)
+                roots[raw] = {"ok": ok, "error": None if ok else "introuvable"}
+            except OSError as e:
+                roots[raw] = {"ok": False, "error": str(e)}
+            if roots[raw]["ok"] and active is None:
+                active = str(Path(raw))  # même forme que str(pick_docs_root())
+                self._publish_root(active, roots)
+        if active is None:
+            self._publish_root(None, roots)
+
+        years, reunions, indexed = {}, {}, active
+        if active:
+            raw_active = next(r for r, v in roots.items() if v["ok"])
+            reunions_name = self._reunions_dirname()
+            try:
+                children = self._call(f"list:{active}", self._list_dirs, active)
+            except OSError as e:
+                roots[raw_active]["error"] = f"index: {e}"
+                children, indexed = [], None
+            # même règle que find_year_folder : suffixe exact (le plus récent), sinon présence
+            for name, mtime in children:
+                m = _YEAR_RE.search(name)
+                if not m:
+                    continue
+                annee, exact = m.group(1), name.endswith(m.group(0))
+                rank = (exact, mtime)
+                if annee not in years or rank > years[annee]["rank"]:
+                    years[annee] = {"path": str(Path(active) / name), "rank": rank}
+            for annee, y in years.items():
+                rdir = str(Path(y["path"]) / reunions_name)
+                try:
+                    subs = self._call(f"list:{rdir}", self._list_dirs, rdir)
+                    reunions[y["path"]] = {"path": rdir, "subdirs": sorted(n for n, _m in subs)}
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"[EXPORT] index {rdir} KO: {e}")
+
+        years = {a: y["path"] for a, y in years.items()}
+        prev = self._snapshot
+        if active and indexed is None and prev["indexed"] == active:
+            # listage KO : l'index précédent de cette racine reste valable
+            indexed, years, reunions = active, prev["years"], prev["reunions"]
+        # index absent (indexed=None) : pas de racine « vide » -> find_year_folder scanne
+        self._snapshot = {
+            "root": active, "indexed": indexed, "checked_at": time.time(), "roots": roots,
+            "years": years, "reunions": reunions,
+            "scan_ms": round((time.perf_counter() - t0) * 1000),
+        }
+
+    def _publish_root(self, active, roots):
+        """Racine retenue visible tout de suite ; l'index d'une autre racine est écarté."""
+        prev = self._snapshot
+        if active != prev["root"]:
+            self._snapshot = {**prev, "root": active, "indexed": None, "roots": dict(roots),
+                              "years": {}, "reunions": {}}
+            print(f"[EXPORT] racine sélectionnée => {active or 'aucune (partage indisponible)'}")
+        self._root_ready.set()
+
+    def _run(self):
+        while True:
+            try:
+                self._scan()
+            except Exception as e:
+                print(f"[EXPORT] surveillance partage KO: {e}")
+            self._root_ready.set()
+            self._ready.set()
+            self._wake.wait(CHECK_EVERY_S)
+            self._wake.clear()
+
+    # ----- API (sans I/O sur le partage) -----
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="share-monitor", daemon=True)
+                self._thread.start()
+
+    def refresh(self, wait: bool = False):
+        """Relance un sondage (config modifiée, dossier créé ailleurs...)."""
+        self.start()
+        self._ready.clear()
+        self._wake.set()
+        if wait:
+            self._ready.wait(PROBE_TIMEOUT_S * 2)
+
+    def active_root(self):
+        """Racine réseau disponible (Path) ou None ; attend au plus le premier sondage des racines."""
+        self.start()
+        if not self._root_ready.is_set():
+            self._root_ready.wait(PROBE_TIMEOUT_S * max(1, len(self._candidates())) + 1)
+        root = self._snapshot["root"]
+        return Path(root) if root else None
+
+    def probe_path(self, raw: str) -> dict:
+        """Test ponctuel d'un chemin (page de config), borné par PROBE_TIMEOUT_S."""
+        try:
+            return {"path": raw, "exists": bool(raw) and self._call(f"exists:{raw}", os.path.exists, raw)}
+        except OSError as e:
+            return {"path": raw, "exists": False, "error": str(e)}
+
+    def indexes(self, root) -> bool:
+        """True si `root` est la racine réseau indexée (sinon : dossier local, scan direct)."""
+        indexed = self._snapshot["indexed"]
+        return indexed is not None and str(root) == indexed
+
+    def year_folder(self, annee: str):
+        p = self._snapshot["years"].get(annee)
+        return Path(p) if p else None
+
+    def reunions_dir(self, year_dir) -> dict | None:
+        return self._snapshot["reunions"].get(str(year_dir))
+
+    def note_dir(self, year_dir, reunions_path, subdir: str | None = None):
+        """Enregistre un dossier Réunions / sous-dossier créé par l'application."""
+        reunions = dict(self._snapshot["reunions"])
+        entry = reunions.get(str(year_dir)) or {"path": str(reunions_path), "subdirs": []}
+        if subdir and subdir not in entry["subdirs"]:
+            entry = {**entry, "subdirs": sorted(entry["subdirs"] + [subdir])}
+        reunions[str(year_dir)] = entry
+        self._snapshot = {**self._snapshot, "reunions": reunions}
+
+    def status(self) -> dict:
+        s = self._snapshot
+        return {"root": s["root"], "checked_at": s["checked_at"], "scan_ms": s["scan_ms"],
+                "roots": s["roots"], "years": s["years"],
+                "reunions": {y: len(r["subdirs"]) for y, r in s["reunions"].items()},
+                "blocked_calls": sorted(self._pending),
+                "check_every_s": CHECK_EVERY_S, "timeout_s": PROBE_TIMEOUT_S}
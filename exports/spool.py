@@ -0,0 +1,222 @@
+# exports/spool.py
+# =============================================================================
+# Exports « local d'abord » + synchronisation de fond vers le partage réseau
+# - la conversion écrit dans un dossier local (spool), puis commit() y range le
+#   fichier de façon atomique (os.replace) avec une fiche JSON à côté :
+#   l'utilisateur n'attend plus l'écriture sur le partage
+# - un thread de fond copie chaque fichier vers son dossier final (résolu au
+#   moment de l'envoi : le partage peut être hors ligne à l'export), via un
+#   .part renommé, puis vérifie taille + sha256 avant de purger le spool
+# - échec / partage hors ligne : nouvelle tentative avec délai croissant
+#   (RETRY_BASE_S .. RETRY_MAX_S) ; la liste des envois en attente est
+#   consultable (pending()) et survit à un redémarrage (fiches sur disque)
+# - envoi impossible (rapport supprimé, fichier local disparu) ou MAX_ATTEMPTS
+#   échecs : état « failed », plus de tentative automatique ; la fiche reste
+#   visible dans pending() jusqu'à une relance manuelle (retry_now)
+# - les fiches ne sont écrites que par le thread d'envoi (retry_now le réveille)
+# =============================================================================
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+SPOOL_DIR = os.getenv("EXPORT_SPOOL_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "exports_spool")
+RETRY_BASE_S = 15
+RETRY_MAX_S = 900
+RECENT_KEEP = 50
+MAX_ATTEMPTS = 10
+
+
+class ShareOffline(OSError):
+    """Partage indisponible : l'envoi reste en attente (sans compter d'échec)."""
+
+
+class SpoolItemFailed(Exception):
+    """Envoi qui ne peut pas aboutir : pas de nouvelle tentative automatique."""
+
+
+# Erreurs définitives (ex. ValueError « Rapport introuvable » du résolveur)
+PERMANENT_ERRORS = (SpoolItemFailed, ValueError, LookupError)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class ExportSpool:
+    def __init__(self, resolve_dest_dir, is_online, spool_dir: str = SPOOL_DIR):
+        """
+        resolve_dest_dir(meta) -> dossier final (créé si besoin) ; lève ShareOffline
+        si le partage n'est pas joignable. is_online() -> bool, sans I/O.
+        """
+        self.dir = spool_dir
+        self._resolve = resolve_dest_dir
+        self._is_online = is_online
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._retry = False  # relance demandée, appliquée par le thread d'envoi
+        self._recent = []  # derniers envois réussis (mémoire)
+
+    # ----- côté export -----
+    def reserve(self, filename: str) -> str:
+        """Chemin de travail local pour la conversion (dossier privé par export)."""
+        work = os.path.join(self.dir, "work", uuid.uuid4().hex[:12])
+        os.makedirs(work, exist_ok=True)
+        return os.path.join(work, filename)
+
+    def commit(self, work_path: str, meta: dict, expected_dest: str | None = None) -> dict:
+        """
+        Range le fichier produit dans le spool + fiche ; réveille l'envoi.
+        expected_dest : chemin final prévu (affichage), si le partage est joignable.
+        """
+        item_id = os.path.basename(os.path.dirname(work_path))
+        filename = os.path.basename(work_path)
+        local = os.path.join(self.dir, f"{item_id}__{filename}")
+        os.replace(work_path, local)
+        try:
+            os.rmdir(os.path.dirname(work_path))
+        except OSError:
+            pass
+        item = {
+            "id": item_id, "filename": filename, "local_path": local, "meta": meta,
+            "size": os.path.getsize(local), "sha256": _sha256(local),
+            "created": time.time(), "attempts": 0, "next_try": 0, "last_error": None, "state": "pending",
+            "dest_path": expected_dest,
+        }
+        _write_json(self._card(item_id), item)
+        self.start()
+        self._wake.set()
+        return item
+
+    def _card(self, item_id: str) -> str:
+        return os.path.join(self.dir, f"{item_id}.json")
+
+    # ----- envoi -----
+    def _items(self) -> list:
+        out = []
+        try:
+            names = os.listdir(self.dir)
+        except FileNotFoundError:
+            return out
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.dir, name), encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(out, key=lambda i: i["created"])
+
+    def _upload(self, item: dict):
+        if not os.path.isfile(item["local_path"]):
+            raise SpoolItemFailed(f"fichier local absent : {item['local_path']}")
+        dest_dir = self._resolve(item["meta"])
+        dest = os.path.join(dest_dir, item["filename"])
+        part = f"{dest}.part"
+        shutil.copyfile(item["local_path"], part)
+        if os.path.getsize(part) != item["size"] or _sha256(part) != item["sha256"]:
+            os.remove(part)
+            raise OSError("vérification KO (taille / sha256 différents)")
+        os.replace(part, dest)
+        return dest
+
+    def _process(self, item: dict):
+        try:
+            dest = self._upload(item)
+        except ShareOffline as e:
+            item["last_error"] = str(e) or "partage hors ligne"
+            item["next_try"] = time.time() + RETRY_BASE_S
+            _write_json(self._card(item["id"]), item)
+            return False
+        except Exception as e:
+            item["attempts"] += 1
+            item["last_error"] = f"{type(e).__name__}: {e}"
+            if isinstance(e, PERMANENT_ERRORS) or item["attempts"] >= MAX_ATTEMPTS:
+                item["state"] = "failed"
+                item["next_try"] = None
+                print(f"[SYNC] {item['filename']} abandonné (essai {item['attempts']}): {e}")
+            else:
+                item["next_try"] = time.time() + min(RETRY_MAX_S, RETRY_BASE_S * 2 ** item["attempts"])
+                print(f"[SYNC] {item['filename']} KO (essai {item['attempts']}): {e}")
+            _write_json(self._card(item["id"]), item)
+            return False
+        for p in (item["local_path"], self._card(item["id"])):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        with self._lock:
+            self._recent.insert(0, {"id": item["id"], "filename": item["filename"], "dest_path": dest,
+                                    "synced_at": time.time()})
+            del self._recent[RECENT_KEEP:]
+        print(f"[SYNC] {item['filename']} -> {dest}")
+        return True
+
+    def _reset_for_retry(self):
+        """Relance manuelle : échéances remises à zéro, envois « failed » réactivés."""
+        for item in self._items():
+            if item["next_try"] or item.get("state") == "failed":
+                item["next_try"] = 0
+                if item.get("state") == "failed":
+                    item["state"] = "pending"
+                    item["attempts"] = 0
+                _write_json(self._card(item["id"]), item)
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            with self._lock:
+                retry, self._retry = self._retry, False
+            if retry:
+                self._reset_for_retry()
+            wait = RETRY_BASE_S
+            if self._is_online():
+                now = time.time()
+                for item in self._items():
+                    if item.get("state") == "failed":
+                        continue
+                    if item["next_try"] <= now:
+                        self._process(item)
+                    else:
+                        wait = min(wait, max(1, item["next_try"] - now))
+            self._wake.wait(wait)
+
+    # ----- API -----
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                os.makedirs(self.dir, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="export-sync", daemon=True)
+                self._thread.start()
+
+    def retry_now(self):
+        """Demande une relance immédiate ; les fiches sont remises à zéro par le thread d'envoi."""
+        with self._lock:
+            self._retry = True
+        self.start()
+        self._wake.set()
+
+    def pending(self) -> list:
+        return [{k: v for k, v in i.items() if k != "sha256"} for i in self._items()]
+
+    def status(self) -> dict:
+        with self._lock:
+            recent = list(self._recent)
+        return {"dir": self.dir, "online": self._is_online(), "pending": self.pending(), "recent": recent}
@@ -49,10 +49,16 @@
   // anti-duplications autosave (nouveaux meubles)
   const sentNewFurniture = new Set(); // uid client déjà envoyé durant un debounce
 
+  // dernier état connu du serveur, par entité (format "fil" sérialisé) -> n'envoyer que les changements
+  const savedPos = new Map();   // eleve_id -> JSON
+  const savedFurn = new Map();  // furniture id -> JSON
+
   // état global unifié
   let state = {
     plans: [],
     active_plan: null,
+    rev: 0,        // révision serveur du plan affiché (sync différentielle)
+    preview: null, // révision affichée en aperçu (historique), lecture seule
     furniture: [],
     positions: [],
     walls: [],     // [{ id, points:[{x,y}...] }] en UNITÉS
@@ -84,6 +90,9 @@
   const $dup = document.getElementById('pc_duplicate');
   const $act = document.getElementById('pc_activate');
   const $pdf = document.getElementById('pc_export_pdf');
+  const $hist = document.getElementById('pc_history');
+  const $thumbs = document.getElementById('pc_plan_thumbs');
+  const $histRestore = document.getElementById('pc_history_restore');
 
   const $elist = document.getElementById('pc_eleve_list');
   const $wrap = $stage.parentElement;
@@ -498,6 +507,19 @@
       }).then(jsonIfAny);
     },
 
+    getDelta: (planId, since) =>
+      fetch(`${API_BASE}/plans/${classeId}?plan_id=${encodeURIComponent(planId)}&since=${encodeURIComponent(since)}`, {
+        credentials: 'same-origin',
+        cache: 'no-store'
+      }).then(jsonIfAny),
+
+    sendOps: (plan_id, ops) =>
+      fetchWithCsrf(`${API_BASE}/plans/${plan_id}/ops`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ops })
+      }).then(jsonIfAny),
+
     create: (payload) =>
       fetchWithCsrf(`${API_BASE}/plans`, {
         method: 'POST',
@@ -515,6 +537,22 @@
         method: 'POST'
       }).then(jsonIfAny),
 
+    history: (plan_id) =>
+      fetch(`${API_BASE}/plans/${plan_id}/history`, {
+        credentials: 'same-origin',
+        cache: 'no-store'
+      }).then(jsonIfAny),
+
+    historyAt: (plan_id, rev) =>
+      fetch(`${API_BASE}/plans/${plan_id}/history/${rev}`, {
+        credentials: 'same-origin'
+      }).then(jsonIfAny),
+
+    restoreRevision: (plan_id, rev) =>
+      fetchWithCsrf(`${API_BASE}/plans/${plan_id}/history/${rev}/restore`, {
+        method: 'POST'
+      }).then(jsonIfAny),
+
     reset: (plan_id, full = false) =>
       fetchWithCsrf(`${API_BASE}/plans/${plan_id}/reset`, {
         method: 'POST',
@@ -610,112 +648,173 @@
   };
 
 
-  const autosavePositions = debounce(() => {
-    if (!state.active_plan) return;
-    const payload = state.positions.map(p => {
-      const raw = p.rotAbs ?? p.rot ?? 0;
-      const r = norm360(Math.round(raw));
-      return {
-        eleve_id: p.eleve_id,
-        x: Math.round(p.x * PLAN_SUBDIV),
-        y: Math.round(p.y * PLAN_SUBDIV),
-        seat_id: p.seat_id ?? null,
-        rotation: r,
-        rot: r
-      };
-    });
-    api.savePositions(state.active_plan.id, payload).catch(console.error);
+  // Format "fil" (unités × PLAN_SUBDIV) d'une position / d'un meuble
+  function posWire(p) {
+    const raw = p.rotAbs ?? p.rot ?? 0;
+    const r = norm360(Math.round(raw));
+    return {
+      eleve_id: p.eleve_id,
+      x: Math.round(p.x * PLAN_SUBDIV),
+      y: Math.round(p.y * PLAN_SUBDIV),
+      seat_id: p.seat_id ?? null,
+      rotation: r,
+      rot: r
+    };
+  }
+
+  function furnWire(f) {
+    return {
+      id: (f.id && f.id > 0) ? f.id : undefined,
+      client_uid: f.uid ?? null,
+      type: f.type,
+      label: f.label,
+      color: f.color || FURN_COLORS[f.type] || null,
+      x: Math.round(f.x * PLAN_SUBDIV),
+      y: Math.round(f.y * PLAN_SUBDIV),
+      w: Math.round(f.w * PLAN_SUBDIV),
+      h: Math.round(f.h * PLAN_SUBDIV),
+      rotation: round1(norm360(f.rotAbs ?? f.rotation ?? 0)),
+      z: f.z || 0,
+      radius: !!f.radius
+    };
+  }
+
+  // Révision renvoyée par une écriture : si rien ne s'est intercalé on avance,
+  // sinon (autre onglet/poste) on récupère le delta.
+  function noteServerRev(r) {
+    if (!r || !Number.isFinite(r.rev)) return;
+    if (r.prev_rev === state.rev) state.rev = r.rev;
+    else resyncSoon(0);
+  }
+
+  const autosavePositions = debounce(async () => {
+    if (!state.active_plan || state.preview != null) return;
+    const planId = state.active_plan.id;
+    const sent = [];
+    const ops = [];
+    for (const p of state.positions) {
+      const w = posWire(p);
+      const js = JSON.stringify(w);
+      if (savedPos.get(w.eleve_id) === js) continue;
+      sent.push([w.eleve_id, js]);
+      ops.push({ op: 'move', kind: 'position', ...w });
+    }
+    if (!ops.length) return;
+    try {
+      const r = await api.sendOps(planId, ops);
+      if (state.active_plan?.id !== planId) return;
+      sent.forEach(([id, js]) => savedPos.set(id, js));
+      noteServerRev(r);
+    } catch (e) { console.error(e); }
   }, 500);
 
-  // autosave meubles (resync uniquement si création, jamais pendant un drag)
-  // autosave meubles (resync uniquement si création, jamais pendant un drag)
+  // Envoie les meubles modifiés (update) et nouveaux (create) ; les ids créés
+  // reviennent dans la réponse -> pas de rechargement complet du plan.
+  async function sendFurnitureOps(list) {
+    if (!state.active_plan || state.preview != null) return;
+    const planId = state.active_plan.id;
+    const ops = [];
+    const sent = [];
+    const sentNew = new Map(); // client_uid -> format fil envoyé
+    for (const f of list) {
+      const w = furnWire(f);
+      if (w.id) {
+        const js = JSON.stringify(w);
+        if (savedFurn.get(w.id) === js) continue;
+        sent.push([w.id, js]);
+        ops.push({ op: 'update', kind: 'furniture', ...w });
+      } else if (w.client_uid && !sentNewFurniture.has(w.client_uid)) {
+        sentNewFurniture.add(w.client_uid);
+        sentNew.set(w.client_uid, w);
+        ops.push({ op: 'create', kind: 'furniture', ...w });
+      }
+    }
+    if (!ops.length) return;
+
+    let r;
+    try {
+      r = await api.sendOps(planId, ops);
+    } catch (err) {
+      console.error('[furniture ops] failed', err);
+      // on laisse une chance de renvoyer à la prochaine fenêtre
+      ops.filter(o => o.op === 'create').forEach(o => sentNewFurniture.delete(o.client_uid));
+      return;
+    }
+    if (state.active_plan?.id !== planId) return;
+    sent.forEach(([id, js]) => savedFurn.set(id, js));
+
+    // ids définitifs des créations
+    let movedMeanwhile = false;
+    for (const [uid, newId] of Object.entries(r?.created || {})) {
+      const f = state.furniture.find(x => x.uid === uid && !(x.id > 0));
+      sentNewFurniture.delete(uid);
+      if (!f) continue;
+      const oldId = f.id;
+      f.id = newId;
+      $stage.querySelectorAll(`.pc_furn[data-id="${oldId}"]`).forEach(el => { el.dataset.id = String(newId); });
+      if (f.color) lsSetColor(planId, newId, f.color);
+      savedFurn.set(newId, JSON.stringify({ ...sentNew.get(uid), id: newId }));
+      if (JSON.stringify(furnWire(f)) !== savedFurn.get(newId)) movedMeanwhile = true;
+    }
+    noteServerRev(r);
+    if (movedMeanwhile) autosaveFurniture();
+  }
+
+  // autosave meubles (debounce ; jamais de resync complet)
   const autosaveFurniture = (() => {
     let timer = null;
-    return () => {
+    const fn = () => {
       if (!state.active_plan) return;
       clearTimeout(timer);
-      timer = setTimeout(async () => {
-        try {
-          // 1) ne renvoyer qu’une fois les créations (uid) dans une même fenêtre de debounce
-          const payload = state.furniture
-            .filter(f => (f.id > 0) || (f.id <= 0 && !sentNewFurniture.has(f.uid)))
-            .map(f => ({
-              id: (f.id && f.id > 0) ? f.id : undefined,
-              client_uid: f.uid ?? null,
-              type: f.type,
-              label: f.label,
-              color: f.color || FURN_COLORS[f.type] || null,
-              x: Math.round(f.x * PLAN_SUBDIV),
-              y: Math.round(f.y * PLAN_SUBDIV),
-              w: Math.round(f.w * PLAN_SUBDIV),
-              h: Math.round(f.h * PLAN_SUBDIV),
-              rotation: round1(norm360(f.rotAbs ?? f.rotation ?? 0)),
-
-              z: f.z || 0,
-              radius: !!f.radius
-            }));
-
-          if (!payload.length) return;
-
-          // 2) marquer les créations contenues dans ce lot
-          const createdUIDs = payload.filter(p => !p.id && p.client_uid).map(p => p.client_uid);
-          createdUIDs.forEach(uid => sentNewFurniture.add(uid));
-
-          // 3) PUT
-          await api.saveFurniture(state.active_plan.id, payload);
-
-          // 4) si on vient de créer, résync rapide (sauf pendant un drag)
-          if (createdUIDs.length && !isDraggingNow) {
-            pendingSelSnap = selectionSnapshot();
-            resyncSoon(0);
-          }
-        } catch (err) {
-          console.error('[autosaveFurniture] PUT failed', err);
-          // on laisse une chance de renvoyer à la prochaine fenêtre
-          sentNewFurniture.clear();
-        }
-      }, 500);
+      timer = setTimeout(() => { sendFurnitureOps(state.furniture || []).catch(console.error); }, 500);
     };
+    fn.cancel = () => clearTimeout(timer);
+    return fn;
   })();
 
 
+  // Enregistre les murs ; le serveur renvoie les murs normalisés (points
+  // redondants retirés) qu'on adopte si rien n'a bougé entre-temps.
+  async function saveWallsNow(planId) {
+    if (state.preview != null) return; // aperçu d'une version : lecture seule
+    const payloadWalls = encodeWallsForStorage(state.walls);
+    const sentJs = JSON.stringify(payloadWalls);
+    let stored = payloadWalls;
+    try {
+      const r = await api.saveWalls(planId, payloadWalls);
+      noteServerRev(r);
+      if (Array.isArray(r?.walls)) {
+        stored = r.walls;
+        const unchanged = state.active_plan?.id === planId
+          && JSON.stringify(encodeWallsForStorage(state.walls)) === sentJs;
+        if (unchanged && JSON.stringify(r.walls) !== sentJs) {
+          state.walls = decodeWallsFromStorage(r.walls);
+          renderWalls();
+        }
+      }
+    } catch (e) { console.warn('saveWalls API KO', e); }
+    try { localStorage.setItem(`pc_walls_${planId}`, JSON.stringify(stored)); } catch { }
+  }
+
   // autosave murs (déplacés au clavier)
   const autosaveWalls = debounce(async () => {
-    if (!state.active_plan) return;
+    if (!state.active_plan || state.preview != null) return;
     dedupeWallsInState();
-    const planId = state.active_plan.id;
-    const payloadWalls = encodeWallsForStorage(state.walls);
-    try { await api.saveWalls?.(planId, payloadWalls); } catch (e) { console.warn('saveWalls API KO', e); }
-    try { localStorage.setItem(`pc_walls_${planId}`, JSON.stringify(payloadWalls)); } catch { }
+    await saveWallsNow(state.active_plan.id);
   }, 500);
 
   // sauvegarde immédiate d'un meuble (pour couleur etc.)
   async function saveFurnitureItemImmediate(f) {
     if (!state.active_plan || !f) return;
-    const payload = [{
-      id: (f.id && f.id > 0) ? f.id : undefined,
-      client_uid: f.uid ?? null,
-      type: f.type,
-      label: f.label,
-      color: f.color || FURN_COLORS[f.type] || null,
-      x: Math.round(f.x * PLAN_SUBDIV),
-      y: Math.round(f.y * PLAN_SUBDIV),
-      w: Math.round(f.w * PLAN_SUBDIV),
-      h: Math.round(f.h * PLAN_SUBDIV),
-      rotation: round1(norm360(f.rotAbs ?? f.rotation ?? 0)),
-
-      z: f.z || 0,
-      radius: !!f.radius
-    }];
-    try { await api.saveFurniture(state.active_plan.id, payload); } catch (e) { console.error(e); }
+    await sendFurnitureOps([f]);
   }
 
+  // Resync : ne récupère que les changements depuis state.rev
   let resyncTimer = null;
   function resyncSoon(delay = 600) {
     clearTimeout(resyncTimer);
     if (isDraggingNow) return;
-    if (!pendingSelSnap) pendingSelSnap = selectionSnapshot();
-    resyncTimer = setTimeout(() => boot().catch(console.error), delay);
+    resyncTimer = setTimeout(() => syncDelta().catch(console.error), delay);
   }
 
   // [4] ----------------------------------------------------------------------
@@ -727,7 +826,8 @@
     const planW = state.active_plan.width;
     const planH = state.active_plan.height;
 
-    const toolbarH = (document.querySelector('.pc_toolbar')?.offsetHeight || 52);
+    const toolbarH = (document.querySelector('.pc_toolbar')?.offsetHeight || 52)
+      + ($thumbs?.offsetHeight || 0);
     const pagePad = 16;
     const verticalGap = 16;
     const availH = Math.max(120, window.innerHeight - toolbarH - pagePad - verticalGap);
@@ -955,6 +1055,38 @@
       if (state.active_plan && p.id === state.active_plan.id) o.selected = true;
       $sel.appendChild(o);
     }
+    renderPlanThumbs();
+  }
+
+  // Vignettes des plans de la classe (rendues et cachées côté serveur par révision :
+  // ?v=<revision> -> l'image n'est re-téléchargée que si le plan a changé)
+  let thumbsSig = '';
+  function renderPlanThumbs() {
+    if (!$thumbs) return;
+    const activeId = state.active_plan?.id;
+    const sig = JSON.stringify([activeId, state.plans.map(p => [p.id, p.revision, p.name])]);
+    if (sig === thumbsSig) return;
+    thumbsSig = sig;
+    $thumbs.innerHTML = '';
+    for (const p of state.plans) {
+      const b = document.createElement('button');
+      b.type = 'button';
+      b.className = 'pc_plan_thumb' + (p.id === activeId ? ' is-current' : '');
+      b.title = p.name;
+      const img = document.createElement('img');
+      img.loading = 'lazy';
+      img.alt = '';
+      img.src = `${API_BASE}/plans/${p.id}/thumb.svg?v=${encodeURIComponent(p.revision ?? 0)}`;
+      const cap = document.createElement('span');
+      cap.textContent = (p.is_active ? '★ ' : '') + p.name;
+      b.append(img, cap);
+      b.addEventListener('click', () => {
+        if (!$sel || p.id === state.active_plan?.id) return;
+        $sel.value = String(p.id);
+        $sel.dispatchEvent(new Event('change'));
+      });
+      $thumbs.appendChild(b);
+    }
   }
 
   function clearStage() {
@@ -2277,9 +2409,8 @@
       }
     }
 
-    // ----- sauvegarde unique + resync contrôlé
+    // ----- sauvegarde unique (seuls les meubles modifiés partent)
     try { autosaveFurniture?.(); } catch (e) { console.warn(e); }
-    try { resyncSoon?.(0); } catch (e) { console.warn(e); }
 
     // cleanup
     pendingShiftDeselect = null;
@@ -2711,9 +2842,7 @@
 
         const planId = (typeof currentPlanIdSafe === 'function') ? currentPlanIdSafe() : null;
         if (planId != null && window.api?.saveWalls && typeof encodeWallsForStorage === 'function') {
-          const payloadWalls = encodeWallsForStorage(state.walls);
-          await api.saveWalls(planId, payloadWalls);
-          try { localStorage.setItem(`pc_walls_${planId}`, JSON.stringify(payloadWalls)); } catch { }
+          await saveWallsNow(planId);
         }
       } catch (e) {
         console.warn('[AutoWalls] save/render walls error:', e);
@@ -2805,6 +2934,7 @@
 
   // 7.5 Tracé des murs (SVG) — live length + live angle + verrou 90° (Maj)
   function startWallTool(ev) {
+    if (state.preview != null) return;
     ev?.preventDefault?.();
     if (document.body.classList.contains('pc_wall_mode')) return;
     if (!$svg || !$stage || !state.active_plan) return;
@@ -2967,9 +3097,7 @@
     };
 
     async function persistWalls() {
-      const payloadWalls = encodeWallsForStorage(state.walls);
-      try { await api.saveWalls?.(planId, payloadWalls); } catch (e) { console.warn('saveWalls API KO', e); }
-      try { localStorage.setItem(`pc_walls_${planId}`, JSON.stringify(payloadWalls)); } catch { }
+      await saveWallsNow(planId);
     }
 
     const finish = async () => {
@@ -3448,8 +3576,10 @@
 
     if (typ === 'eleve') {
       const eleveId = parseInt(el.dataset.id, 10);
-      api.deletePosition(state.active_plan.id, eleveId).then(() => {
+      api.deletePosition(state.active_plan.id, eleveId).then((r) => {
         state.positions = state.positions.filter(p => p.eleve_id !== eleveId);
+        savedPos.delete(eleveId);
+        noteServerRev(r);
         el.remove();
         renderEleveList();
         selection.delete(el);
@@ -3474,8 +3604,10 @@
         return;
       }
 
-      api.deleteFurniture(state.active_plan.id, fid).then(() => {
+      api.deleteFurniture(state.active_plan.id, fid).then((r) => {
         state.furniture = state.furniture.filter(f => f.id !== fid);
+        savedFurn.delete(fid);
+        noteServerRev(r);
         lsDelColor(state.active_plan.id, fid);
         el.remove();
         selection.delete(el);
@@ -3506,6 +3638,83 @@
     };
   }
 
+  function fromDBFurniture(f, active_plan, prevTmpByUid = new Map(), prevColorById = new Map()) {
+    const rot = round1(norm360(parseFloat(f.rotation ?? f.rotAbs ?? 0)));
+
+    let color = (f.color != null ? f.color : null);
+    if (color == null && active_plan && f.id > 0) {
+      color = lsGetColor(active_plan.id, f.id) || prevColorById.get(f.id) || null;
+    }
+    const prevTmp = f.client_uid ? prevTmpByUid.get(f.client_uid) : null;
+    if (color == null && prevTmp?.color) color = prevTmp.color;
+
+    const t = (f.type || 'autre').toLowerCase().replace(/\s+/g, '_');
+    if (color == null) color = FURN_COLORS[t] || FURN_DEF_COLORS[t] || null;
+    if (active_plan && f.id > 0 && color) lsSetColor(active_plan.id, f.id, color);
+
+    return {
+      ...f,
+      x: (+f.x || 0) / PLAN_SUBDIV,
+      y: (+f.y || 0) / PLAN_SUBDIV,
+      w: (+f.w || 1) / PLAN_SUBDIV,
+      h: (+f.h || 1) / PLAN_SUBDIV,
+      rotation: rot,
+      rotAbs: rot,
+      color,
+      radius: !!f.radius
+    };
+  }
+
+  // Mémorise l'état serveur courant (base des envois différentiels)
+  function rememberSaved() {
+    savedPos.clear(); savedFurn.clear();
+    for (const p of state.positions) savedPos.set(p.eleve_id, JSON.stringify(posWire(p)));
+    for (const f of state.furniture) if (f.id > 0) savedFurn.set(f.id, JSON.stringify(furnWire(f)));
+  }
+
+  // Applique les changements serveur depuis state.rev (entités modifiées + suppressions).
+  // Une entité modifiée localement et pas encore envoyée garde sa version locale.
+  async function syncDelta() {
+    const plan = state.active_plan;
+    if (!plan) return boot();
+    if (state.preview != null) return;
+    const data = await api.getDelta(plan.id, state.rev);
+    if (state.active_plan?.id !== plan.id) return;
+    if (!data?.delta) return boot(plan.id);
+
+    const delFurn = new Set(data.deleted?.furniture || []);
+    const delPos = new Set(data.deleted?.positions || []);
+    state.furniture = state.furniture.filter(f => !delFurn.has(f.id));
+    state.positions = state.positions.filter(p => !delPos.has(p.eleve_id));
+    delFurn.forEach(id => savedFurn.delete(id));
+    delPos.forEach(id => savedPos.delete(id));
+
+    for (const raw of (data.furniture || [])) {
+      if (String(raw.type || '').toLowerCase() === 'wall') continue;
+      const i = state.furniture.findIndex(f => f.id === raw.id);
+      const cur = i >= 0 ? state.furniture[i] : null;
+      if (cur && JSON.stringify(furnWire(cur)) !== savedFurn.get(cur.id)) continue;
+      const f = fromDBFurniture(raw, plan);
+      if (i >= 0) state.furniture[i] = f; else state.furniture.push(f);
+      savedFurn.set(f.id, JSON.stringify(furnWire(f)));
+    }
+    for (const raw of (data.positions || [])) {
+      const i = state.positions.findIndex(p => p.eleve_id === raw.eleve_id);
+      const cur = i >= 0 ? state.positions[i] : null;
+      if (cur && JSON.stringify(posWire(cur)) !== savedPos.get(cur.eleve_id)) continue;
+      const p = fromDBPosition(raw);
+      if (i >= 0) state.positions[i] = p; else state.positions.push(p);
+      savedPos.set(p.eleve_id, JSON.stringify(posWire(p)));
+    }
+    if (Array.isArray(data.walls)) state.walls = decodeWallsFromStorage(data.walls);
+    state.rev = data.rev;
+
+    pendingSelSnap = selectionSnapshot();
+    render();
+    restoreSelectionFromSnapshot(pendingSelSnap);
+    pendingSelSnap = null;
+  }
+
   async function boot(planIdToShow = null) {
     try {
       document.body.classList.add('pc_loading');
@@ -3536,38 +3745,17 @@
 
       const furniture = (Array.isArray(data.furniture) ? data.furniture : [])
         .filter(f => String(f.type || '').toLowerCase() !== 'wall')
-        .map(f => {
-          const rot = round1(norm360(parseFloat(f.rotation ?? f.rotAbs ?? 0)));
-
-
-          let color = (f.color != null ? f.color : null);
-          if (color == null && active_plan && f.id > 0) {
-            color = lsGetColor(active_plan.id, f.id) || prevColorById.get(f.id) || null;
-          }
-          const prevTmp = f.client_uid ? prevTmpByUid.get(f.client_uid) : null;
-          if (color == null && prevTmp?.color) color = prevTmp.color;
-
-          const t = (f.type || 'autre').toLowerCase().replace(/\s+/g, '_');
-          if (color == null) color = FURN_COLORS[t] || FURN_DEF_COLORS[t] || null;
-          if (active_plan && f.id > 0 && color) lsSetColor(active_plan.id, f.id, color);
-
-          return {
-            ...f,
-            x: (+f.x || 0) / PLAN_SUBDIV,
-            y: (+f.y || 0) / PLAN_SUBDIV,
-            w: (+f.w || 1) / PLAN_SUBDIV,
-            h: (+f.h || 1) / PLAN_SUBDIV,
-            rotation: rot,
-            rotAbs: rot,
-            color,
-            radius: !!f.radius
-          };
-        });
+        .map(f => fromDBFurniture(f, active_plan, prevTmpByUid, prevColorById));
 
       const walls = decodeWallsFromStorage(apiWallsEnc);
 
-      state = { ...state, plans, active_plan, eleves, positions, furniture, seats, walls };
+      state = { ...state, plans, active_plan, eleves, positions, furniture, seats, walls,
+                rev: Number(active_plan?.revision) || 0, preview: null };
+      document.body.classList.remove('pc_preview');
+      if ($hist) $hist.value = '';
+      if ($histRestore) $histRestore.hidden = true;
       sentNewFurniture.clear();
+      rememberSaved();
 
       render();
       refreshToolbarActionsEnabled();
@@ -3606,6 +3794,39 @@
     return (Number.isFinite(a) && a > 0) ? a : null;
   }
 
+  // Historique : liste des révisions, aperçu (lecture seule) et restauration
+  async function loadHistoryOptions() {
+    if (!$hist || !state.active_plan) return;
+    const data = await api.history(state.active_plan.id);
+    const keep = $hist.value;
+    $hist.innerHTML = '<option value="">Historique…</option>';
+    for (const r of (data?.revisions || [])) {
+      const o = document.createElement('option');
+      o.value = String(r.rev);
+      const when = r.created_at ? new Date(r.created_at).toLocaleString('fr-FR') : '';
+      o.textContent = `Version ${r.rev}${when ? ' – ' + when : ''}`;
+      $hist.appendChild(o);
+    }
+    $hist.value = keep;
+  }
+
+  async function previewRevision(rev) {
+    const plan = state.active_plan;
+    if (!plan) return;
+    const data = await api.historyAt(plan.id, rev);
+    if (!data?.ok || state.active_plan?.id !== plan.id) return;
+    state.preview = rev;
+    state.positions = (data.positions || []).map(fromDBPosition);
+    state.furniture = (data.furniture || [])
+      .filter(f => String(f.type || '').toLowerCase() !== 'wall')
+      .map(f => fromDBFurniture(f, plan));
+    state.walls = decodeWallsFromStorage(data.walls || []);
+    document.body.classList.add('pc_preview');
+    if ($histRestore) $histRestore.hidden = false;
+    clearSelection();
+    render();
+  }
+
   // [11] ---------------------------------------------------------------------
   // Toolbar (actions de plan) & Listeners globaux
   // -------------------------------------------------------------------------
@@ -3624,6 +3845,20 @@
     if (r.plan_id) { $sel.value = String(r.plan_id); $sel.dispatchEvent(new Event('change')); }
   });
 
+  $hist?.addEventListener('focus', () => { loadHistoryOptions().catch(console.error); });
+  $hist?.addEventListener('change', async () => {
+    const rev = parseInt($hist.value, 10);
+    if (!Number.isFinite(rev)) { if (state.active_plan) await boot(state.active_plan.id); return; }
+    await previewRevision(rev);
+  });
+  $histRestore?.addEventListener('click', async () => {
+    if (!state.active_plan || state.preview == null) return;
+    if (!confirm(`Revenir à la version ${state.preview} ?\nL'état actuel reste disponible dans l'historique.`)) return;
+    const r = await api.restoreRevision(state.active_plan.id, state.preview);
+    if (!r?.ok) { alert("Restauration impossible."); return; }
+    await boot(state.active_plan.id);
+  });
+
   $dup?.addEventListener('click', async () => { if (!state.active_plan) return; await api.duplicate(state.active_plan.id); await boot(); });
   $act?.addEventListener('click', async () => { if (!state.active_plan) return; await api.activate(state.active_plan.id); await boot(); });
   $pdf?.addEventListener('click', () => { if (!state.active_plan) return; window.open(`${API_BASE}/plans/${state.active_plan.id}/export/pdf`, '_blank'); });
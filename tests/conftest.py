@@ -0,0 +1,5 @@
+# tests/conftest.py — racine du dépôt importable (exports/, app_legacy, app/)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,12 @@
+# tests/seating_modules.py — modules purs de app/seating chargés sans app/__init__ (Flask)
+import importlib.util
+import os
+
+_SEATING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "seating")
+
+
+def load(name: str):
+    spec = importlib.util.spec_from_file_location(f"seating_{name}", os.path.join(_SEATING, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
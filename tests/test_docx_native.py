@@ -0,0 +1,74 @@
+# tests/test_docx_native.py — convertisseur HTML -> DOCX en process (exports/docx_native.py)
+import pytest
+
+docx = pytest.importorskip("docx")
+
+from exports.docx_native import html_to_docx, UnsupportedHTML, MAX_TABLE_COLS
+
+
+def convert(tmp_path, html):
+    out = tmp_path / "out.docx"
+    html_to_docx(html, str(out))
+    return docx.Document(str(out))
+
+
+def texts(doc):
+    return [p.text for p in doc.paragraphs if p.text]
+
+
+def test_nested_lists(tmp_path):
+    doc = convert(tmp_path, "<ul><li>a<ul><li>b</li></ul></li><li>c</li></ul><ol><li>un</li><li>deux</li></ol>")
+    paras = [p for p in doc.paragraphs if p.text]
+    assert [p.text.split("\t")[-1] for p in paras] == ["a", "b", "c", "un", "deux"]
+    # l'élément imbriqué est indenté sous son parent
+    nested = paras[1]
+    assert nested.paragraph_format.left_indent and nested.paragraph_format.left_indent > 0
+    assert paras[0].paragraph_format.left_indent in (None, 0) or \
+        paras[0].paragraph_format.left_indent < nested.paragraph_format.left_indent
+
+
+def test_li_with_paragraph_is_a_single_item(tmp_path):
+    doc = convert(tmp_path, "<ul><li><p>point</p></li><li>suite</li></ul>")
+    paras = [p for p in doc.paragraphs if p.text.strip()]
+    assert [p.text.split("\t")[-1] for p in paras] == ["point", "suite"]
+    # pas de puce orpheline (paragraphe de liste vide) avant « point »
+    assert all(p.text.strip() for p in doc.paragraphs if p.style.name.startswith("List"))
+
+
+def test_colspan_merges_cells(tmp_path):
+    doc = convert(tmp_path, "<table><tr><th>A</th><th>B</th><th>C</th></tr>"
+                            "<tr><td colspan=\"2\">large</td><td>z</td></tr></table>")
+    table = doc.tables[0]
+    assert len(table.columns) == 3
+    row = table.rows[1].cells
+    assert row[0]._tc is row[1]._tc  # cellules fusionnées
+    assert row[0].text == "large" and row[2].text == "z"
+    assert table.rows[0].cells[0].paragraphs[0].runs[0].bold  # <th> en gras
+
+
+def test_pre_keeps_whitespace_and_lines(tmp_path):
+    doc = convert(tmp_path, "<pre>x  = 1\n  y</pre>")
+    p = next(p for p in doc.paragraphs if p.text)
+    assert p.text == "x  = 1\n  y"
+    assert any(r.font.name for r in p.runs if r.text.strip())  # police à chasse fixe
+
+
+def test_nbsp_is_preserved(tmp_path):
+    doc = convert(tmp_path, "<p>a&nbsp;&nbsp;b</p>")
+    assert texts(doc) == ["a  b"]
+
+
+@pytest.mark.parametrize("html", [
+    "<p><img src=\"x.png\"></p>",
+    "<table><tr><td rowspan=\"2\">x</td></tr></table>",
+    "<table><tr><td><table><tr><td>x</td></tr></table></td></tr></table>",
+    "<td>hors table</td>",
+    f"<table><tr><td colspan=\"{MAX_TABLE_COLS + 1}\">x</td></tr></table>",
+    "<table><tr><td colspan=\"100000\">x</td></tr></table>",
+    "<table><tr>" + "<td>x</td>" * (MAX_TABLE_COLS + 1) + "</tr></table>",
+])
+def test_unsupported_html_is_rejected(tmp_path, html):
+    out = tmp_path / "out.docx"
+    with pytest.raises(UnsupportedHTML):
+        html_to_docx(html, str(out))
+    assert not out.exists()  # rien n'est écrit : l'appelant bascule sur pandoc
@@ -0,0 +1,172 @@
+# tests/test_rapport_revisions.py — autosave différentiel des rapports (app_legacy.py)
+import datetime
+
+import pytest
+
+for _mod in ("flask", "psycopg2", "docx", "reportlab"):
+    pytest.importorskip(_mod)
+
+import app_legacy
+from app_legacy import (_text_splice, _apply_text_ops, _record_rapport_revision, _rapport_text_at,
+                        RAPPORT_SNAPSHOT_EVERY)
+
+
+class RevisionsCursor:
+    """Table rapport_revisions en mémoire (INSERT ... ON CONFLICT / SELECT de _rapport_text_at)."""
+
+    def __init__(self):
+        self.rows = {}  # (rapport_id, rev) -> (kind, data)
+        self._result = []
+
+    def execute(self, sql, params):
+        if sql.lstrip().startswith("INSERT"):
+            rapport_id, rev, kind, data, _size = params
+            self.rows[(rapport_id, rev)] = (kind, bytes(data.adapted))
+            return
+        rapport_id, rev = params[0], params[1]
+        mine = sorted((r, k, d) for (rid, r), (k, d) in self.rows.items() if rid == rapport_id and r <= rev)
+        snaps = [r for r, k, _d in mine if k == "snapshot"]
+        self._result = [row for row in mine if snaps and row[0] >= max(snaps)]
+
+    def fetchall(self):
+        return self._result
+
+
+def _edits(count):
+    """Suite de textes successifs : insertions, suppressions, remplacements."""
+    texts, text = [""], ""
+    for i in range(count):
+        if i % 3 == 0:
+            text = text + f"<p>ligne {i}</p>"
+        elif i % 3 == 1:
+            text = text.replace("ligne", "Ligne", 1)
+        else:
+            mid = len(text) // 2
+            text = text[:mid] + f"[{i}]" + text[mid + 2:]
+        texts.append(text)
+    return texts
+
+
+def test_splice_then_apply_round_trip():
+    for old, new in [("", "abc"), ("abc", ""), ("abcdef", "abXYef"), ("aaa", "aaaa"), ("abc", "abc")]:
+        op = _text_splice(old, new)
+        assert _apply_text_ops(old, [op] if op else []) == new
+    assert _text_splice("abc", "abc") is None
+    assert _text_splice("abcdef", "abXYef") == {"at": 2, "del": 2, "ins": "XY"}
+
+
+def test_text_at_across_snapshot_boundary():
+    cur = RevisionsCursor()
+    texts = _edits(2 * RAPPORT_SNAPSHOT_EVERY + 3)
+    for rev in range(1, len(texts)):
+        op = _text_splice(texts[rev - 1], texts[rev])
+        _record_rapport_revision(cur, 7, rev, texts[rev], [op] if op else [])
+
+    kinds = {rev: kind for (_rid, rev), (kind, _d) in cur.rows.items()}
+    assert kinds[1] == kinds[RAPPORT_SNAPSHOT_EVERY + 1] == "snapshot"
+    assert kinds[RAPPORT_SNAPSHOT_EVERY] == kinds[RAPPORT_SNAPSHOT_EVERY + 2] == "delta"
+    for rev in range(1, len(texts)):
+        assert _rapport_text_at(cur, 7, rev) == texts[rev], rev
+    assert _rapport_text_at(cur, 7, len(texts)) is None  # révision inconnue
+    assert _rapport_text_at(cur, 8, 1) is None
+
+
+def test_non_bmp_characters_count_as_one_code_point():
+    # l'éditeur compte en points de code ([...str]), pas en unités UTF-16
+    old, new = "a😀b", "a😀😀b🎉"
+    op = _text_splice(old, new)
+    assert op == {"at": 2, "del": 1, "ins": "😀b🎉"}
+    assert _apply_text_ops(old, [op]) == new
+    # splice calculé côté JS : remplacement juste après l'émoji (position 2 en points de code)
+    assert _apply_text_ops("a😀b", [{"at": 2, "del": 1, "ins": "c"}]) == "a😀c"
+    assert _apply_text_ops("😀😀", [{"at": 1, "del": 1, "ins": ""}]) == "😀"
+    with pytest.raises(ValueError):
+        _apply_text_ops("😀", [{"at": 1, "del": 1, "ins": ""}])  # 2 unités UTF-16, mais 1 point de code
+
+
+@pytest.mark.parametrize("ops", [
+    "pas une liste",
+    [{"del": 1}],
+    [{"at": -1, "del": 0, "ins": "x"}],
+    [{"at": 0, "del": 4, "ins": ""}],
+    [{"at": 0, "del": 0, "ins": 3}],
+])
+def test_apply_rejects_malformed_ops(ops):
+    with pytest.raises(ValueError):
+        _apply_text_ops("abc", ops)
+
+
+# ----- route PATCH /api/rapports/<id> -----
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._one = None
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if "FOR UPDATE" in sql:
+            self._one = (self.conn.text, self.conn.rev, "Titre")
+        elif sql.startswith("UPDATE rapports"):
+            now = datetime.datetime(2026, 1, 5, 10, 0)
+            self._one = (now, now)
+
+    def fetchone(self):
+        return self._one
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, text, rev):
+        self.text, self.rev = text, rev
+        self.executed, self.committed, self.rolled_back = [], False, False
+
+    def cursor(self, *a, **kw):
+        return _Cursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def patch_rapport(monkeypatch):
+    monkeypatch.setattr(app_legacy, "_record_rapport_revision", lambda *a: None)
+    monkeypatch.setattr(app_legacy, "_rapport_ts_config", lambda cur: "french")
+    client = app_legacy.app.test_client()
+
+    def run(text, rev, patch):
+        conn = _Conn(text, rev)
+        monkeypatch.setattr(app_legacy, "get_db_connection", lambda: conn)
+        resp = client.patch("/api/rapports/1", json={"contenu_patch": patch})
+        return resp, conn
+    return run
+
+
+def test_patch_stale_base_rev_is_409(patch_rapport):
+    resp, conn = patch_rapport("<p>abc</p>", 5, {"base_rev": 4, "ops": [], "length": 10})
+    assert resp.status_code == 409
+    body = resp.get_json()
+    assert body["conflict"] and body["rev"] == 5 and body["contenu"] == "<p>abc</p>"
+    assert conn.rolled_back and not conn.committed
+
+
+def test_patch_length_mismatch_is_409(patch_rapport):
+    ops = [{"at": 4, "del": 0, "ins": "😀"}]
+    resp, conn = patch_rapport("<p>abc</p>", 5, {"base_rev": 5, "ops": ops, "length": 12})  # 12 = UTF-16
+    assert resp.status_code == 409
+    assert not any(sql.startswith("UPDATE rapports") for sql in conn.executed)
+
+
+def test_patch_applies_ops_in_code_points(patch_rapport):
+    ops = [{"at": 4, "del": 0, "ins": "😀"}]
+    resp, conn = patch_rapport("<p>abc</p>", 5, {"base_rev": 5, "ops": ops, "length": 11})
+    assert resp.status_code == 200
+    assert resp.get_json()["rev"] == 6
+    assert conn.committed
@@ -0,0 +1,72 @@
+# tests/test_seating_walls.py — normalisation des murs (app/seating/walls.py)
+import pytest
+
+from seating_modules import load
+
+walls = load("walls")
+normalize_walls = walls.normalize_walls
+
+
+def pts(*coords):
+    return [{"x": x, "y": y} for x, y in coords]
+
+
+def test_duplicates_and_collinear_points_are_removed():
+    out, stats = normalize_walls([{"id": 1, "points": pts((0, 0), (0, 0), (32, 0), (64, 0), (64, 32))}])
+    assert out == [{"id": "1", "points": pts((0, 0), (64, 0), (64, 32))}]
+    assert stats["removed"]["duplicates"] == 1
+    assert stats["removed"]["collinear"] == 1
+    assert stats["points_in"] == 5 and stats["points_out"] == 3 and stats["points_removed"] == 2
+
+
+def test_u_turn_is_not_merged():
+    # a-b-c alignés mais c revient en arrière : le point b est conservé
+    out, _ = normalize_walls([{"points": pts((0, 0), (64, 0), (32, 0))}])
+    assert out[0]["points"] == pts((0, 0), (64, 0), (32, 0))
+
+
+def test_coordinates_snap_to_grid():
+    out, _ = normalize_walls([{"points": pts((0.4, 0.6), (63.5, 10.2))}])
+    assert out[0]["points"] == pts((0, 1), (64, 10))
+
+
+def test_simplification_stays_within_tolerance():
+    jitter = [(x, (x // 8) % 2 * 2) for x in range(0, 257, 8)]  # dents de 2 < WALL_TOLERANCE
+    out, stats = normalize_walls([{"points": pts(*jitter)}])
+    assert out[0]["points"] == pts((0, 0), (256, 0))
+    assert stats["removed"]["simplified"] > 0
+    # au-delà de la tolérance, le coin est conservé
+    out, _ = normalize_walls([{"points": pts((0, 0), (128, 20), (256, 0))}])
+    assert len(out[0]["points"]) == 3
+
+
+def test_degenerate_and_duplicate_walls_are_dropped():
+    out, stats = normalize_walls([
+        {"id": "a", "points": pts((0, 0), (64, 0))},
+        {"id": "b", "points": pts((64, 0), (0, 0))},   # même mur, sens inverse
+        {"id": "c", "points": pts((5, 5), (5, 5))},    # un seul point distinct
+        {"id": "d", "points": pts((0, 0), (64, 0))},   # doublon exact
+    ])
+    assert [w["id"] for w in out] == ["a"]
+    assert stats["dropped_walls"] == 3 and stats["walls_in"] == 4 and stats["walls_out"] == 1
+
+
+def test_extra_wall_fields_are_kept():
+    out, _ = normalize_walls([{"id": 3, "kind": "window", "points": pts((0, 0), (32, 0))}])
+    assert out[0]["kind"] == "window" and out[0]["id"] == "3"
+
+
+@pytest.mark.parametrize("payload", [
+    {"points": []},
+    [{"id": 1}],
+    [{"points": "0,0"}],
+    [{"points": [[0, 0], [1, 1]]}],
+    [{"points": [{"x": "a", "y": 0}]}],
+    [{"points": [{"x": float("nan"), "y": 0}]}],
+    [{"points": [{"x": 0}]}],
+    [{"points": pts((0, 0), (1, 1))}] * (walls.MAX_WALLS + 1),
+    [{"points": pts(*[(i, 0) for i in range(walls.MAX_POINTS + 1)])}],
+])
+def test_invalid_payloads_raise(payload):
+    with pytest.raises(ValueError):
+        normalize_walls(payload)